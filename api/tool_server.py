@@ -2,28 +2,46 @@ import os
 import sys
 import uuid
 import json
-from fastapi import FastAPI, HTTPException, BackgroundTasks, Security, Depends
-from fastapi.security import APIKeyHeader
+import time
+import asyncio
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Security, Depends, Response
+from fastapi.security import APIKeyHeader, HTTPBearer, HTTPAuthorizationCredentials
 from starlette.status import HTTP_403_FORBIDDEN
 from pydantic import BaseModel, Field
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Union
 from contextlib import asynccontextmanager
 
 # Path for core modules
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from core.db import insert_l0_record, get_db_connection
+from core.db import insert_l0_record, insert_l0_records, db_connection, pool_stats, close_pool, event_log_status
 from core.models import MemoryRecord, Provenance
 from core.context_compiler import ContextCompiler
-from utils.secret_utility import get_secret
+from core.async_db import insert_l0_record_async, async_pool_stats
+from core.vector_index import index_status
+from core.hot_symbols import L1CompactionWorker, COMPACT_DELTA_THRESHOLD
+from core.dream_scheduler import DreamScheduler, DREAM_SYNC_TIMEOUT
+from core import metrics
+from utils.secret_utility import preload_secrets, verify_secret
 from scripts.dream_l3 import consolidate_l3
-from scripts.dream_l2 import dream_l2_summary
+from scripts.dream_l2 import build_l2_pyramid
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Startup logic
+    # Startup logic: one batched keystore call instead of a shell per request
+    metrics.configure_logging()
+    preload_secrets()
+    if hasattr(compiler.vs, "warm_start"):
+        # In-memory vector scopes from their snapshots before the first request
+        await asyncio.to_thread(compiler.vs.warm_start)
+    l1_compactor.start()
+    dream_scheduler.start()
     yield
     # Shutdown logic
+    dream_scheduler.stop(timeout=30)
+    l1_compactor.stop()
     compiler.close()
+    await compiler.aclose()
+    close_pool()
 
 app = FastAPI(title="Agent Memory Vault Tool Server", lifespan=lifespan)
 
@@ -31,14 +49,18 @@ app = FastAPI(title="Agent Memory Vault Tool Server", lifespan=lifespan)
 api_key_header = APIKeyHeader(name="X-Vault-API-Key", auto_error=False)
 
 def get_api_key(api_key: str = Security(api_key_header)):
-    expected_key = get_secret("VAULT_API_KEY")
-    if not expected_key:
-        expected_key = "dev-key-123" # Fallback if not injected yet
-    
-    if api_key == expected_key:
+    # Constant-time compare against the cached key; "dev-key-123" is the fallback if not injected yet
+    if verify_secret("VAULT_API_KEY", api_key, fallback="dev-key-123"):
         return api_key
     raise HTTPException(status_code=HTTP_403_FORBIDDEN, detail="Could not validate API key")
 
+bearer_header = HTTPBearer(auto_error=False)
+
+def get_scrape_key(api_key: str = Security(api_key_header),
+                   bearer: HTTPAuthorizationCredentials = Security(bearer_header)):
+    # Prometheus sends the key as `Authorization: Bearer` natively (scrape_config `authorization`)
+    return get_api_key(api_key or (bearer.credentials if bearer else None))
+
 # --- Models for Request/Response ---
 class IngestRequest(BaseModel):
     scope_id: str
@@ -48,10 +70,20 @@ class IngestRequest(BaseModel):
     version: str = "1.0"
     confidence: float = 1.0
 
+class IngestBatchRequest(BaseModel):
+    records: List[IngestRequest] = Field(..., min_length=1, max_length=5000)
+
+class L3FilterRequest(BaseModel):
+    path: Optional[str] = None  # prefix, e.g. "src/api/"
+    artifact_type: Optional[Union[str, List[str]]] = None
+    branch: Optional[Union[str, List[str]]] = None
+    source: Optional[Union[str, List[str]]] = None
+
 class QueryRequest(BaseModel):
     query: str
     scope_ids: List[str]
     token_budget: Optional[int] = 4000
+    filters: Optional[L3FilterRequest] = None  # restricts L3 evidence only
 
 class HotSymbolUpdate(BaseModel):
     scope_id: str
@@ -70,18 +102,43 @@ class WorkspaceCreate(BaseModel):
 class DreamTrigger(BaseModel):
     sync: bool = False
 
-# Global Context Compiler instance
-# In production, this would be pooled or handled per request.
+# Global Context Compiler instance: stateless, so one per worker process serves every
+# request; per-request settings are passed as CompileOptions.
 compiler = ContextCompiler()
+# One coalescing scheduler per process: bursts of ingests become a single dream run.
+dream_scheduler = DreamScheduler([consolidate_l3, build_l2_pyramid])
+l1_compactor = L1CompactionWorker(compiler.hot_symbols, interval=float(os.environ.get("VAULT_L1_COMPACT_INTERVAL", "30")))
 
-@app.post("/ingest", tags=["Write"], dependencies=[Depends(get_api_key)])
-def ingest_memory(req: IngestRequest, background_tasks: BackgroundTasks):
-    """
-    Ingests official agent observations into the vault.
-    Spawns a background 'dream cycle' to promote it to the semantic index.
-    """
+# --- Metrics read at scrape time ---
+# event_log_status() is a few index scans; share one result between the backlog gauges
+# and across scrapers for this many seconds.
+EVENT_LOG_METRICS_TTL = float(os.environ.get("VAULT_EVENT_LOG_METRICS_TTL", "5"))
+_event_log_snapshot = {"at": 0.0, "status": None}
+
+def _event_log_metrics():
+    now = time.monotonic()
+    if _event_log_snapshot["status"] is None or now - _event_log_snapshot["at"] > EVENT_LOG_METRICS_TTL:
+        _event_log_snapshot.update(at=now, status=event_log_status())
+    return _event_log_snapshot["status"]
+
+def _pool_connections():
+    values = {}
+    for pool, stats in (("sync", pool_stats()), ("async", async_pool_stats())):
+        values[(pool, "in_use")] = stats["in_use"]
+        values[(pool, "idle")] = stats["idle"]
+    return values
+
+metrics.DB_POOL_CONNECTIONS.set_function(_pool_connections)
+metrics.EVENT_BACKLOG.set_function(lambda: _event_log_metrics()["backlog"])
+metrics.EVENT_OLDEST_PENDING_AGE.set_function(lambda: _event_log_metrics()["oldest_pending_age_seconds"])
+metrics.DREAM_PENDING_TRIGGERS.set_function(lambda: dream_scheduler.snapshot()["pending_triggers"])
+metrics.CONTEXT_CACHE.set_function(lambda: {
+    (result,): n for result, n in compiler.cache.snapshot().items() if result in ("hits", "redis_hits", "misses", "bypassed")
+})
+
+def _record_from_request(req: IngestRequest) -> MemoryRecord:
     prov = Provenance(tool=req.tool_name, version=req.version, source="llm_agent")
-    record = MemoryRecord(
+    return MemoryRecord(
         record_id=str(uuid.uuid4()),
         scope_id=req.scope_id,
         record_type=req.record_type,
@@ -89,37 +146,70 @@ def ingest_memory(req: IngestRequest, background_tasks: BackgroundTasks):
         provenance=prov,
         confidence=req.confidence
     )
+
+@app.post("/ingest", tags=["Write"], dependencies=[Depends(get_api_key)])
+async def ingest_memory(req: IngestRequest):
+    """
+    Ingests official agent observations into the vault.
+    Schedules a background 'dream cycle' to promote it to the semantic index.
+    """
+    record = _record_from_request(req)
     
-    success = insert_l0_record(record)
+    success = await insert_l0_record_async(record)
     if not success:
         raise HTTPException(status_code=500, detail="Failed to ingest record into L0")
     
-    # Trigger semantic dreaming in background
-    background_tasks.add_task(consolidate_l3)
-    background_tasks.add_task(dream_l2_summary)
+    # Trigger semantic dreaming in background (coalesced with other recent ingests)
+    dream_scheduler.trigger()
     
     return {"status": "success", "record_id": record.record_id, "dream_triggered": True}
 
+@app.post("/ingest/batch", tags=["Write"], dependencies=[Depends(get_api_key)])
+def ingest_memory_batch(req: IngestBatchRequest):
+    """
+    Ingests many observations in one transaction (e.g. a replayed session).
+    The whole batch is rejected if any record fails; one dream cycle covers the batch.
+    """
+    records = [_record_from_request(r) for r in req.records]
+    
+    if insert_l0_records(records) != len(records):
+        raise HTTPException(status_code=500, detail="Failed to ingest batch into L0")
+    
+    dream_scheduler.trigger()
+    
+    return {
+        "status": "success",
+        "ingested": len(records),
+        "record_ids": [r.record_id for r in records],
+        "dream_triggered": True
+    }
+
 @app.post("/context", tags=["Read"], dependencies=[Depends(get_api_key)])
-def get_perfect_context(req: QueryRequest):
+async def get_perfect_context(req: QueryRequest):
     """
     Returns a grounded, multiscale context block (L1+L2+L3).
     Use this to 'prime' the next agent iteration with authoritative truth.
     """
-    compiler.token_budget = req.token_budget
-    context = compiler.compile_multiscale_context(req.query, req.scope_ids)
-    return {"context_block": context}
+    l3_filter = req.filters.model_dump(exclude_none=True) if req.filters else None
+    compiled = await compiler.compile_async(req.query, req.scope_ids, token_budget=req.token_budget, l3_filter=l3_filter)
+    return {
+        "context_block": compiled.text,
+        "tokens_used": compiled.tokens_used,
+        "token_budget": compiled.token_budget,
+        "dropped_blocks": compiled.dropped_blocks,
+    }
 
 @app.post("/hot_symbols", tags=["State"], dependencies=[Depends(get_api_key)])
-def update_hot_symbols(req: HotSymbolUpdate):
+def update_hot_symbols(req: HotSymbolUpdate, background_tasks: BackgroundTasks):
     """
     Updates the L1 (Hot) ephemeral state in Redis.
     This informs the immediate session focus in future context windows.
     """
     try:
         # We only update the delta overlay here. Base snapshot is for compactions.
-        delta_key = f"hot_symbols:{req.scope_id}:delta"
-        compiler.redis.hset(delta_key, mapping=req.symbols)
+        delta_size = compiler.hot_symbols.write_delta(req.scope_id, req.symbols)
+        if delta_size >= COMPACT_DELTA_THRESHOLD:
+            background_tasks.add_task(compiler.hot_symbols.compact, req.scope_id)
         return {"status": "updated", "symbols_set": list(req.symbols.keys()), "scope_id": req.scope_id}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -150,33 +240,84 @@ def create_workspace(req: WorkspaceCreate):
     # Fast runtime optimization: perform minimal logic and immediate DB commit.
     if req.scope_type not in ["private", "workspace", "public"]:
         raise HTTPException(status_code=400, detail="Invalid scope type")
-    conn = get_db_connection()
     try:
-        with conn.cursor() as cur:
+        with db_connection() as conn, conn.cursor() as cur:
             cur.execute(
                 "INSERT INTO scopes (scope_type, owner_id) VALUES (%s, %s) RETURNING scope_id",
                 (req.scope_type, req.owner_id)
             )
             scope_id = cur.fetchone()[0]
+            # A new scope has nothing to fold into L2 yet: start its watermark at the log head
+            cur.execute(
+                "INSERT INTO l2_watermarks (scope_id, event_id) SELECT %s, COALESCE(max(event_id), 0) FROM event_log",
+                (scope_id,)
+            )
             conn.commit()
             return {"status": "success", "scope_id": str(scope_id)}
     except Exception as e:
-        conn.rollback()
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        conn.close()
+
+@app.get("/admin/pool", tags=["Admin"], dependencies=[Depends(get_api_key)])
+def get_pool_stats():
+    """Admin function: Postgres connection pool occupancy and counters."""
+    return dict(pool_stats(), async_pool=async_pool_stats())
+
+@app.get("/metrics", tags=["Admin"], dependencies=[Depends(get_scrape_key)])
+def get_metrics():
+    """Prometheus text exposition: stage latencies, ingest/dream/cache counters, pool and backlog gauges."""
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/admin/indexes", tags=["Admin"], dependencies=[Depends(get_api_key)])
+def get_index_status():
+    """Admin function: ANN index validity/size and any concurrent builds in progress."""
+    try:
+        return index_status()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/admin/cache", tags=["Admin"], dependencies=[Depends(get_api_key)])
+def get_cache_stats():
+    """Admin function: context-block cache hit/miss/eviction counters."""
+    return compiler.cache.snapshot()
+
+@app.get("/admin/l1/status", tags=["Admin"], dependencies=[Depends(get_api_key)])
+def get_l1_status(scope_id: Optional[str] = None):
+    """Admin function: L1 compaction worker counters, or delta size/lag for one scope."""
+    try:
+        if scope_id:
+            return compiler.hot_symbols.compaction_status(scope_id)
+        return l1_compactor.stats
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/dream", tags=["Workers"], dependencies=[Depends(get_api_key)])
-def trigger_dream(req: DreamTrigger, background_tasks: BackgroundTasks):
-    """Trigger the dream consolidation pipeline (sync or background)."""
+def trigger_dream(req: DreamTrigger):
+    """
+    Trigger the dream consolidation pipeline through the scheduler.
+    sync=True skips the debounce window and waits for the run to finish.
+    """
     if req.sync:
-        consolidate_l3()
-        dream_l2_summary()
+        if not dream_scheduler.run_now(timeout=DREAM_SYNC_TIMEOUT):
+            raise HTTPException(status_code=504, detail="Dream run did not finish in time")
         return {"status": "success", "sync": True}
     else:
-        background_tasks.add_task(consolidate_l3)
-        background_tasks.add_task(dream_l2_summary)
-        return {"status": "success", "sync": False}
+        dream_scheduler.trigger()
+        return {"status": "success", "sync": False, "pending_triggers": dream_scheduler.snapshot()["pending_triggers"]}
+
+@app.get("/admin/dream/status", tags=["Admin"], dependencies=[Depends(get_api_key)])
+def get_dream_status(window_seconds: int = 300):
+    """Admin function: dream backlog size, oldest pending event age and processing rate."""
+    try:
+        status = event_log_status(window_seconds)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    status["scheduler"] = dream_scheduler.snapshot()
+    return status
+
+@app.get("/admin/dream/scheduler", tags=["Admin"], dependencies=[Depends(get_api_key)])
+def get_dream_scheduler_stats():
+    """Admin function: dream queue depth, coalescing and last-run latency."""
+    return dream_scheduler.snapshot()
 
 @app.get("/health")
 async def health_check():
@@ -0,0 +1,91 @@
+import os
+import sys
+import time
+import uuid
+import argparse
+import numpy as np
+from psycopg2.extras import execute_values
+
+# Path for core modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from core.db import db_connection, close_pool
+from core.vector_store import VectorStore, MockEncoder
+from core.vector_index import RECALL_PROFILES, ensure_indexes
+
+def load_corpus(scope_id, n, encoder, batch_size=1000):
+    """Writes n MockEncoder snippets into l3_snippets under a throwaway scope."""
+    matrix = np.empty((n, encoder.dimension), dtype=np.float32)
+    texts = []
+    with db_connection() as conn, conn.cursor() as cur:
+        cur.execute("INSERT INTO scopes (scope_id, scope_type, owner_id) VALUES (%s, 'workspace', 'bench')", (scope_id,))
+        for start in range(0, n, batch_size):
+            rows = []
+            for i in range(start, min(start + batch_size, n)):
+                text = f"bench snippet {i} for topic {i % 97}"
+                vec = encoder.encode(text)
+                matrix[i] = vec
+                texts.append(text)
+                rows.append((scope_id, text, "[" + ",".join(map(str, vec.tolist())) + "]"))
+            execute_values(cur, "INSERT INTO l3_snippets (scope_id, text, embedding) VALUES %s", rows,
+                           template="(%s, %s, %s::vector)")
+        conn.commit()
+    return matrix, texts
+
+def drop_corpus(scope_id):
+    with db_connection() as conn, conn.cursor() as cur:
+        cur.execute("DELETE FROM l3_snippets WHERE scope_id = %s", (scope_id,))
+        cur.execute("DELETE FROM scopes WHERE scope_id = %s", (scope_id,))
+        conn.commit()
+
+def make_queries(matrix, n_queries, noise, rng):
+    """Perturbed copies of corpus vectors, so each query has a meaningful neighbourhood."""
+    picks = rng.choice(len(matrix), size=n_queries, replace=False)
+    queries = matrix[picks] + noise * rng.standard_normal((n_queries, matrix.shape[1])).astype(np.float32)
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+def run(n=10000, n_queries=100, k=10, noise=0.02, profiles=None):
+    """Recall@k and latency per recall profile of search_l3 against exact brute force."""
+    rng = np.random.default_rng(7)
+    encoder = MockEncoder()
+    vs = VectorStore()
+    scope_id = str(uuid.uuid4())
+    results = {}
+    try:
+        print(f"Loading {n} snippets...")
+        matrix, texts = load_corpus(scope_id, n, encoder)
+        print(f"Indexes: {ensure_indexes()}")
+        queries = make_queries(matrix, n_queries, noise, rng)
+        truth = np.argsort(-(queries @ matrix.T), axis=1)[:, :k]
+
+        for profile in profiles or list(RECALL_PROFILES):
+            latencies, hits = [], 0
+            for q, expected in zip(queries, truth):
+                start = time.perf_counter()
+                matches = vs.search_l3([scope_id], q.tolist(), limit=k, recall=profile)
+                latencies.append((time.perf_counter() - start) * 1000)
+                found = {m[2] for m in matches}
+                hits += sum(texts[i] in found for i in expected)
+            lat = np.percentile(latencies, [50, 95, 99])
+            results[profile] = {
+                "recall_at_k": hits / (n_queries * k),
+                "p50_ms": float(lat[0]), "p95_ms": float(lat[1]), "p99_ms": float(lat[2]),
+            }
+            r = results[profile]
+            print(f"{profile:>9}: recall@{k}={r['recall_at_k']:.3f}  "
+                  f"p50={r['p50_ms']:.2f}ms p95={r['p95_ms']:.2f}ms p99={r['p99_ms']:.2f}ms")
+    finally:
+        drop_corpus(scope_id)
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="search_l3 recall vs latency on a MockEncoder corpus")
+    parser.add_argument("-n", type=int, default=10000, help="corpus size")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--noise", type=float, default=0.02, help="query perturbation (std per dim)")
+    parser.add_argument("--profile", action="append", help="recall profile(s) to test (default: all)")
+    args = parser.parse_args()
+    try:
+        run(args.n, args.queries, args.k, args.noise, args.profile)
+    finally:
+        close_pool()
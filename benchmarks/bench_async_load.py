@@ -0,0 +1,62 @@
+import os
+import sys
+import time
+import uuid
+import asyncio
+import argparse
+import numpy as np
+import httpx
+
+# Path for core modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+async def agent(client, endpoint, body_fn, deadline, latencies, errors):
+    """One simulated agent: back-to-back requests until the deadline."""
+    while time.monotonic() < deadline:
+        start = time.perf_counter()
+        try:
+            r = await client.post(endpoint, json=body_fn())
+            r.raise_for_status()
+            latencies.append((time.perf_counter() - start) * 1000)
+        except httpx.HTTPError:
+            errors.append(1)
+
+async def run_level(url, api_key, endpoint, body_fn, agents, seconds):
+    limits = httpx.Limits(max_connections=agents, max_keepalive_connections=agents)
+    async with httpx.AsyncClient(base_url=url, headers={"X-Vault-API-Key": api_key},
+                                 limits=limits, timeout=30) as client:
+        latencies, errors = [], []
+        deadline = time.monotonic() + seconds
+        await asyncio.gather(*(agent(client, endpoint, body_fn, deadline, latencies, errors) for _ in range(agents)))
+    p50, p95 = np.percentile(latencies, [50, 95]) if latencies else (0.0, 0.0)
+    return {"agents": agents, "requests": len(latencies), "errors": len(errors),
+            "rps": len(latencies) / seconds, "p50_ms": float(p50), "p95_ms": float(p95)}
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent-agent load test for /context and /ingest on a running server")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--api-key", default=os.environ.get("VAULT_API_KEY", "dev-key-123"))
+    parser.add_argument("--scope-id", required=True, help="existing scope to read from / write to")
+    parser.add_argument("--endpoint", choices=["context", "ingest"], default="context")
+    parser.add_argument("--agents", default="1,8,32,128,256", help="comma-separated concurrency levels")
+    parser.add_argument("--seconds", type=float, default=10.0, help="duration of each level")
+    parser.add_argument("--distinct-queries", action="store_true",
+                        help="unique query per request, so /context misses the result cache")
+    args = parser.parse_args()
+
+    if args.endpoint == "context":
+        def body():
+            query = f"load test {uuid.uuid4()}" if args.distinct_queries else "load test"
+            return {"query": query, "scope_ids": [args.scope_id], "token_budget": 6000}
+    else:
+        def body():
+            return {"scope_id": args.scope_id, "record_type": "load_test",
+                    "payload": {"msg": "bench"}, "tool_name": "bench_async_load"}
+
+    print(f"{'agents':>7} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'errors':>7}")
+    for level in [int(x) for x in args.agents.split(",")]:
+        r = asyncio.run(run_level(args.url, args.api_key, f"/{args.endpoint}", body, level, args.seconds))
+        print(f"{r['agents']:>7} {r['rps']:>9.0f} {r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} {r['errors']:>7}")
+
+if __name__ == "__main__":
+    main()
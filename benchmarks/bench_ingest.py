@@ -0,0 +1,75 @@
+import os
+import sys
+import time
+import uuid
+import argparse
+
+# Path for core modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from core.db import db_connection, insert_l0_record, insert_l0_records, close_pool
+from core.models import MemoryRecord, Provenance
+
+def make_records(scope_id, n):
+    prov = Provenance(tool="bench_ingest", version="1.0", source="benchmark")
+    return [
+        MemoryRecord(
+            record_type="observation",
+            scope_id=scope_id,
+            payload={"msg": f"Benchmark observation #{i}", "detail": "x" * 200},
+            provenance=prov,
+            path=f"src/module_{i % 20}.py",
+            start_line=i,
+            end_line=i + 10
+        )
+        for i in range(n)
+    ]
+
+def create_scope():
+    scope_id = str(uuid.uuid4())
+    with db_connection() as conn, conn.cursor() as cur:
+        cur.execute("INSERT INTO scopes (scope_id, scope_type, owner_id) VALUES (%s, 'workspace', 'bench')", (scope_id,))
+        conn.commit()
+    return scope_id
+
+def drop_scope(scope_id):
+    with db_connection() as conn, conn.cursor() as cur:
+        cur.execute("DELETE FROM event_log WHERE record_id IN (SELECT record_id FROM records_l0 WHERE scope_id = %s)", (scope_id,))
+        cur.execute("DELETE FROM records_l0 WHERE scope_id = %s", (scope_id,))
+        cur.execute("DELETE FROM scopes WHERE scope_id = %s", (scope_id,))
+        conn.commit()
+
+def bench_single(scope_id, n):
+    records = make_records(scope_id, n)
+    start = time.perf_counter()
+    for r in records:
+        insert_l0_record(r)
+    return n / (time.perf_counter() - start)
+
+def bench_batch(scope_id, n, batch_size):
+    records = make_records(scope_id, n)
+    start = time.perf_counter()
+    for i in range(0, n, batch_size):
+        insert_l0_records(records[i:i + batch_size])
+    return n / (time.perf_counter() - start)
+
+def run(n=2000, batch_size=500):
+    """Compares records/sec of the per-record path against insert_l0_records()."""
+    scope_id = create_scope()
+    try:
+        single = bench_single(scope_id, n)
+        batch = bench_batch(scope_id, n, batch_size)
+    finally:
+        drop_scope(scope_id)
+    print(f"insert_l0_record   : {single:10.1f} records/sec")
+    print(f"insert_l0_records  : {batch:10.1f} records/sec (batch={batch_size}, {batch / single:.1f}x)")
+    return {"single_records_per_sec": single, "batch_records_per_sec": batch, "batch_size": batch_size, "n": n}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="L0 ingest throughput: single vs bulk path")
+    parser.add_argument("-n", type=int, default=2000, help="records per path")
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+    try:
+        run(args.n, args.batch_size)
+    finally:
+        close_pool()
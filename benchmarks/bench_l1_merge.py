@@ -0,0 +1,66 @@
+import os
+import sys
+import time
+import uuid
+import argparse
+import numpy as np
+import redis
+
+# Path for core modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from core.hot_symbols import HotSymbolStore, base_key, delta_key, merge_symbols, TOMBSTONE
+
+def legacy_fetch(client, scope_ids):
+    """The original path: two blocking HGETALLs per scope, merged in Python."""
+    aggregated = {}
+    for scope_id in scope_ids:
+        aggregated.update(merge_symbols(client.hgetall(base_key(scope_id)), client.hgetall(delta_key(scope_id))))
+    return aggregated
+
+def seed(client, scope_ids, symbols, delta_ratio):
+    for scope_id in scope_ids:
+        client.hset(base_key(scope_id), mapping={f"sym_{i}": f"value {i}" for i in range(symbols)})
+        n_delta = max(int(symbols * delta_ratio), 1)
+        delta = {f"sym_{i}": (TOMBSTONE if i % 5 == 0 else f"changed {i}") for i in range(n_delta)}
+        client.hset(delta_key(scope_id), mapping=delta)
+
+def measure(fn, repeat):
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - start) * 1000)
+    p50, p95 = np.percentile(latencies, [50, 95])
+    return {"p50_ms": float(p50), "p95_ms": float(p95), "ops_per_sec": repeat / (sum(latencies) / 1000)}
+
+def run(scopes=3, symbols=50, delta_ratio=0.3, repeat=2000, host="localhost", port=6379):
+    """Legacy sequential HGETALLs vs pipeline vs Lua merge for one /context L1 fetch."""
+    client = redis.Redis(host=host, port=port, decode_responses=True)
+    scope_ids = [f"bench-{uuid.uuid4()}" for _ in range(scopes)]
+    seed(client, scope_ids, symbols, delta_ratio)
+    store = HotSymbolStore(client)
+    try:
+        expected = legacy_fetch(client, scope_ids)
+        assert store.fetch_merged(scope_ids) == expected
+        assert store.fetch_merged_pipelined(scope_ids) == expected
+        results = {
+            "legacy": measure(lambda: legacy_fetch(client, scope_ids), repeat),
+            "pipeline": measure(lambda: store.fetch_merged_pipelined(scope_ids), repeat),
+            "lua": measure(lambda: store.fetch_merged(scope_ids), repeat),
+        }
+    finally:
+        client.delete(*[k for s in scope_ids for k in (base_key(s), delta_key(s))])
+    for name, r in results.items():
+        print(f"{name:>9}: p50={r['p50_ms']:.3f}ms p95={r['p95_ms']:.3f}ms {r['ops_per_sec']:9.0f} ops/sec")
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="L1 hot-symbol merge: sequential vs pipeline vs Lua")
+    parser.add_argument("--scopes", type=int, default=3)
+    parser.add_argument("--symbols", type=int, default=50, help="base symbols per scope")
+    parser.add_argument("--delta-ratio", type=float, default=0.3)
+    parser.add_argument("--repeat", type=int, default=2000)
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=6379)
+    args = parser.parse_args()
+    run(args.scopes, args.symbols, args.delta_ratio, args.repeat, args.host, args.port)
@@ -0,0 +1,101 @@
+import os
+import sys
+import time
+import uuid
+import argparse
+import numpy as np
+
+# Path for core modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from core.vector_codec import vector_literal, pack_vector, parse_vector
+
+def legacy_literal(embedding):
+    """The pre-codec formatting: str() of each float64."""
+    return "[" + ",".join(map(str, embedding)) + "]"
+
+def legacy_parse(value):
+    return [float(v) for v in value[1:-1].split(",")]
+
+def timed(fn, arg, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        out = fn(arg)
+    return (time.perf_counter() - start) / repeat * 1e6, out
+
+def bench_codec(dim=1536, repeat=2000):
+    """Client-side encode/decode cost and payload size per vector (no database needed)."""
+    vec = np.random.default_rng(0).standard_normal(dim)
+    vec /= np.linalg.norm(vec)
+    as_list = vec.tolist()
+
+    results = {}
+    us, out = timed(legacy_literal, as_list, repeat)
+    results["text_legacy_encode"] = {"us": us, "bytes": len(out)}
+    us, _ = timed(legacy_parse, out, repeat)
+    results["text_legacy_parse"] = {"us": us}
+    us, out = timed(vector_literal, vec, repeat)
+    results["text_float32_encode"] = {"us": us, "bytes": len(out)}
+    us, _ = timed(parse_vector, out, repeat)
+    results["text_float32_parse"] = {"us": us}
+    us, out = timed(pack_vector, vec, repeat)
+    results["binary_encode"] = {"us": us, "bytes": len(out)}
+
+    for name, r in results.items():
+        size = f"{r['bytes']:>7} bytes" if "bytes" in r else ""
+        print(f"{name:>22}: {r['us']:9.1f} us/vector {size}")
+    return results
+
+def bench_db(n=2000, dim=1536):
+    """Snippet insert throughput (legacy text INSERT vs binary COPY) and search latency."""
+    from core.db import db_connection, close_pool
+    from core.vector_store import VectorStore
+
+    rng = np.random.default_rng(1)
+    vectors = rng.standard_normal((n, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    scope_id = str(uuid.uuid4())
+    vs = VectorStore()
+    results = {}
+    with db_connection() as conn, conn.cursor() as cur:
+        cur.execute("INSERT INTO scopes (scope_id, scope_type, owner_id) VALUES (%s, 'workspace', 'bench')", (scope_id,))
+        conn.commit()
+    try:
+        start = time.perf_counter()
+        with db_connection() as conn, conn.cursor() as cur:
+            for vec in vectors:
+                cur.execute(
+                    "INSERT INTO l3_snippets (scope_id, text, metadata, embedding) VALUES (%s, %s, %s, %s::vector)",
+                    (scope_id, "legacy", "{}", legacy_literal(vec.tolist()))
+                )
+            conn.commit()
+        results["insert_text_per_sec"] = n / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        vs.add_snippets([(None, scope_id, "binary", "{}", vec) for vec in vectors])
+        results["insert_binary_copy_per_sec"] = n / (time.perf_counter() - start)
+
+        latencies = []
+        for vec in vectors[:200]:
+            start = time.perf_counter()
+            vs.search_l3([scope_id], vec, limit=10)
+            latencies.append((time.perf_counter() - start) * 1000)
+        results["search_p50_ms"] = float(np.percentile(latencies, 50))
+        results["search_p95_ms"] = float(np.percentile(latencies, 95))
+    finally:
+        with db_connection() as conn, conn.cursor() as cur:
+            cur.execute("DELETE FROM l3_snippets WHERE scope_id = %s", (scope_id,))
+            cur.execute("DELETE FROM scopes WHERE scope_id = %s", (scope_id,))
+            conn.commit()
+        close_pool()
+    for name, value in results.items():
+        print(f"{name:>28}: {value:10.2f}")
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Vector wire encoding: legacy text vs float32 text vs binary")
+    parser.add_argument("--db", action="store_true", help="also measure insert/search against Postgres")
+    parser.add_argument("-n", type=int, default=2000, help="vectors for the --db run")
+    args = parser.parse_args()
+    bench_codec()
+    if args.db:
+        bench_db(args.n)
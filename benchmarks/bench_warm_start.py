@@ -0,0 +1,55 @@
+import os
+import sys
+import time
+import tempfile
+import argparse
+import numpy as np
+
+# Path for core modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from core.db import close_pool
+from core.vector_backends import NumpyVectorBackend, update_snapshots
+from benchmarks.suite import build_corpus, drop_corpus
+from core.encoders import MockEncoder
+
+def time_to_serving(backend, scope_ids, query, warm):
+    """Seconds from an empty backend to the first answered search over every scope."""
+    start = time.perf_counter()
+    if warm:
+        backend.warm_start()
+    backend.search_l3(scope_ids, query, limit=10)
+    return time.perf_counter() - start
+
+def run(n=100_000, tenants=4, repeat=3):
+    """Cold start from Postgres (text vectors) vs memmap snapshot + replay."""
+    encoder = MockEncoder()
+    scope_ids = build_corpus("warmstart", n, tenants, encoder)
+    query = encoder.encode("redis regression")
+    results = {}
+    try:
+        with tempfile.TemporaryDirectory() as root:
+            start = time.perf_counter()
+            update_snapshots(scope_ids, root=root)
+            results["snapshot_write_seconds"] = time.perf_counter() - start
+            cold = [time_to_serving(NumpyVectorBackend(snapshot_dir=""), scope_ids, query, warm=False) for _ in range(repeat)]
+            warm = [time_to_serving(NumpyVectorBackend(snapshot_dir=root), scope_ids, query, warm=True) for _ in range(repeat)]
+        results.update(snippets=n, tenants=tenants,
+                       cold_start_seconds=float(np.median(cold)), warm_start_seconds=float(np.median(warm)))
+    finally:
+        drop_corpus(scope_ids)
+    print(f"snapshot write      : {results['snapshot_write_seconds']:8.2f}s ({n} snippets)")
+    print(f"cold start (Postgres): {results['cold_start_seconds']:8.2f}s to first search")
+    print(f"warm start (memmap)  : {results['warm_start_seconds']:8.2f}s to first search "
+          f"({results['cold_start_seconds'] / results['warm_start_seconds']:.1f}x)")
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="In-memory vector backend: cold start vs snapshot warm start")
+    parser.add_argument("-n", type=int, default=100_000, help="snippets")
+    parser.add_argument("--tenants", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    try:
+        run(args.n, args.tenants, args.repeat)
+    finally:
+        close_pool()
@@ -0,0 +1,325 @@
+import os
+import sys
+import json
+import time
+import uuid
+import socket
+import asyncio
+import argparse
+import platform
+import subprocess
+from datetime import datetime, timezone
+import numpy as np
+import redis
+from psycopg2.extras import Json, execute_values
+
+# Path for core modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from core.db import db_connection, close_pool
+from core.vector_store import VectorStore, SNIPPET_COPY_COLUMNS
+from core.vector_codec import copy_binary
+from core.vector_index import ensure_indexes
+from core.encoders import MockEncoder
+from core.hot_symbols import HotSymbolStore, scope_key_pattern
+from core.context_cache import generation_key
+from core.context_compiler import ContextCompiler
+from core.async_db import close_async_pool
+from benchmarks.bench_ingest import create_scope, drop_scope, bench_batch
+from benchmarks.bench_l1_merge import seed as seed_l1, measure as measure_l1
+from scripts.dream_l3 import run_workers
+
+# End-to-end regression harness. For each corpus size it builds (or reuses) a
+# synthetic multi-tenant corpus of MockEncoder snippets, then measures /context
+# latency, ingest and dream throughput and the L1 merge, and writes one JSON file
+# per run so runs on different commits can be compared (--baseline).
+
+SIZES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+P95_TARGET_MS = 200.0
+OWNER_PREFIX = "bench-suite-"
+LOAD_CHUNK = 5000
+
+TOPICS = ["redis", "postgres", "pgvector", "fastapi", "encoder", "scheduler", "budget", "cache",
+          "compaction", "ingest", "dream", "tokenizer", "hnsw", "asyncpg", "metrics", "deploy"]
+
+def snippet_text(tenant, i):
+    topic = TOPICS[i % len(TOPICS)]
+    return f"tenant {tenant} note {i}: {topic} fix for module_{i % 53} after {TOPICS[(i * 7) % len(TOPICS)]} regression"
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def git_revision():
+    # The suite may be started from anywhere; the commit is the repo's, not the cwd's
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+                                cwd=REPO_ROOT).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain"], capture_output=True, text=True,
+                                    cwd=REPO_ROOT).stdout.strip())
+        return {"commit": commit, "dirty": dirty}
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+
+def percentiles(latencies_ms):
+    if not latencies_ms:
+        return {"p50_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0, "requests": 0}
+    p50, p95, p99 = np.percentile(latencies_ms, [50, 95, 99])
+    return {"p50_ms": float(p50), "p95_ms": float(p95), "p99_ms": float(p99), "requests": len(latencies_ms)}
+
+# --- Corpus ---
+
+def corpus_scopes(label):
+    with db_connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT scope_id::text FROM scopes WHERE owner_id = %s ORDER BY scope_id", (OWNER_PREFIX + label,))
+        return [row[0] for row in cur.fetchall()]
+
+def corpus_size(scope_ids):
+    with db_connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT count(*) FROM l3_snippets WHERE scope_id = ANY(%s::uuid[])", (scope_ids,))
+        return cur.fetchone()[0]
+
+def build_corpus(label, n, tenants, encoder):
+    """
+    `n` snippets spread over `tenants` scopes, each backed by an L0 record (so L3 hits
+    join real provenance) plus a few L2 digests per tenant. No event_log entries: the
+    corpus is already dreamt. Committed in chunks; about 6KB of vector per snippet.
+    """
+    scope_ids = [str(uuid.uuid4()) for _ in range(tenants)]
+    vs = VectorStore()
+    with db_connection() as conn, conn.cursor() as cur:
+        execute_values(cur, "INSERT INTO scopes (scope_id, scope_type, owner_id) VALUES %s",
+                       [(s, "workspace", OWNER_PREFIX + label) for s in scope_ids])
+        execute_values(cur, "INSERT INTO l2_digests (scope_id, lod_level, text, version) VALUES %s", [
+            (s, "session", f"Tenant {t} session digest {d}: " + ", ".join(TOPICS[d::4]), 1)
+            for t, s in enumerate(scope_ids) for d in range(4)
+        ])
+        conn.commit()
+        started = time.monotonic()
+        for start in range(0, n, LOAD_CHUNK):
+            ids = range(start, min(start + LOAD_CHUNK, n))
+            rows = []
+            for i in ids:
+                tenant = i % tenants
+                rows.append((str(uuid.uuid4()), scope_ids[tenant], snippet_text(tenant, i), i))
+            execute_values(cur, """
+                INSERT INTO records_l0 (record_id, scope_type, scope_id, record_type, source, path, payload, provenance)
+                VALUES %s
+            """, [
+                (rid, "workspace", sid, "observation", "benchmark", f"src/module_{i % 53}.py",
+                 Json({"msg": text}), Json({"tool": "bench_suite", "version": "1.0", "source": "benchmark"}))
+                for rid, sid, text, i in rows
+            ])
+            embeddings = encoder.encode_batch([text for _, _, text, _ in rows])
+            vs.add_snippets([
+                (rid, sid, text, {"path": f"src/module_{i % 53}.py", "artifact_type": "observation"}, emb)
+                for (rid, sid, text, i), emb in zip(rows, embeddings)
+            ], cur=cur)
+            conn.commit()
+            done = ids.stop
+            rate = done / max(time.monotonic() - started, 1e-9)
+            print(f"  [{label}] loaded {done}/{n} snippets ({rate:.0f}/sec)", flush=True)
+    return scope_ids
+
+def drop_corpus(scope_ids):
+    with db_connection() as conn, conn.cursor() as cur:
+        cur.execute("DELETE FROM l3_snippets WHERE scope_id = ANY(%s::uuid[])", (scope_ids,))
+        cur.execute("DELETE FROM l2_digests WHERE scope_id = ANY(%s::uuid[])", (scope_ids,))
+        cur.execute("DELETE FROM event_log WHERE record_id IN (SELECT record_id FROM records_l0 WHERE scope_id = ANY(%s::uuid[]))", (scope_ids,))
+        cur.execute("DELETE FROM records_l0 WHERE scope_id = ANY(%s::uuid[])", (scope_ids,))
+        cur.execute("DELETE FROM scopes WHERE scope_id = ANY(%s::uuid[])", (scope_ids,))
+        conn.commit()
+
+def ensure_corpus(label, n, tenants, encoder, rebuild=False):
+    """Reuses a kept corpus of the same size (see --keep); builds one otherwise."""
+    scope_ids = corpus_scopes(label)
+    if scope_ids and not rebuild and corpus_size(scope_ids) == n:
+        print(f"  [{label}] reusing corpus ({len(scope_ids)} tenants)")
+        return scope_ids, 0.0
+    if scope_ids:
+        drop_corpus(scope_ids)
+    started = time.monotonic()
+    scope_ids = build_corpus(label, n, tenants, encoder)
+    ensure_indexes()
+    return scope_ids, time.monotonic() - started
+
+# --- Measurements ---
+
+def bench_context(compiler, scope_ids, queries, concurrency, token_budget, url=None, api_key=None):
+    """
+    /context latency with `concurrency` requests in flight. Every query is distinct so
+    the result cache never answers. In-process (compile_async) unless `url` is given.
+    """
+    async def run():
+        latencies = []
+        errors = 0
+        sem = asyncio.Semaphore(concurrency)
+        client = None
+        if url:
+            import httpx
+            client = httpx.AsyncClient(base_url=url, headers={"X-Vault-API-Key": api_key}, timeout=30)
+
+        async def one(i):
+            nonlocal errors
+            tenant = i % len(scope_ids)
+            query = f"{TOPICS[i % len(TOPICS)]} regression in module_{i % 53} ({uuid.uuid4()})"
+            async with sem:
+                start = time.perf_counter()
+                try:
+                    if client:
+                        r = await client.post("/context", json={
+                            "query": query, "scope_ids": [scope_ids[tenant]], "token_budget": token_budget})
+                        r.raise_for_status()
+                    else:
+                        await compiler.compile_async(query, [scope_ids[tenant]], token_budget=token_budget)
+                    latencies.append((time.perf_counter() - start) * 1000)
+                except Exception:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(queries)))
+        elapsed = time.perf_counter() - started
+        if client:
+            await client.aclose()
+        else:
+            await compiler.aclose()
+        return dict(percentiles(latencies), errors=errors, concurrency=concurrency,
+                    rps=len(latencies) / elapsed if elapsed else 0.0, mode="http" if url else "in_process")
+    return asyncio.run(run())
+
+def bench_ingest_and_dream(records, batch_size, workers):
+    """Batch ingest throughput into a scratch scope, then the dream drain of that backlog."""
+    scope_id = create_scope()
+    try:
+        ingest_rps = bench_batch(scope_id, records, batch_size)
+        started = time.monotonic()
+        # Only the scratch scope's backlog: real scopes are neither touched nor counted
+        stats = run_workers(workers, scope_ids=[scope_id])
+        elapsed = time.monotonic() - started
+        events = sum(s["events"] for s in stats)
+        with db_connection() as conn, conn.cursor() as cur:
+            cur.execute("DELETE FROM l3_snippets WHERE scope_id = %s", (scope_id,))
+            conn.commit()
+    finally:
+        drop_scope(scope_id)
+    return (
+        {"records": records, "batch_size": batch_size, "records_per_sec": ingest_rps},
+        {"events": events, "workers": workers, "seconds": elapsed, "events_per_sec": events / elapsed if elapsed else 0.0},
+    )
+
+def bench_l1(scope_ids, symbols, repeat):
+    """fetch_merged over the tenants' hot symbols (one /context L1 fetch)."""
+    client = redis.Redis(host="localhost", port=6379, decode_responses=True)
+    scopes = [f"bench-suite-{s}" for s in scope_ids[:3]]
+    seed_l1(client, scopes, symbols, delta_ratio=0.3)
+    try:
+        store = HotSymbolStore(client)
+        return dict(measure_l1(lambda: store.fetch_merged(scopes), repeat), scopes=len(scopes), symbols=symbols)
+    finally:
+        # Every key the store may have written (version pointer, delta_since, ...), not just the seeded ones
+        keys = [k for s in scopes for k in client.scan_iter(match=scope_key_pattern(s))]
+        client.delete(*keys, *[generation_key(s) for s in scopes])
+
+# --- Regression checks ---
+
+# (section, metric, higher_is_better)
+COMPARED = [
+    ("context", "p50_ms", False), ("context", "p95_ms", False), ("context", "p99_ms", False),
+    ("ingest", "records_per_sec", True), ("dream", "events_per_sec", True),
+    ("l1_merge", "p95_ms", False),
+]
+
+def check(results, baseline=None, p95_target_ms=P95_TARGET_MS, tolerance=0.2):
+    """List of failures: context p95 over target, or any metric `tolerance` worse than baseline."""
+    failures = []
+    for label, r in results["sizes"].items():
+        p95 = r.get("context", {}).get("p95_ms")
+        if p95 is not None and p95 > p95_target_ms:
+            failures.append(f"{label}: context p95 {p95:.1f}ms exceeds the {p95_target_ms:.0f}ms target")
+        base = (baseline or {}).get("sizes", {}).get(label)
+        if not base:
+            continue
+        for section, metric, higher_is_better in COMPARED:
+            new, old = r.get(section, {}).get(metric), base.get(section, {}).get(metric)
+            if new is None or not old:
+                continue
+            change = (new - old) / old
+            if (-change if higher_is_better else change) > tolerance:
+                failures.append(f"{label}: {section}.{metric} {old:.2f} -> {new:.2f} ({change:+.0%})")
+    return failures
+
+def run(sizes, tenants=16, queries=500, concurrency=8, token_budget=6000, ingest_records=5000,
+        ingest_batch_size=500, dream_workers=2, l1_symbols=50, l1_repeat=2000, url=None, api_key=None,
+        keep=False, rebuild=False):
+    encoder = MockEncoder()
+    results = {
+        "meta": dict(git_revision(), timestamp=datetime.now(timezone.utc).isoformat(),
+                     host=socket.gethostname(), python=platform.python_version(), platform=platform.platform(),
+                     encoder="mock", tenants=tenants, queries=queries, concurrency=concurrency,
+                     token_budget=token_budget, p95_target_ms=P95_TARGET_MS),
+        "sizes": {},
+    }
+    for label in sizes:
+        n = SIZES[label]
+        print(f"== {label}: {n} snippets over {tenants} tenants ==")
+        scope_ids, load_seconds = ensure_corpus(label, n, tenants, encoder, rebuild)
+        try:
+            r = {"snippets": n, "load_seconds": load_seconds}
+            r["context"] = bench_context(ContextCompiler(), scope_ids, queries, concurrency, token_budget, url, api_key)
+            r["ingest"], r["dream"] = bench_ingest_and_dream(ingest_records, ingest_batch_size, dream_workers)
+            r["l1_merge"] = bench_l1(scope_ids, l1_symbols, l1_repeat)
+            results["sizes"][label] = r
+            c = r["context"]
+            print(f"  context p50={c['p50_ms']:.1f}ms p95={c['p95_ms']:.1f}ms p99={c['p99_ms']:.1f}ms "
+                  f"({c['rps']:.0f} req/s, {c['errors']} errors)")
+            print(f"  ingest {r['ingest']['records_per_sec']:.0f} records/s, dream {r['dream']['events_per_sec']:.0f} events/s, "
+                  f"L1 merge p95={r['l1_merge']['p95_ms']:.3f}ms")
+        finally:
+            if not keep:
+                drop_corpus(scope_ids)
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Vault benchmark suite: /context latency, ingest, dream and L1 merge")
+    parser.add_argument("--sizes", default="10k", help=f"comma-separated corpus sizes ({', '.join(SIZES)})")
+    parser.add_argument("--tenants", type=int, default=16, help="scopes the corpus is spread over")
+    parser.add_argument("--queries", type=int, default=500, help="/context requests per size")
+    parser.add_argument("--concurrency", type=int, default=8, help="/context requests in flight")
+    parser.add_argument("--token-budget", type=int, default=6000)
+    parser.add_argument("--ingest-records", type=int, default=5000)
+    parser.add_argument("--dream-workers", type=int, default=2)
+    parser.add_argument("--url", help="measure /context through a running server instead of in-process")
+    parser.add_argument("--api-key", default=os.environ.get("VAULT_API_KEY", "dev-key-123"))
+    parser.add_argument("--keep", action="store_true", help="keep corpora for the next run (1m takes a while to load)")
+    parser.add_argument("--rebuild", action="store_true", help="rebuild kept corpora")
+    parser.add_argument("--output", help="results file (default: benchmarks/results/<timestamp>-<commit>.json)")
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression vs baseline")
+    args = parser.parse_args()
+
+    sizes = [s.strip().lower() for s in args.sizes.split(",")]
+    unknown = [s for s in sizes if s not in SIZES]
+    if unknown:
+        parser.error(f"unknown sizes: {unknown}")
+    try:
+        results = run(sizes, args.tenants, args.queries, args.concurrency, args.token_budget, args.ingest_records,
+                      dream_workers=args.dream_workers, url=args.url, api_key=args.api_key,
+                      keep=args.keep, rebuild=args.rebuild)
+    finally:
+        close_pool()
+        asyncio.run(close_async_pool())
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    results["failures"] = check(results, baseline, tolerance=args.tolerance)
+    output = args.output
+    if not output:
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        output = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results",
+                              f"{stamp}-{(results['meta']['commit'] or 'nogit')[:10]}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+    for failure in results["failures"]:
+        print(f"REGRESSION: {failure}")
+    sys.exit(1 if results["failures"] else 0)
@@ -0,0 +1,150 @@
+import os
+import sys
+import json
+import asyncio
+import logging
+
+# Path for secure utility
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.secret_utility import get_secret
+from core.db import sanitize_payload, _L0_COLUMNS
+from core.vector_codec import pack_vector, unpack_vector
+from core.vector_index import (
+    search_settings, filter_settings, iterative_scan_available_async, set_local_sql, uses_iterative_scan,
+    scope_share, SCOPE_SHARE_SQL, SCOPE_COUNT_CAP,
+)
+from core.context_cache import bump_generations_async, close_on_loop
+from core.metrics import INGESTED_RECORDS, INGEST_ERRORS
+
+logger = logging.getLogger(__name__)
+
+# Async data layer for the request path: asyncpg (own pool, one per event loop) with
+# binary pgvector codecs. Mirrors the psycopg2 functions in core.db / vector_store /
+# l2_processor, which remain in use by workers and scripts.
+
+ASYNC_POOL_MIN_SIZE = int(os.environ.get("VAULT_ASYNC_DB_POOL_MIN", "2"))
+ASYNC_POOL_MAX_SIZE = int(os.environ.get("VAULT_ASYNC_DB_POOL_MAX", "20"))
+ASYNC_POOL_MAX_INACTIVE = float(os.environ.get("VAULT_DB_POOL_MAX_LIFETIME", "1800"))
+
+_pool = None
+_pool_loop = None
+_pool_lock = None
+
+async def _init_connection(conn):
+    await conn.set_type_codec("jsonb", encoder=json.dumps, decoder=json.loads, schema="pg_catalog")
+    await conn.set_type_codec("json", encoder=json.dumps, decoder=json.loads, schema="pg_catalog")
+    try:
+        # pgvector's binary recv/send format; same bytes as the COPY path in core.vector_codec
+        await conn.set_type_codec("vector", encoder=pack_vector, decoder=unpack_vector, format="binary")
+    except ValueError as e:
+        logger.warning("pgvector async codec skipped error=%s", e)
+
+async def get_async_pool():
+    """Returns this event loop's asyncpg pool, creating it on first use."""
+    global _pool, _pool_loop, _pool_lock
+    import asyncpg
+    loop = asyncio.get_running_loop()
+    if _pool_loop is not loop:
+        # First use, or a new loop (tests, reloads): a pool cannot cross loops.
+        if _pool is not None:
+            close_on_loop(_pool_loop, _pool.close)
+        _pool_loop, _pool, _pool_lock = loop, None, asyncio.Lock()
+    async with _pool_lock:
+        if _pool is None:
+            # Keystore reads may fork a shell on a cold cache; keep them off the loop.
+            user, password, database = await asyncio.gather(*(
+                asyncio.to_thread(get_secret, key) for key in ("VAULT_DB_USER", "VAULT_DB_PASS", "VAULT_DB_NAME")
+            ))
+            _pool = await asyncpg.create_pool(
+                host="127.0.0.1", user=user, password=password, database=database,
+                min_size=ASYNC_POOL_MIN_SIZE, max_size=ASYNC_POOL_MAX_SIZE,
+                max_inactive_connection_lifetime=ASYNC_POOL_MAX_INACTIVE,
+                init=_init_connection,
+            )
+    return _pool
+
+def async_pool_stats():
+    """Size/idle/in-use of this process's asyncpg pool (zeros before first use)."""
+    if _pool is None:
+        return {"min_size": ASYNC_POOL_MIN_SIZE, "max_size": ASYNC_POOL_MAX_SIZE, "size": 0, "idle": 0, "in_use": 0}
+    size, idle = _pool.get_size(), _pool.get_idle_size()
+    return {"min_size": ASYNC_POOL_MIN_SIZE, "max_size": ASYNC_POOL_MAX_SIZE, "size": size, "idle": idle, "in_use": size - idle}
+
+async def close_async_pool():
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+async def insert_l0_record_async(record):
+    """Async insert_l0_record: the L0 row and its event in one transaction."""
+    source = record.provenance.source if record.provenance else 'unknown'
+    try:
+        pool = await get_async_pool()
+        async with pool.acquire() as conn, conn.transaction():
+            scope_type = await conn.fetchval("SELECT scope_type FROM scopes WHERE scope_id = $1", record.scope_id)
+            await conn.execute(
+                f"INSERT INTO records_l0 ({_L0_COLUMNS}) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11)",
+                record.record_id, scope_type or 'workspace', record.scope_id, record.record_type, source,
+                record.path, record.start_line, record.end_line, sanitize_payload(record.payload),
+                record.confidence, record.provenance.__dict__,
+            )
+            await conn.execute(
+                "INSERT INTO event_log (record_id, action, version) VALUES ($1, 'upsert', 1)",
+                record.record_id,
+            )
+        await bump_generations_async([record.scope_id])
+        INGESTED_RECORDS.labels("async").inc()
+        return True
+    except Exception as e:
+        logger.error("async ingest failed record_id=%s error=%s", record.record_id, e)
+        INGEST_ERRORS.labels("async").inc()
+        return False
+
+async def search_l3_async(scope_ids, query_embedding, limit=10, recall=None, query_text=None, l3_filter=None):
+    """Async VectorStore.search_l3 (same queries, ANN settings and L3Match rows)."""
+    from core.vector_store import (
+        L3Match, L3Filter, L3_HYBRID, HYBRID_L3_SQL, VECTOR_L3_SQL, RRF_K, hybrid_candidates, filter_sql,
+    )
+    l3_filter = L3Filter.of(l3_filter)
+    hybrid = bool(query_text) and L3_HYBRID
+    candidates = hybrid_candidates(limit) if hybrid else limit
+    settings = search_settings(recall)
+    settings["hnsw.ef_search"] = max(settings["hnsw.ef_search"], int(candidates))
+    try:
+        pool = await get_async_pool()
+        async with pool.acquire() as conn, conn.transaction():
+            iterative = await iterative_scan_available_async(conn)
+            share = None
+            if not l3_filter and not uses_iterative_scan(iterative):
+                share = scope_share(*await conn.fetchrow(
+                    SCOPE_SHARE_SQL.format(scopes="$1::uuid[]", cap="$2"), list(scope_ids), SCOPE_COUNT_CAP,
+                ))
+            settings.update(filter_settings(iterative, bool(l3_filter), share, settings))
+            for guc, value in settings.items():
+                await conn.execute(set_local_sql(guc, value))
+            if hybrid:
+                filters, filter_params = filter_sql(l3_filter, lambda i: f"${i + 7}")
+                rows = await conn.fetch(
+                    HYBRID_L3_SQL.format(vec="$1", scopes="$2", query="$3", candidates="$4", k="$5", limit="$6", filters=filters),
+                    query_embedding, list(scope_ids), query_text, candidates, RRF_K, limit, *filter_params,
+                )
+            else:
+                filters, filter_params = filter_sql(l3_filter, lambda i: f"${i + 4}")
+                rows = await conn.fetch(
+                    VECTOR_L3_SQL.format(vec="$1", scopes="$2", limit="$3", filters=filters),
+                    query_embedding, list(scope_ids), limit, *filter_params,
+                )
+        return [L3Match(*row) for row in rows]
+    except Exception as e:
+        logger.warning("L3 async search failed scopes=%d error=%s", len(scope_ids), e)
+        raise
+
+async def get_digests_async(scope_ids, lod_level=None, query_embedding=None, limit=None, parent_ids=None, zoom=None):
+    """Async L2Processor.get_digests: ranked (digest_id, text, lod_level, version) rows."""
+    from core.l2_processor import digest_params, render_params
+    template, params = digest_params(scope_ids, zoom or [lod_level], query_embedding, limit, parent_ids)
+    query, args = render_params(template, params, "numeric")
+    pool = await get_async_pool()
+    async with pool.acquire() as conn:
+        return [tuple(row) for row in await conn.fetch(query, *args)]
@@ -0,0 +1,140 @@
+import os
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Protocol, runtime_checkable
+
+# "estimate" (default, no dependencies) or "tiktoken:<encoding>", e.g. tiktoken:cl100k_base
+TOKENIZER = os.environ.get("VAULT_TOKENIZER", "estimate")
+
+# Share of the budget (after reserved blocks) each tier may fill before any leftover
+# space is handed out by score across tiers.
+TIER_QUOTAS = {"L1": 0.15, "L2": 0.25, "L3": 0.60}
+TIER_HEADERS = {
+    "L1": "## [L1] EPHEMERAL SESSION FOCUS",
+    "L2": "## [L2] ARCHITECTURAL BIRD'S EYE VIEW",
+    "L3": "## [L3] SEMANTIC MEMORY ANCHORS",
+}
+BLOCK_SEPARATOR = "\n\n"
+SEPARATOR_TOKENS = 1
+
+@runtime_checkable
+class Tokenizer(Protocol):
+    def count(self, text: str) -> int: ...
+
+class EstimateTokenizer:
+    """
+    BPE-ish estimate without a vocabulary: ~4 characters per token, but never fewer
+    than ~1.3 tokens per whitespace-separated word. Errs slightly high so packed
+    context stays under a real tokenizer's count. A few microseconds per block.
+    """
+    def count(self, text):
+        return max((len(text) + 3) // 4, (len(text.split()) * 13 + 9) // 10)
+
+class TiktokenTokenizer:
+    """Exact counts for OpenAI-style BPE vocabularies (optional dependency)."""
+    def __init__(self, encoding="cl100k_base"):
+        try:
+            import tiktoken
+        except ImportError as e:
+            raise ImportError("TiktokenTokenizer needs `pip install tiktoken`") from e
+        self._encoding = tiktoken.get_encoding(encoding)
+
+    def count(self, text):
+        return len(self._encoding.encode(text, disallowed_special=()))
+
+def get_tokenizer(spec=None):
+    name = spec or TOKENIZER
+    if name == "estimate":
+        return EstimateTokenizer()
+    if name.startswith("tiktoken:"):
+        return TiktokenTokenizer(name.split(":", 1)[1])
+    raise ValueError(f"Unknown tokenizer: {name}")
+
+@dataclass
+class ContextBlock:
+    """One droppable unit of context (a symbol line, a digest, an L3 record)."""
+    tier: str
+    text: str
+    score: float = 0.0
+    tokens: Optional[int] = None
+
+@dataclass
+class PackResult:
+    text: str
+    tokens_used: int
+    token_budget: int
+    tier_tokens: Dict[str, int] = field(default_factory=dict)
+    dropped_blocks: Dict[str, int] = field(default_factory=dict)
+
+def pack_blocks(blocks: List[ContextBlock], token_budget: int, tokenizer: Tokenizer,
+                reserved_head=(), reserved_tail=(), quotas=None, headers=None) -> PackResult:
+    """
+    Packs whole blocks into `token_budget`.
+    reserved_head/reserved_tail (e.g. status header, guardrails) are always emitted and
+    paid for first. Each tier then takes its best-scored blocks up to its quota; the
+    space that is left goes to the best remaining blocks of any tier. A block that does
+    not fit is skipped, never cut. Chosen blocks keep their tier order and in-tier
+    order, and a tier's header is emitted (and paid for) only if one of its blocks is.
+    """
+    quotas = TIER_QUOTAS if quotas is None else quotas
+    headers = TIER_HEADERS if headers is None else headers
+
+    def cost(text):
+        return tokenizer.count(text) + SEPARATOR_TOKENS
+
+    used = sum(cost(t) for t in (*reserved_head, *reserved_tail))
+    available = max(token_budget - used, 0)
+
+    for block in blocks:
+        if block.tokens is None:
+            block.tokens = cost(block.text)
+    header_cost = {tier: cost(text) for tier, text in headers.items()}
+
+    tier_order = list(dict.fromkeys([*quotas, *(b.tier for b in blocks)]))
+    chosen = set()
+    tier_tokens = dict.fromkeys(tier_order, 0)
+    spent = 0
+
+    def take(i, block, tier_limit=None):
+        nonlocal spent
+        need = block.tokens + (header_cost.get(block.tier, 0) if tier_tokens[block.tier] == 0 else 0)
+        if spent + need > available:
+            return False
+        if tier_limit is not None and tier_tokens[block.tier] + need > tier_limit:
+            return False
+        chosen.add(i)
+        tier_tokens[block.tier] += need
+        spent += need
+        return True
+
+    ranked = sorted(range(len(blocks)), key=lambda i: -blocks[i].score)
+    # 1. Quota pass: each tier gets its share first, best blocks first
+    for tier in tier_order:
+        limit = int(available * quotas.get(tier, 0))
+        for i in ranked:
+            if blocks[i].tier == tier:
+                take(i, blocks[i], tier_limit=limit)
+    # 2. Leftover pass: unused quota goes to the best remaining blocks of any tier
+    for i in ranked:
+        if i not in chosen:
+            take(i, blocks[i])
+
+    parts = list(reserved_head)
+    dropped = {}
+    for tier in tier_order:
+        tier_blocks = [(i, b) for i, b in enumerate(blocks) if b.tier == tier]
+        kept = [b.text for i, b in tier_blocks if i in chosen]
+        if kept:
+            if tier in headers:
+                parts.append(headers[tier])
+            parts.extend(kept)
+        if len(kept) < len(tier_blocks):
+            dropped[tier] = len(tier_blocks) - len(kept)
+    parts.extend(reserved_tail)
+
+    return PackResult(
+        text=BLOCK_SEPARATOR.join(parts),
+        tokens_used=used + spent,
+        token_budget=token_budget,
+        tier_tokens={t: n for t, n in tier_tokens.items() if n},
+        dropped_blocks=dropped,
+    )
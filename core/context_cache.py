@@ -0,0 +1,264 @@
+import os
+import json
+import time
+import hashlib
+import asyncio
+import threading
+import logging
+from collections import OrderedDict
+import redis
+
+logger = logging.getLogger(__name__)
+
+# In-process LRU capacity (compiled blocks) and max entry age in seconds. Entries are
+# invalidated by scope generations; the age cap only bounds staleness if a bump is lost.
+CONTEXT_CACHE_SIZE = int(os.environ.get("VAULT_CONTEXT_CACHE_SIZE", "1024"))
+CONTEXT_CACHE_TTL = float(os.environ.get("VAULT_CONTEXT_CACHE_TTL", "300"))
+# Optional shared tier so several server processes reuse each other's blocks ("1" to enable)
+CONTEXT_CACHE_REDIS = os.environ.get("VAULT_CONTEXT_CACHE_REDIS", "0") == "1"
+# After Redis errors the cache is bypassed for this long instead of adding the
+# client's connect/retry time to every /context request.
+CONTEXT_CACHE_RETRY_AFTER = 5.0
+
+# Per-scope generation counters: any write that can change a scope's compiled
+# context INCRs its counter, so cache keys built from older generations never match again.
+GENERATION_PREFIX = "scope_gen:"
+REDIS_TIER_PREFIX = "context_cache:"
+
+_default_client = None
+_default_async_clients = {}  # event loop -> redis.asyncio client
+_bump_retry_at = 0.0
+
+def generation_key(scope_id):
+    return f"{GENERATION_PREFIX}{scope_id}"
+
+def _get_default_client():
+    global _default_client
+    if _default_client is None:
+        _default_client = redis.Redis(host='localhost', port=6379, decode_responses=True)
+    return _default_client
+
+def close_on_loop(loop, close):
+    """
+    Runs the `close()` coroutine on `loop`, the loop its connections are bound to,
+    from a coroutine running on another loop. A closed loop cannot run it any more;
+    its sockets are released when the dropped client is collected.
+    """
+    try:
+        if loop.is_closed():
+            logger.debug("Stale async client dropped, loop already closed")
+        elif loop.is_running():
+            asyncio.run_coroutine_threadsafe(close(), loop)
+        else:
+            # This thread is busy running the current loop; the idle one needs a thread of its own.
+            worker = threading.Thread(target=loop.run_until_complete, args=(close(),), daemon=True)
+            worker.start()
+            worker.join(timeout=5.0)
+    except Exception as e:
+        logger.warning("Stale async client close failed error=%s", e)
+
+def _get_default_async_client():
+    import redis.asyncio
+    loop = asyncio.get_running_loop()
+    client = _default_async_clients.get(loop)
+    if client is None:
+        # Clients are bound to the loop that created them; close the ones left on older loops.
+        for stale_loop, stale in list(_default_async_clients.items()):
+            del _default_async_clients[stale_loop]
+            close_on_loop(stale_loop, stale.aclose)
+        client = _default_async_clients[loop] = redis.asyncio.Redis(host='localhost', port=6379, decode_responses=True)
+    return client
+
+async def close_async_clients():
+    """Closes this event loop's default redis.asyncio client (lifespan shutdown)."""
+    client = _default_async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+def bump_generations(scope_ids, client=None):
+    """
+    Invalidates cached context for the given scopes. Call after the write has committed,
+    so a concurrent compile cannot cache pre-write data under the new generation.
+    While Redis is unreachable bumps are skipped (writes must not stall on it); entries
+    cached before the outage then age out after CONTEXT_CACHE_TTL.
+    """
+    global _bump_retry_at
+    scope_ids = {str(s) for s in scope_ids}
+    if not scope_ids or time.monotonic() < _bump_retry_at:
+        return not scope_ids
+    try:
+        pipe = (client or _get_default_client()).pipeline(transaction=False)
+        for scope_id in scope_ids:
+            pipe.incr(generation_key(scope_id))
+        pipe.execute()
+        return True
+    except redis.exceptions.RedisError as e:
+        logger.warning("context cache generation bump failed scopes=%d error=%s", len(scope_ids), e)
+        _bump_retry_at = time.monotonic() + CONTEXT_CACHE_RETRY_AFTER
+        return False
+
+async def bump_generations_async(scope_ids, client=None):
+    """bump_generations for the async request path (same back-off on Redis errors)."""
+    global _bump_retry_at
+    scope_ids = {str(s) for s in scope_ids}
+    if not scope_ids or time.monotonic() < _bump_retry_at:
+        return not scope_ids
+    try:
+        pipe = (client or _get_default_async_client()).pipeline(transaction=False)
+        for scope_id in scope_ids:
+            pipe.incr(generation_key(scope_id))
+        await pipe.execute()
+        return True
+    except redis.exceptions.RedisError as e:
+        logger.warning("context cache generation bump failed scopes=%d error=%s", len(scope_ids), e)
+        _bump_retry_at = time.monotonic() + CONTEXT_CACHE_RETRY_AFTER
+        return False
+
+class ContextCache:
+    """
+    Bounded LRU of compiled context blocks keyed by (query, scope_ids, variant,
+    per-scope generations); `variant` is any JSON-able set of compile settings. A lookup costs one MGET for the generations plus a dict hit.
+    """
+    def __init__(self, client, max_entries=CONTEXT_CACHE_SIZE, ttl=CONTEXT_CACHE_TTL, redis_tier=CONTEXT_CACHE_REDIS,
+                 async_client=None):
+        self.redis = client
+        self._async_redis = async_client  # redis.asyncio client for the *_async methods; None = per-loop default
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.redis_tier = redis_tier
+        self._entries = OrderedDict()  # key -> (value, expires_at monotonic)
+        self._lock = threading.Lock()
+        self._retry_at = 0.0
+        self.stats = {"hits": 0, "redis_hits": 0, "misses": 0, "evictions": 0, "bypassed": 0}
+
+    @property
+    def async_redis(self):
+        return self._async_redis if self._async_redis is not None else _get_default_async_client()
+
+    def key(self, query, scope_ids, variant):
+        """Cache key for the current scope generations, or None if they cannot be read."""
+        if self._backing_off():
+            return None
+        scope_ids = [str(s) for s in scope_ids]
+        try:
+            generations = self.redis.mget([generation_key(s) for s in scope_ids]) if scope_ids else []
+        except redis.exceptions.RedisError as e:
+            return self._bypass(e)
+        return self._make_key(query, scope_ids, variant, generations)
+
+    async def key_async(self, query, scope_ids, variant):
+        if self._backing_off():
+            return None
+        scope_ids = [str(s) for s in scope_ids]
+        try:
+            generations = await self.async_redis.mget([generation_key(s) for s in scope_ids]) if scope_ids else []
+        except redis.exceptions.RedisError as e:
+            return self._bypass(e)
+        return self._make_key(query, scope_ids, variant, generations)
+
+    def _make_key(self, query, scope_ids, variant, generations):
+        raw = json.dumps([query, scope_ids, variant, [g or "0" for g in generations]])
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def _backing_off(self):
+        if time.monotonic() < self._retry_at:
+            self._count("bypassed")
+            return True
+        return False
+
+    def _bypass(self, error):
+        logger.warning("context cache bypassed, scope generations unavailable error=%s", error)
+        self._retry_at = time.monotonic() + CONTEXT_CACHE_RETRY_AFTER
+        self._count("bypassed")
+        return None
+
+    def get(self, key):
+        if key is None:
+            return None
+        value = self._get_local(key)
+        if value is None and self.redis_tier:
+            try:
+                value = self.redis.get(REDIS_TIER_PREFIX + key)
+            except redis.exceptions.RedisError:
+                value = None
+            return self._from_redis_tier(key, value)
+        return value
+
+    async def get_async(self, key):
+        if key is None:
+            return None
+        value = self._get_local(key)
+        if value is None and self.redis_tier:
+            try:
+                value = await self.async_redis.get(REDIS_TIER_PREFIX + key)
+            except redis.exceptions.RedisError:
+                value = None
+            return self._from_redis_tier(key, value)
+        return value
+
+    def _get_local(self, key):
+        """Local LRU lookup; counts a miss only when there is no Redis tier to try next."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[1] > now:
+                    self._entries.move_to_end(key)
+                    self.stats["hits"] += 1
+                    return entry[0]
+                del self._entries[key]
+            if not self.redis_tier:
+                self.stats["misses"] += 1
+        return None
+
+    def _from_redis_tier(self, key, value):
+        if value is None:
+            self._count("misses")
+            return None
+        self._put_local(key, value)
+        self._count("redis_hits")
+        return value
+
+    def put(self, key, value):
+        if key is None:
+            return
+        self._put_local(key, value)
+        if self.redis_tier:
+            try:
+                self.redis.set(REDIS_TIER_PREFIX + key, value, ex=max(int(self.ttl), 1))
+            except redis.exceptions.RedisError as e:
+                logger.warning("context cache redis tier write failed error=%s", e)
+
+    async def put_async(self, key, value):
+        if key is None:
+            return
+        self._put_local(key, value)
+        if self.redis_tier:
+            try:
+                await self.async_redis.set(REDIS_TIER_PREFIX + key, value, ex=max(int(self.ttl), 1))
+            except redis.exceptions.RedisError as e:
+                logger.warning("context cache redis tier write failed error=%s", e)
+
+    def _put_local(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def snapshot(self):
+        """Counters plus current size and hit ratio."""
+        with self._lock:
+            stats = dict(self.stats, size=len(self._entries), max_entries=self.max_entries)
+        lookups = stats["hits"] + stats["redis_hits"] + stats["misses"]
+        stats["hit_ratio"] = (stats["hits"] + stats["redis_hits"]) / lookups if lookups else 0.0
+        return stats
@@ -1,116 +1,344 @@
 import os
 import sys
 import json
+import time
 import redis
+import asyncio
+import logging
+import threading
+from collections import namedtuple
+from dataclasses import dataclass, field, replace
+from typing import Optional, Union
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
 
 # Path for core modules
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from core.db import get_db_connection
-from core.vector_store import VectorStore, MockEncoder
+from core.vector_backends import get_vector_store
+from core.vector_store import L3Filter
+from core.encoders import get_encoder, QueryEmbeddingCache
 from core.l2_processor import L2Processor
+from core.hot_symbols import HotSymbolStore, AsyncHotSymbolStore
+from core.async_db import get_digests_async, close_async_pool
+from core.context_cache import ContextCache, close_async_clients
+from core.budget import ContextBlock, get_tokenizer, pack_blocks, TIER_QUOTAS
+from core.metrics import STAGE_SECONDS, COMPILE_SECONDS, TIER_OMITTED
+
+logger = logging.getLogger(__name__)
+
+# Per-tier deadlines (ms), measured from the start of compilation. A tier that misses
+# its deadline is left out of the block instead of holding up the response.
+TIER_DEADLINES_MS = {
+    "L1": float(os.environ.get("VAULT_L1_DEADLINE_MS", "25")),
+    "L2": float(os.environ.get("VAULT_L2_DEADLINE_MS", "80")),
+    "L3": float(os.environ.get("VAULT_L3_DEADLINE_MS", "150")),
+}
+# L3 matches fetched per request; the budget packer keeps as many as fit, best first
+L3_CANDIDATES = int(os.environ.get("VAULT_L3_CANDIDATES", "10"))
+# L2 pyramid levels /context zooms through, coarsest first (see L2Processor.get_digests)
+L2_ZOOM = tuple(l for l in os.environ.get("VAULT_L2_ZOOM", "session,subsystem,module,file").split(",") if l)
+# Typical rendered digest size: the L2 fetch limit is the L2 token quota divided by this
+L2_DIGEST_TOKENS = int(os.environ.get("VAULT_L2_DIGEST_TOKENS", "120"))
+# Shared by all compilers in the process; sized for a few concurrent requests x 3 tiers.
+TIER_POOL_SIZE = int(os.environ.get("VAULT_TIER_POOL_SIZE", "24"))
+
+# 4. Action Guardrails (Safety): reserved in every block, never dropped
+GUARDRAILS_BLOCK = (
+    "## [AGENT ACTION GUARDRAILS]\n"
+    "- MAXIMUM_FILES_MODIFIED: 3\n"
+    "- MAXIMUM_LOC_ADDED: 200\n"
+    "- FORBIDDEN_PATHS: ['.git/', 'venv/', '.keystore.*']\n"
+    "- REQUIRED_TESTS: Any new logic MUST include a corresponding unit or integration test.\n"
+    "- EVIDENCE_REQUIREMENT: Any proposed code change MUST cite at least one authoritative anchor (record ID) from the [L3] Semantic Memory Anchors section if available."
+)
+
+# Pre-bound histogram children: a label lookup per stage would cost more than the timer
+_STAGE = {stage: STAGE_SECONDS.labels(stage) for stage in ("l1", "l2", "l3", "encoding", "provenance", "assembly")}
+_COMPILE_HIT = COMPILE_SECONDS.labels("hit")
+_COMPILE_MISS = COMPILE_SECONDS.labels("miss")
+
+# A compiled block plus its token accounting
+CompiledContext = namedtuple("CompiledContext", [
+    "text", "tokens_used", "token_budget", "tier_tokens", "dropped_blocks", "omitted_tiers",
+])
+
+@dataclass(frozen=True)
+class CompileOptions:
+    """Per-request compile settings. Requests never mutate the shared compiler."""
+    token_budget: int = 6000
+    tier_deadlines_ms: dict = field(default_factory=lambda: dict(TIER_DEADLINES_MS))
+    tier_quotas: dict = field(default_factory=lambda: dict(TIER_QUOTAS))
+    l3_candidates: int = L3_CANDIDATES
+    recall: Optional[Union[str, float]] = None  # ANN recall knob for L3 (None = VAULT_ANN_RECALL)
+    l3_filter: Optional[L3Filter] = None  # metadata constraints on L3 (an L3Filter or a dict of its fields)
+    l2_zoom: tuple = L2_ZOOM
+
+    def __post_init__(self):
+        object.__setattr__(self, "l3_filter", L3Filter.of(self.l3_filter))
+        object.__setattr__(self, "l2_zoom", tuple(self.l2_zoom))
+
+    def l2_limit(self):
+        """Digests worth fetching: about as many as the L2 quota of the budget holds."""
+        return max(1, int(self.token_budget * self.tier_quotas.get("L2", 0)) // L2_DIGEST_TOKENS)
+
+    def cache_variant(self):
+        """The settings that change a complete block (deadlines only decide if it is complete)."""
+        l3_filter = self.l3_filter.as_dict() if self.l3_filter else None
+        return [self.token_budget, sorted(self.tier_quotas.items()), self.l3_candidates, self.recall, l3_filter,
+                list(self.l2_zoom)]
+
+_tier_executor = None
+_tier_executor_pid = None
+_tier_executor_lock = threading.Lock()
+
+def _get_tier_executor():
+    global _tier_executor, _tier_executor_pid
+    # A pool created before a pre-fork server (gunicorn --preload) forked has no threads in the child
+    if _tier_executor is None or _tier_executor_pid != os.getpid():
+        with _tier_executor_lock:
+            if _tier_executor is None or _tier_executor_pid != os.getpid():
+                _tier_executor = ThreadPoolExecutor(max_workers=TIER_POOL_SIZE, thread_name_prefix="context-tier")
+                _tier_executor_pid = os.getpid()
+    return _tier_executor
+
+def _l1_blocks(symbols):
+    # Current focus outranks retrieved memory when leftover space is handed out
+    return [ContextBlock("L1", f"- {k}: {v}", score=1.0) for k, v in symbols.items()]
+
+def _l2_blocks(digests):
+    return [
+        ContextBlock("L2", f"### DIGEST (v{ver}): {text}", score=0.9 - 0.01 * rank)
+        for rank, (did, text, level, ver) in enumerate(digests or [])
+    ]
+
+def _l3_blocks(l3_matches):
+    blocks = []
+    # Matches arrive best first (fused rank for hybrid searches). Packing compares
+    # scores across tiers, so a fused score is scaled onto the similarity range:
+    # the best match gets the top similarity, the rest in proportion to their score.
+    top_similarity = max((match.similarity for match in l3_matches), default=0.0)
+    top_fused = max((match.score for match in l3_matches if match.score is not None), default=None)
+    for match in l3_matches:
+        if match.score is None or not top_fused:
+            score = match.similarity
+        else:
+            score = top_similarity * match.score / top_fused
+        # Provenance arrives joined onto the match; no per-record lookup.
+        provenance = match.provenance or {"error": "Provenance missing"}
+        block = f"### RECORD: {match.record_id}\n"
+        block += f"Evidence: {match.text}\n"
+        block += f"Grounding: Semantic match (score: {match.similarity:.4f})\n"
+        if match.confidence is not None:
+            block += f"Confidence: {match.confidence:.2f}\n"
+        block += f"L0 Provenance: {json.dumps(provenance)}\n"
+        blocks.append(ContextBlock("L3", block, score=score))
+    return blocks
+
+def _timed(stage, fn, *args):
+    with _STAGE[stage].time():
+        return fn(*args)
+
+async def _timed_async(stage, coro):
+    # A cancelled straggler is observed at its deadline and also counted in TIER_OMITTED
+    with _STAGE[stage].time():
+        return await coro
 
 class ContextCompiler:
-    def __init__(self, token_budget=6000):
-        self.token_budget = token_budget 
-        self.vs = VectorStore()
-        self.l2 = L2Processor()
-        self.encoder = MockEncoder()
-        # Connect to Redis for L1 Hot Symbols
-        self.redis = redis.Redis(host='localhost', port=6379, decode_responses=True)
-
-    def compile_multiscale_context(self, query: str, scope_ids: list):
-        """Compiles a grounded context block using L1 (Hot), L2 (Digest), and L3 (Snippet) memory."""
-        print(f"--- COMPILING MULTISCALE CONTEXT: '{query}' ---")
-        
+    """
+    Stateless compile service: one instance is shared by every request and thread.
+    Per-request settings travel as CompileOptions; connections are borrowed per call
+    from the shared Postgres/Redis pools, and the only mutable members (query
+    embedding and result caches) are internally locked. Dependencies can be injected.
+    """
+    def __init__(self, token_budget=6000, tier_deadlines_ms=None, tokenizer=None, tier_quotas=None, *,
+                 vector_store=None, l2=None, encoder=None, redis_client=None, async_redis_client=None, cache=None):
+        self.defaults = CompileOptions(
+            token_budget=token_budget,
+            tier_deadlines_ms=dict(TIER_DEADLINES_MS, **(tier_deadlines_ms or {})),
+            tier_quotas=dict(TIER_QUOTAS, **(tier_quotas or {})),
+        )
+        self.tokenizer = tokenizer or get_tokenizer()
+        self.vs = vector_store or get_vector_store()
+        self.l2 = l2 or L2Processor()
+        self.encoder = encoder or get_encoder()
+        # Agents repeat queries; skip re-encoding them
+        self.query_embeddings = QueryEmbeddingCache(self.encoder)
+        # Connect to Redis for L1 Hot Symbols (redis-py clients are pooled and thread-safe)
+        self.redis = redis_client or redis.Redis(host='localhost', port=6379, decode_responses=True)
+        self.hot_symbols = HotSymbolStore(self.redis)
+        # Async twins for compile_async (the FastAPI request path). redis.asyncio clients are
+        # bound to one event loop, so unless one is injected each loop gets its own on first use.
+        self.async_redis = async_redis_client
+        self.async_hot_symbols = AsyncHotSymbolStore(async_redis_client)
+        self.cache = cache or ContextCache(self.redis, async_client=async_redis_client)
+
+    def options(self, **overrides):
+        """CompileOptions for one request: the compiler defaults plus `overrides`."""
+        overrides = {k: v for k, v in overrides.items() if v is not None}
+        for name in ("tier_deadlines_ms", "tier_quotas"):
+            if name in overrides:
+                overrides[name] = dict(getattr(self.defaults, name), **overrides[name])
+        return replace(self.defaults, **overrides)
+
+    def compile_multiscale_context(self, query: str, scope_ids: list, **overrides):
+        """Compiles the context block text (see compile())."""
+        return self.compile(query, scope_ids, **overrides).text
+
+    def compile(self, query: str, scope_ids: list, options: CompileOptions = None, **overrides):
+        """
+        Compiles a grounded context block using L1 (Hot), L2 (Digest), and L3 (Snippet) memory.
+        The three tiers are fetched concurrently; each must finish within its deadline.
+        Blocks are packed whole into token_budget (guardrails always included).
+        Complete blocks are cached until one of the scopes is written to.
+        Settings come from `options` or keyword overrides of the defaults (token_budget=...).
+        Returns a CompiledContext.
+        """
+        started = time.monotonic()
+        opts = options or self.options(**overrides)
+        cache_key = self.cache.key(query, scope_ids, opts.cache_variant())
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            _COMPILE_HIT.observe(time.monotonic() - started)
+            return CompiledContext(**json.loads(cached))
+
+        logger.debug("compiling context query=%r scopes=%d budget=%d", query, len(scope_ids), opts.token_budget)
+
+        executor = _get_tier_executor()
+        futures = {
+            "L1": executor.submit(_timed, "l1", self._fetch_l1_blocks, scope_ids),
+            "L2": executor.submit(_timed, "l2", self._fetch_l2_blocks, query, scope_ids, opts),
+            "L3": executor.submit(_timed, "l3", self._fetch_l3_blocks, query, scope_ids, opts),
+        }
+
+        context_blocks = []
+        omitted = []
+        for tier, future in futures.items():
+            deadline_ms = opts.tier_deadlines_ms[tier]
+            remaining = deadline_ms / 1000 - (time.monotonic() - started)
+            try:
+                context_blocks.extend(future.result(timeout=max(remaining, 0)))
+            except FutureTimeout:
+                # The straggler keeps running on the pool; its result is discarded.
+                omitted.append(f"{tier} (deadline {deadline_ms:.0f}ms exceeded)")
+                TIER_OMITTED.labels(tier, "deadline").inc()
+            except Exception as e:
+                logger.warning("tier fetch failed tier=%s error=%s", tier, e)
+                omitted.append(f"{tier} (unavailable)")
+                TIER_OMITTED.labels(tier, "error").inc()
+
+        result = self._assemble(context_blocks, omitted, opts)
+        # A partial block is only good for this request; the next one should retry the tiers.
+        if not omitted:
+            self.cache.put(cache_key, json.dumps(result._asdict()))
+        _COMPILE_MISS.observe(time.monotonic() - started)
+        return result
+
+    async def compile_async(self, query: str, scope_ids: list, options: CompileOptions = None, **overrides):
+        """
+        compile() for the event loop: tiers run as coroutines on asyncpg/redis.asyncio, so
+        concurrency is bounded by the connection pools rather than a thread pool. A tier
+        that misses its deadline is cancelled.
+        """
+        started = time.monotonic()
+        opts = options or self.options(**overrides)
+        cache_key = await self.cache.key_async(query, scope_ids, opts.cache_variant())
+        cached = await self.cache.get_async(cache_key)
+        if cached is not None:
+            _COMPILE_HIT.observe(time.monotonic() - started)
+            return CompiledContext(**json.loads(cached))
+
+        logger.debug("compiling context query=%r scopes=%d budget=%d", query, len(scope_ids), opts.token_budget)
+
+        tasks = {
+            "L1": asyncio.ensure_future(_timed_async("l1", self._fetch_l1_blocks_async(scope_ids))),
+            "L2": asyncio.ensure_future(_timed_async("l2", self._fetch_l2_blocks_async(query, scope_ids, opts))),
+            "L3": asyncio.ensure_future(_timed_async("l3", self._fetch_l3_blocks_async(query, scope_ids, opts))),
+        }
+
         context_blocks = []
+        omitted = []
+        for tier, task in tasks.items():
+            deadline_ms = opts.tier_deadlines_ms[tier]
+            remaining = deadline_ms / 1000 - (time.monotonic() - started)
+            try:
+                context_blocks.extend(await asyncio.wait_for(task, timeout=max(remaining, 0)))
+            except asyncio.TimeoutError:
+                omitted.append(f"{tier} (deadline {deadline_ms:.0f}ms exceeded)")
+                TIER_OMITTED.labels(tier, "deadline").inc()
+            except Exception as e:
+                logger.warning("tier fetch failed tier=%s error=%s", tier, e)
+                omitted.append(f"{tier} (unavailable)")
+                TIER_OMITTED.labels(tier, "error").inc()
+
+        result = self._assemble(context_blocks, omitted, opts)
+        if not omitted:
+            await self.cache.put_async(cache_key, json.dumps(result._asdict()))
+        _COMPILE_MISS.observe(time.monotonic() - started)
+        return result
 
-        # 1. Level 1: Hot Symbols (Redis Ephemeral)
-        try:
-            aggregated_symbols = {}
-            for scope_id in scope_ids:
-                base_symbols = self.redis.hgetall(f"hot_symbols:{scope_id}:base")
-                delta_symbols = self.redis.hgetall(f"hot_symbols:{scope_id}:delta")
-                
-                merged = {}
-                if base_symbols:
-                    merged.update(base_symbols)
-                if delta_symbols:
-                    for k, v in delta_symbols.items():
-                        if v == "__DELETE__":
-                            merged.pop(k, None)
-                        else:
-                            merged[k] = v
-                            
-                if merged:
-                    aggregated_symbols.update(merged)
-                    
-            if aggregated_symbols:
-                context_blocks.append("## [L1] EPHEMERAL SESSION FOCUS")
-                for k, v in aggregated_symbols.items():
-                    context_blocks.append(f"- {k}: {v}")
-        except Exception as e:
-            print(f"Redis L1 Fetch Error: {e}")
-
-        # 2. Level 2: Bird's Eye View (L2 Digests)
-        try:
-            digests = self.l2.get_digests(scope_ids, lod_level='session')
-            if digests:
-                context_blocks.append("## [L2] ARCHITECTURAL BIRD'S EYE VIEW")
-                for did, text, level, ver in digests:
-                    context_blocks.append(f"### DIGEST (v{ver}): {text}")
-        except Exception as e:
-            print(f"L2 Digest Fetch Error: {e}")
-
-        # 3. Level 3: Semantic Retrieval (L3 Vector Index)
-        try:
-            query_vec = self.encoder.encode(query).tolist()
-            l3_matches = self.vs.search_l3(scope_ids, query_vec, limit=3)
-            
-            if l3_matches:
-                context_blocks.append("## [L3] SEMANTIC MEMORY ANCHORS")
-                for sid, rid, text, metadata, sim in l3_matches:
-                    provenance = self._get_l0_provenance(rid)
-                    block = f"### RECORD: {rid}\n"
-                    block += f"Evidence: {text}\n"
-                    block += f"Grounding: Semantic match (score: {sim:.4f})\n"
-                    block += f"L0 Provenance: {json.dumps(provenance)}\n"
-                    context_blocks.append(block)
-        except Exception as e:
-            print(f"Postgres L3 Fetch Error: {e}")
-
-        # 4. Action Guardrails (Safety)
-        guardrails_block = (
-            "## [AGENT ACTION GUARDRAILS]\n"
-            "- MAXIMUM_FILES_MODIFIED: 3\n"
-            "- MAXIMUM_LOC_ADDED: 200\n"
-            "- FORBIDDEN_PATHS: ['.git/', 'venv/', '.keystore.*']\n"
-            "- REQUIRED_TESTS: Any new logic MUST include a corresponding unit or integration test.\n"
-            "- EVIDENCE_REQUIREMENT: Any proposed code change MUST cite at least one authoritative anchor (record ID) from the [L3] Semantic Memory Anchors section if available."
+    def _assemble(self, context_blocks, omitted, opts):
+        status = ["## [CONTEXT STATUS] PARTIAL\n- OMITTED_TIERS: " + ", ".join(omitted)] if omitted else []
+
+        # 4. Assembly: whole blocks by tier quota and score; status and guardrails are reserved
+        with _STAGE["assembly"].time():
+            packed = pack_blocks(
+                context_blocks, opts.token_budget, self.tokenizer,
+                reserved_head=status, reserved_tail=[GUARDRAILS_BLOCK], quotas=opts.tier_quotas,
+            )
+        return CompiledContext(
+            text=packed.text,
+            tokens_used=packed.tokens_used,
+            token_budget=opts.token_budget,
+            tier_tokens=packed.tier_tokens,
+            dropped_blocks=packed.dropped_blocks,
+            omitted_tiers=omitted,
+        )
+
+    def _fetch_l1_blocks(self, scope_ids):
+        """Level 1: Hot Symbols (Redis Ephemeral), merged across scopes in one round trip."""
+        return _l1_blocks(self.hot_symbols.fetch_merged(scope_ids))
+
+    def _fetch_l2_blocks(self, query, scope_ids, opts):
+        """Level 2: Bird's Eye View (L2 Digests), ranked against the query and zoomed in."""
+        query_vec = self.query_embeddings.encode(query)
+        return _l2_blocks(self.l2.get_digests(scope_ids, query_embedding=query_vec, limit=opts.l2_limit(), zoom=opts.l2_zoom))
+
+    def _fetch_l3_blocks(self, query, scope_ids, opts):
+        """Level 3: Semantic Retrieval (L3 Vector Index)."""
+        with _STAGE["encoding"].time():
+            query_vec = self.query_embeddings.encode(query)
+        matches = self.vs.search_l3(
+            scope_ids, query_vec, limit=opts.l3_candidates, recall=opts.recall, query_text=query, l3_filter=opts.l3_filter,
         )
-        context_blocks.append(guardrails_block)
-
-        # 5. Assembly & Truncation
-        full_context = "\n\n".join(context_blocks)
-        if len(full_context) > self.token_budget:
-            full_context = full_context[:self.token_budget] + "\n... [CONTEXT TRUNCATED]"
-            
-        return full_context
-
-    def _get_l0_provenance(self, record_id):
-        """Retrieves authoritative L0 provenance metadata."""
-        conn = get_db_connection()
-        try:
-            with conn.cursor() as cur:
-                cur.execute("SELECT provenance FROM records_l0 WHERE record_id = %s", (record_id,))
-                row = cur.fetchone()
-                return row[0] if row else {"error": "Provenance missing"}
-        finally:
-            conn.close()
+        with _STAGE["provenance"].time():
+            return _l3_blocks(matches)
+
+    async def _fetch_l1_blocks_async(self, scope_ids):
+        return _l1_blocks(await self.async_hot_symbols.fetch_merged(scope_ids))
+
+    async def _fetch_l2_blocks_async(self, query, scope_ids, opts):
+        query_vec = await asyncio.to_thread(self.query_embeddings.encode, query)
+        return _l2_blocks(await get_digests_async(scope_ids, query_embedding=query_vec, limit=opts.l2_limit(), zoom=opts.l2_zoom))
+
+    async def _fetch_l3_blocks_async(self, query, scope_ids, opts):
+        # Encoding is CPU work (a real model can take milliseconds); keep it off the loop
+        with _STAGE["encoding"].time():
+            query_vec = await asyncio.to_thread(self.query_embeddings.encode, query)
+        matches = await self.vs.search_l3_async(
+            scope_ids, query_vec, limit=opts.l3_candidates, recall=opts.recall, query_text=query, l3_filter=opts.l3_filter,
+        )
+        with _STAGE["provenance"].time():
+            return _l3_blocks(matches)
 
     def close(self):
         self.vs.close()
 
+    async def aclose(self):
+        if self.async_redis is not None:
+            await self.async_redis.aclose()
+        await close_async_clients()
+        await close_async_pool()
+
 if __name__ == "__main__":
     compiler = ContextCompiler()
     # Use the scope from Step 1744
@@ -1,14 +1,32 @@
 import psycopg2
-from psycopg2.extras import Json
+from psycopg2 import extensions
+from psycopg2.extras import Json, execute_values
+from psycopg2.pool import PoolError
 import os
 import sys
+import time
 import uuid
+import logging
+import threading
+from contextlib import contextmanager
 
 # Path for secure utility
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from utils.secret_utility import get_secret
+from core.context_cache import bump_generations
+from core.metrics import INGESTED_RECORDS, INGEST_ERRORS
+
+logger = logging.getLogger(__name__)
+
+# Pool sizing and recycling policy (overridable per deployment)
+POOL_MIN_SIZE = int(os.environ.get("VAULT_DB_POOL_MIN", "1"))
+POOL_MAX_SIZE = int(os.environ.get("VAULT_DB_POOL_MAX", "10"))
+POOL_MAX_LIFETIME = float(os.environ.get("VAULT_DB_POOL_MAX_LIFETIME", "1800"))
+POOL_HEALTH_CHECK_AFTER = float(os.environ.get("VAULT_DB_POOL_HEALTH_CHECK_AFTER", "30"))
+POOL_CHECKOUT_TIMEOUT = float(os.environ.get("VAULT_DB_POOL_CHECKOUT_TIMEOUT", "5"))
 
 def get_db_connection():
+    """Opens a dedicated (unpooled) connection. Prefer db_connection() on hot paths."""
     db_user = get_secret("VAULT_DB_USER")
     db_pass = get_secret("VAULT_DB_PASS")
     db_name = get_secret("VAULT_DB_NAME")
@@ -21,6 +39,248 @@ def get_db_connection():
         password=db_pass
     )
 
+class ConnectionPool:
+    """
+    Thread-safe, process-wide pool of Postgres connections.
+    Connections are health-checked after sitting idle, recycled once they exceed
+    their max lifetime, and always handed back with no transaction open.
+    """
+    def __init__(self, connect=get_db_connection, min_size=POOL_MIN_SIZE, max_size=POOL_MAX_SIZE,
+                 max_lifetime=POOL_MAX_LIFETIME, health_check_after=POOL_HEALTH_CHECK_AFTER,
+                 checkout_timeout=POOL_CHECKOUT_TIMEOUT, configure=None):
+        if max_size < 1 or min_size > max_size:
+            raise ValueError("Pool requires 1 <= max_size and min_size <= max_size")
+        self._connect = connect
+        self._configure = configure  # called once on each newly opened connection
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_lifetime = max_lifetime
+        self.health_check_after = health_check_after
+        self.checkout_timeout = checkout_timeout
+
+        self._cond = threading.Condition()
+        self._idle = []      # [(conn, last_used)] - LIFO keeps hot connections warm
+        self._born = {}      # id(conn) -> creation time
+        self._size = 0       # open connections, idle + checked out (+ being opened)
+        self._pid = os.getpid()
+        self._closed = False
+        self._counters = {
+            "connections_opened": 0,
+            "connections_closed": 0,
+            "checkouts": 0,
+            "checkout_waits": 0,
+            "checkout_timeouts": 0,
+            "health_check_failures": 0,
+            "lifetime_recycles": 0,
+        }
+        self._wait_time_total = 0.0
+
+    def open(self):
+        """Pre-fills the pool up to min_size connections."""
+        conns = []
+        try:
+            while True:
+                with self._cond:
+                    if self._size >= self.min_size:
+                        break
+                conns.append(self.getconn())
+        finally:
+            for conn in conns:
+                self.putconn(conn)
+
+    def getconn(self):
+        """Checks a connection out of the pool, blocking up to checkout_timeout."""
+        deadline = time.monotonic() + self.checkout_timeout
+        while True:
+            conn, last_used, must_open = None, None, False
+            with self._cond:
+                self._check_pid()
+                if self._closed:
+                    raise PoolError("connection pool is closed")
+                if not self._idle and self._size >= self.max_size:
+                    self._counters["checkout_waits"] += 1
+                    wait_start = time.monotonic()
+                    while not self._idle and self._size >= self.max_size:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._counters["checkout_timeouts"] += 1
+                            raise PoolError(
+                                f"connection pool exhausted ({self.max_size} in use) after {self.checkout_timeout}s"
+                            )
+                        self._cond.wait(remaining)
+                    self._wait_time_total += time.monotonic() - wait_start
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                else:
+                    self._size += 1
+                    must_open = True
+
+            if must_open:
+                try:
+                    conn = self._connect()
+                    if self._configure:
+                        self._configure(conn)
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._born[id(conn)] = time.monotonic()
+                    self._counters["connections_opened"] += 1
+                    self._counters["checkouts"] += 1
+                return conn
+
+            if self._is_expired(conn):
+                with self._cond:
+                    self._counters["lifetime_recycles"] += 1
+                self._discard(conn)
+                continue
+            if time.monotonic() - last_used >= self.health_check_after and not self._is_healthy(conn):
+                with self._cond:
+                    self._counters["health_check_failures"] += 1
+                self._discard(conn)
+                continue
+            with self._cond:
+                self._counters["checkouts"] += 1
+            return conn
+
+    def putconn(self, conn, discard=False):
+        """Returns a connection to the pool, resetting any open transaction."""
+        if not discard and not conn.closed and self._pid == os.getpid():
+            try:
+                if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                discard = True
+        else:
+            discard = True
+
+        if discard or self._closed or self._is_expired(conn):
+            self._discard(conn)
+            return
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """Context-managed checkout: `with pool.connection() as conn: ...`"""
+        conn = self.getconn()
+        try:
+            yield conn
+        except BaseException:
+            broken = conn.closed
+            if not broken:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    broken = True
+            self.putconn(conn, discard=broken)
+            raise
+        else:
+            self.putconn(conn)
+
+    def stats(self):
+        """Snapshot of pool occupancy and lifetime counters."""
+        with self._cond:
+            idle = len(self._idle)
+            checkout_waits = self._counters["checkout_waits"]
+            return {
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "size": self._size,
+                "idle": idle,
+                "in_use": self._size - idle,
+                "avg_checkout_wait_ms": (self._wait_time_total / checkout_waits * 1000) if checkout_waits else 0.0,
+                **self._counters,
+            }
+
+    def close(self):
+        """Closes idle connections; checked-out ones are closed as they come back."""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            self._discard(conn)
+
+    def _is_expired(self, conn):
+        born = self._born.get(id(conn))
+        return born is not None and time.monotonic() - born >= self.max_lifetime
+
+    def _is_healthy(self, conn):
+        if conn.closed:
+            return False
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, conn):
+        try:
+            if self._pid == os.getpid():
+                conn.close()
+        except psycopg2.Error:
+            pass
+        with self._cond:
+            if self._born.pop(id(conn), None) is not None:
+                self._size -= 1
+                self._counters["connections_closed"] += 1
+            self._cond.notify()
+
+    def _check_pid(self):
+        # Sockets inherited across fork() belong to the parent; start over without touching them.
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._idle = []
+            self._born = {}
+            self._size = 0
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _configure_connection(conn):
+    # Imported lazily: the codec pulls in numpy, which plain L0 callers don't need.
+    from core.vector_codec import register_vector_types
+    register_vector_types(conn)
+
+def get_pool():
+    """Returns the process-wide connection pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                pool = ConnectionPool(configure=_configure_connection)
+                try:
+                    pool.open()
+                except psycopg2.Error as e:
+                    logger.warning("connection pool warm-up failed, connecting lazily error=%s", e)
+                _pool = pool
+    return _pool
+
+@contextmanager
+def db_connection():
+    """Borrows a pooled connection for the duration of the `with` block."""
+    with get_pool().connection() as conn:
+        yield conn
+
+def pool_stats():
+    """Pool statistics, or an empty snapshot if nothing has touched the database yet."""
+    if _pool is None:
+        return {"min_size": POOL_MIN_SIZE, "max_size": POOL_MAX_SIZE, "size": 0, "idle": 0, "in_use": 0}
+    return _pool.stats()
+
+def close_pool():
+    """Closes the process-wide pool (server shutdown, end of a worker script)."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
 def sanitize_payload(d):
     """Recursively replaces NULL bytes (\x00) with a safe string."""
     if isinstance(d, str):
@@ -31,33 +291,35 @@ def sanitize_payload(d):
         return [sanitize_payload(x) for x in d]
     return d
 
+def _l0_row(record, scope_type):
+    """Column tuple for a records_l0 insert (payload sanitized)."""
+    # Extract source from provenance
+    source = record.provenance.source if record.provenance else 'unknown'
+    return (
+        record.record_id, scope_type, record.scope_id, record.record_type, source, record.path,
+        record.start_line, record.end_line, Json(sanitize_payload(record.payload)),
+        record.confidence, Json(record.provenance.__dict__)
+    )
+
+_L0_COLUMNS = """
+    record_id, scope_type, scope_id, record_type, source, path, start_line, end_line,
+    payload, confidence_hint, provenance
+"""
+
 def insert_l0_record(record):
     """Inserts a MemoryRecord object into the L0 table and logs an event."""
-    # Sanitize payload before database insertion
-    sanitized_payload = sanitize_payload(record.payload)
-    
-    conn = get_db_connection()
     try:
-        with conn.cursor() as cur:
+        with db_connection() as conn, conn.cursor() as cur:
             # Determine scope_type
             cur.execute("SELECT scope_type FROM scopes WHERE scope_id = %s", (record.scope_id,))
             row = cur.fetchone()
             scope_type = row[0] if row else 'workspace'
             
-            # Extract source from provenance
-            source = record.provenance.source if record.provenance else 'unknown'
-            
             # 1. Insert Ingest record
-            cur.execute("""
-                INSERT INTO records_l0 (
-                    record_id, scope_type, scope_id, record_type, source, path, start_line, end_line, 
-                    payload, confidence_hint, provenance
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """, (
-                record.record_id, scope_type, record.scope_id, record.record_type, source, record.path, 
-                record.start_line, record.end_line, Json(sanitized_payload), 
-                record.confidence, Json(record.provenance.__dict__)
-            ))
+            cur.execute(
+                f"INSERT INTO records_l0 ({_L0_COLUMNS}) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)",
+                _l0_row(record, scope_type)
+            )
             
             # 2. Add to event log for dreaming
             # We assume version 1 for initial ingest entries
@@ -67,13 +329,88 @@ def insert_l0_record(record):
             """, (record.record_id,))
             
             conn.commit()
-            return True
+        bump_generations([record.scope_id])
+        INGESTED_RECORDS.labels("single").inc()
+        return True
     except Exception as e:
-        print(f"Database error during ingest: {e}")
-        conn.rollback()
+        logger.error("ingest failed record_id=%s error=%s", record.record_id, e)
+        INGEST_ERRORS.labels("single").inc()
         return False
-    finally:
-        conn.close()
+
+def insert_l0_records(records, page_size=500):
+    """
+    Bulk variant of insert_l0_record: writes all records and their event_log entries
+    with multi-row VALUES in a single transaction. The batch is all-or-nothing.
+    Returns the number of records written (0 on failure).
+    """
+    if not records:
+        return 0
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            # Determine scope_type once per distinct scope
+            scope_ids = list({str(uuid.UUID(str(r.scope_id))) for r in records})
+            cur.execute(
+                "SELECT scope_id::text, scope_type FROM scopes WHERE scope_id = ANY(%s::uuid[])",
+                (scope_ids,)
+            )
+            scope_types = dict(cur.fetchall())
+
+            rows = [
+                _l0_row(r, scope_types.get(str(uuid.UUID(str(r.scope_id))), 'workspace'))
+                for r in records
+            ]
+            execute_values(cur, f"INSERT INTO records_l0 ({_L0_COLUMNS}) VALUES %s", rows, page_size=page_size)
+            execute_values(
+                cur,
+                "INSERT INTO event_log (record_id, action, version) VALUES %s",
+                [(r.record_id,) for r in records],
+                template="(%s, 'upsert', 1)",
+                page_size=page_size
+            )
+
+            conn.commit()
+        bump_generations(scope_ids)
+        INGESTED_RECORDS.labels("batch").inc(len(records))
+        return len(records)
+    except Exception as e:
+        logger.error("batch ingest failed records=%d error=%s", len(records), e)
+        INGEST_ERRORS.labels("batch").inc()
+        return 0
+
+def event_log_status(window_seconds=300):
+    """
+    Dream lag telemetry: pending backlog, age of the oldest pending event, the
+    processing rate over the last `window_seconds` and dead-lettered events (served
+    by the event_log indexes).
+    """
+    with db_connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT count(*) FROM event_log WHERE processed_at IS NULL")
+        backlog = cur.fetchone()[0]
+        cur.execute("""
+            SELECT event_id, EXTRACT(EPOCH FROM now() - created_at)
+            FROM event_log WHERE processed_at IS NULL
+            ORDER BY event_id LIMIT 1
+        """)
+        oldest = cur.fetchone()
+        cur.execute(
+            "SELECT count(*) FROM event_log WHERE processed_at >= now() - make_interval(secs => %s)",
+            (window_seconds,)
+        )
+        processed = cur.fetchone()[0]
+        cur.execute("SELECT count(*) FROM event_log WHERE error IS NOT NULL")
+        failed = cur.fetchone()[0]
+        conn.rollback()
+    rate = processed / window_seconds if window_seconds else 0.0
+    return {
+        "backlog": backlog,
+        "oldest_pending_event_id": oldest[0] if oldest else None,
+        "oldest_pending_age_seconds": float(oldest[1]) if oldest else 0.0,
+        "processed_in_window": processed,
+        "failed": failed,
+        "window_seconds": window_seconds,
+        "events_per_sec": rate,
+        "estimated_drain_seconds": backlog / rate if rate else None,
+    }
 
 if __name__ == "__main__":
     from core.models import MemoryRecord, Provenance
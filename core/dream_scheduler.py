@@ -0,0 +1,159 @@
+import os
+import time
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# A run starts once triggers have been quiet for DEBOUNCE seconds, but never later
+# than MAX_DELAY seconds after the first trigger it absorbs (so a steady stream of
+# ingests still gets dreamt).
+DREAM_DEBOUNCE_SECONDS = float(os.environ.get("VAULT_DREAM_DEBOUNCE_MS", "250")) / 1000
+DREAM_MAX_DELAY_SECONDS = float(os.environ.get("VAULT_DREAM_MAX_DELAY_MS", "2000")) / 1000
+# Dream runs allowed at once in this process
+DREAM_MAX_CONCURRENT = int(os.environ.get("VAULT_DREAM_MAX_CONCURRENT", "1"))
+# How long POST /dream with sync=True waits for its run
+DREAM_SYNC_TIMEOUT = float(os.environ.get("VAULT_DREAM_SYNC_TIMEOUT", "300"))
+
+class DreamScheduler:
+    """
+    Coalesces dream triggers into runs of `jobs` (callables, executed in order) on a
+    fixed set of worker threads. Any number of triggers that arrive while a run is
+    debouncing collapse into it; triggers that arrive while one is running are
+    picked up by the next run, so no trigger is lost and at most `max_concurrent`
+    runs overlap.
+    """
+    def __init__(self, jobs, debounce=DREAM_DEBOUNCE_SECONDS, max_delay=DREAM_MAX_DELAY_SECONDS,
+                 max_concurrent=DREAM_MAX_CONCURRENT):
+        self.jobs = list(jobs)
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.max_concurrent = max(1, max_concurrent)
+        self._cond = threading.Condition()
+        self._threads = []
+        self._stopping = False
+        self._pending = 0            # triggers not yet absorbed by a run (queue depth)
+        self._first_trigger = None   # monotonic time of the oldest pending trigger
+        self._quiet_at = 0.0         # pending triggers are quiet after this
+        self._run_by = 0.0           # ...but must start by this
+        self._requested = 0          # trigger sequence number
+        self._claimed = 0            # highest sequence number taken by a run
+        self._completed = 0          # every trigger up to this one has been run
+        self._in_flight = set()      # first sequence number of each running claim
+        self._running = 0
+        self.stats = {
+            "triggers": 0,
+            "runs": 0,
+            "coalesced": 0,
+            "errors": 0,
+            "last_error": None,
+            "last_run_at": None,
+            "last_run_triggers": 0,
+            "last_run_duration_ms": 0.0,
+            "last_trigger_to_done_ms": 0.0,
+        }
+
+    def trigger(self, immediate=False):
+        """Requests a run; returns the trigger's sequence number (see wait())."""
+        now = time.monotonic()
+        with self._cond:
+            self.stats["triggers"] += 1
+            self._requested += 1
+            if not self._pending:
+                self._first_trigger = now
+                self._run_by = now + self.max_delay
+            self._pending += 1
+            self._quiet_at = now + self.debounce
+            if immediate:
+                self._run_by = now
+            self._cond.notify_all()
+            return self._requested
+
+    def wait(self, seq, timeout=None):
+        """Blocks until a run covering trigger `seq` has finished. False on timeout."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._completed >= seq or self._stopping, timeout)
+            return self._completed >= seq
+
+    def run_now(self, timeout=None):
+        """Triggers a run without debouncing and waits for it."""
+        return self.wait(self.trigger(immediate=True), timeout)
+
+    def start(self):
+        with self._cond:
+            self._stopping = False
+            self._threads = [t for t in self._threads if t.is_alive()]
+            while len(self._threads) < self.max_concurrent:
+                t = threading.Thread(target=self._loop, name=f"dream-{len(self._threads)}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def stop(self, timeout=None):
+        """Stops accepting work; waits for in-flight runs up to `timeout` seconds."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        for t in self._threads:
+            t.join(timeout)
+
+    def _claim(self):
+        """Waits out the debounce window, then takes every pending trigger. None = stop."""
+        with self._cond:
+            while True:
+                if self._stopping:
+                    return None
+                if not self._pending:
+                    self._cond.wait()
+                    continue
+                now = time.monotonic()
+                start_at = min(self._quiet_at, self._run_by)
+                if now < start_at:
+                    self._cond.wait(start_at - now)
+                    continue
+                claimed, first = self._pending, self._first_trigger
+                lo = self._claimed + 1
+                self._claimed = self._requested
+                self._in_flight.add(lo)
+                self._pending = 0
+                self._running += 1
+                self.stats["coalesced"] += claimed - 1
+                return lo, claimed, first
+
+    def _loop(self):
+        while True:
+            claim = self._claim()
+            if claim is None:
+                return
+            lo, claimed, first_trigger = claim
+            started = time.monotonic()
+            error = None
+            for job in self.jobs:
+                try:
+                    job()
+                except Exception as e:
+                    error = f"{getattr(job, '__name__', job)}: {e}"
+                    logger.error("dream job failed job=%s error=%s", getattr(job, "__name__", job), e)
+            finished = time.monotonic()
+            with self._cond:
+                self._running -= 1
+                self._in_flight.discard(lo)
+                # With several workers a later claim can finish first; only advance past
+                # triggers whose runs are all done.
+                self._completed = min(self._in_flight) - 1 if self._in_flight else self._claimed
+                self.stats.update(
+                    runs=self.stats["runs"] + 1,
+                    last_run_at=time.time(),
+                    last_run_triggers=claimed,
+                    last_run_duration_ms=(finished - started) * 1000,
+                    last_trigger_to_done_ms=(finished - first_trigger) * 1000,
+                )
+                if error:
+                    self.stats["errors"] += 1
+                    self.stats["last_error"] = error
+                self._cond.notify_all()
+
+    def snapshot(self):
+        """Counters plus current queue depth and in-flight runs."""
+        with self._cond:
+            return dict(self.stats, pending_triggers=self._pending, running=self._running,
+                        max_concurrent=self.max_concurrent)
@@ -0,0 +1,157 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Protocol, Sequence, runtime_checkable
+import numpy as np
+
+# Embedding width of the l3_snippets / l2_digests VECTOR columns
+EMBEDDING_DIM = 1536
+# "mock" or "sentence-transformers:<model name or path>"
+ENCODER = os.environ.get("VAULT_ENCODER", "mock")
+# Query embeddings kept by the context compiler
+QUERY_EMBEDDING_CACHE_SIZE = int(os.environ.get("VAULT_QUERY_EMBEDDING_CACHE_SIZE", "2048"))
+
+@runtime_checkable
+class Encoder(Protocol):
+    """
+    Text -> embedding. encode_batch is the primary entry point and returns an
+    (n, dimension) float32 array of unit vectors; encode(text) is encode_batch([text])[0].
+    """
+    dimension: int
+
+    def encode(self, text: str) -> np.ndarray: ...
+
+    def encode_batch(self, texts: Sequence[str]) -> np.ndarray: ...
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+class MockEncoder:
+    """
+    Stable pseudo-random embeddings for dev/tests, computed for a whole batch at once.
+    Each text is hashed to a 64-bit seed; component j is splitmix64(seed + j * GAMMA)
+    turned into a standard normal with Box-Muller, so there is no per-text RNG state.
+    """
+    _GAMMA = np.uint64(0x9E3779B97F4A7C15)
+
+    def __init__(self, dimension=EMBEDDING_DIM):
+        self.dimension = dimension
+        self._offsets = np.arange(1, dimension + 1, dtype=np.uint64) * self._GAMMA
+
+    def encode(self, text):
+        """Generates a stable mock embedding for a given text."""
+        return self.encode_batch([text])[0]
+
+    def encode_batch(self, texts):
+        seeds = np.array(
+            [int.from_bytes(hashlib.md5(t.encode()).digest()[:8], "little") for t in texts],
+            dtype=np.uint64,
+        )
+        with np.errstate(over="ignore"):
+            z = seeds[:, None] + self._offsets[None, :]
+            z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+            z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+            z = z ^ (z >> np.uint64(31))
+        # Two 32-bit uniforms per component; u1 in (0, 1] keeps log() finite
+        u1 = ((z >> np.uint64(32)).astype(np.float64) + 1.0) / 2.0**32
+        u2 = (z & np.uint64(0xFFFFFFFF)).astype(np.float64) / 2.0**32
+        normal = np.sqrt(-2.0 * np.log(u1)) * np.cos(2.0 * np.pi * u2)
+        return _normalize_rows(normal).astype(np.float32)
+
+class SentenceTransformerEncoder:
+    """
+    Local model via sentence-transformers (optional dependency, loaded lazily).
+    Embeddings narrower than `dimension` are zero-padded to fit the VECTOR(1536)
+    columns; padding leaves cosine similarity unchanged.
+    """
+    def __init__(self, model_name, dimension=EMBEDDING_DIM, batch_size=64, device=None):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise ImportError("SentenceTransformerEncoder needs `pip install sentence-transformers`") from e
+        self.model = SentenceTransformer(model_name, device=device)
+        self.model_dimension = self.model.get_sentence_embedding_dimension()
+        if self.model_dimension > dimension:
+            raise ValueError(f"{model_name} produces {self.model_dimension}-d embeddings; columns hold {dimension}")
+        self.dimension = dimension
+        self.batch_size = batch_size
+
+    def encode(self, text):
+        return self.encode_batch([text])[0]
+
+    def encode_batch(self, texts):
+        out = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        if len(texts):
+            out[:, :self.model_dimension] = self.model.encode(
+                list(texts), batch_size=self.batch_size, normalize_embeddings=True, convert_to_numpy=True,
+            )
+        return out
+
+_encoder = None
+_encoder_lock = threading.Lock()
+
+def get_encoder(spec=None):
+    """
+    Process-wide encoder from VAULT_ENCODER (or `spec`), so a local model is loaded once.
+    An explicit `spec` always builds a new instance.
+    """
+    global _encoder
+    if spec is None and _encoder is not None:
+        return _encoder
+    name = spec or ENCODER
+    if name == "mock":
+        encoder = MockEncoder()
+    elif name.startswith("sentence-transformers:"):
+        encoder = SentenceTransformerEncoder(name.split(":", 1)[1])
+    else:
+        raise ValueError(f"Unknown encoder: {name}")
+    if spec is None:
+        with _encoder_lock:
+            if _encoder is None:
+                _encoder = encoder
+            encoder = _encoder
+    return encoder
+
+class QueryEmbeddingCache:
+    """Bounded LRU in front of an encoder for repeated query strings."""
+    def __init__(self, encoder, max_entries=QUERY_EMBEDDING_CACHE_SIZE):
+        self.encoder = encoder
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._pending = {}  # text -> Event set once its in-flight encode finishes
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def encode(self, text):
+        while True:
+            with self._lock:
+                vec = self._entries.get(text)
+                if vec is not None:
+                    self._entries.move_to_end(text)
+                    self.stats["hits"] += 1
+                    return vec
+                # The L2 and L3 tiers encode the same query concurrently; one encodes, the other waits
+                pending = self._pending.get(text)
+                if pending is None:
+                    pending = self._pending[text] = threading.Event()
+                    self.stats["misses"] += 1
+                    break
+            pending.wait()
+        try:
+            vec = self.encoder.encode(text)
+            vec.setflags(write=False)  # shared between requests
+            with self._lock:
+                self._entries[text] = vec
+                self._entries.move_to_end(text)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.stats["evictions"] += 1
+            return vec
+        finally:
+            # On failure waiters retry (and encode themselves)
+            with self._lock:
+                self._pending.pop(text, None)
+            pending.set()
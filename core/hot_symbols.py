@@ -0,0 +1,383 @@
+import os
+import sys
+import time
+import uuid
+import threading
+import logging
+import redis
+
+# Path for core modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from core.context_cache import generation_key, _get_default_async_client
+
+logger = logging.getLogger(__name__)
+
+# Delta value that removes a symbol from the merged view
+TOMBSTONE = "__DELETE__"
+
+# Compaction policy: fold a scope's delta once it holds this many fields or is this old
+COMPACT_DELTA_THRESHOLD = int(os.environ.get("VAULT_L1_COMPACT_THRESHOLD", "200"))
+COMPACT_MAX_DELTA_AGE = float(os.environ.get("VAULT_L1_COMPACT_MAX_AGE", "300"))
+# Superseded base snapshots are kept this long for inspection/rollback
+BASE_RETENTION_SECONDS = int(os.environ.get("VAULT_L1_BASE_RETENTION", "86400"))
+COMPACTION_LOCK_MS = 30000
+
+# Key layout per scope:
+#   hot_symbols:{scope}:version          -> N, the live base generation (absent = legacy :base)
+#   hot_symbols:{scope}:base:{N}         -> base snapshot generation N
+#   hot_symbols:{scope}:delta            -> live overlay written by POST /hot_symbols
+#   hot_symbols:{scope}:delta:compacting -> overlay frozen by an in-flight compaction
+#   hot_symbols:{scope}:delta_since      -> unix time of the oldest uncompacted delta write
+#   hot_symbols:{scope}:compacted_at     -> unix time of the last completed compaction
+
+# Merges base + frozen delta + live delta (with tombstones) for every scope
+# server-side and returns the final map as a flat [k1, v1, k2, v2, ...] list.
+# KEYS come in (version, base:N, frozen delta, delta) groups in scope order, with the
+# base keys resolved by the caller from the version pointers it last saw (ARGV[2..]),
+# so the script only touches declared keys. If a compaction has moved a pointer since,
+# nothing is read and nil is returned: the caller re-reads the pointers and retries.
+# Later scopes override earlier ones, and keys keep the position of their first
+# appearance (same result as the Python merge below).
+_MERGE_LUA = """
+for i = 1, #KEYS, 4 do
+  if (redis.call('GET', KEYS[i]) or '0') ~= ARGV[(i + 3) / 4 + 1] then return false end
+end
+local order, merged = {}, {}
+for i = 1, #KEYS, 4 do
+  local scope_order, scope = {}, {}
+  local function overlay(fields, tombstones)
+    for j = 1, #fields, 2 do
+      local k, v = fields[j], fields[j + 1]
+      if scope[k] == nil then table.insert(scope_order, k) end
+      if tombstones and v == ARGV[1] then scope[k] = false else scope[k] = v end
+    end
+  end
+  overlay(redis.call('HGETALL', KEYS[i + 1]), false)
+  overlay(redis.call('HGETALL', KEYS[i + 2]), true)
+  overlay(redis.call('HGETALL', KEYS[i + 3]), true)
+  for _, k in ipairs(scope_order) do
+    local v = scope[k]
+    if v then
+      if merged[k] == nil then table.insert(order, k) end
+      merged[k] = v
+    end
+  end
+end
+local out = {}
+for _, k in ipairs(order) do
+  out[#out + 1] = k
+  out[#out + 1] = merged[k]
+end
+return out
+"""
+
+# Compaction step 1: freeze the live delta so new writes start a fresh one.
+# KEYS: version, delta, frozen, delta_since. Returns the live base version (0 = legacy).
+# A frozen delta left by a crashed run is reused, not overwritten.
+_FREEZE_LUA = """
+if redis.call('EXISTS', KEYS[3]) == 0 then
+  if redis.call('EXISTS', KEYS[2]) == 0 then return -1 end
+  redis.call('RENAME', KEYS[2], KEYS[3])
+  redis.call('DEL', KEYS[4])
+end
+return tonumber(redis.call('GET', KEYS[1]) or '0')
+"""
+
+# Compaction step 2: publish the new base. KEYS: version, frozen, compacted_at, old base.
+# ARGV: expected version, new version, now, retention seconds.
+_SWAP_LUA = """
+if tonumber(redis.call('GET', KEYS[1]) or '0') ~= tonumber(ARGV[1]) then return 0 end
+redis.call('SET', KEYS[1], ARGV[2])
+redis.call('DEL', KEYS[2])
+redis.call('SET', KEYS[3], ARGV[3])
+redis.call('EXPIRE', KEYS[4], tonumber(ARGV[4]))
+return 1
+"""
+
+_RELEASE_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('DEL', KEYS[1]) end
+return 0
+"""
+
+def _key(scope_id, suffix):
+    return f"hot_symbols:{scope_id}:{suffix}"
+
+def base_key(scope_id, version=0):
+    """Base snapshot key; version 0 is the pre-versioning `:base` hash."""
+    return _key(scope_id, f"base:{version}" if version else "base")
+
+def delta_key(scope_id):
+    return _key(scope_id, "delta")
+
+def frozen_delta_key(scope_id):
+    return _key(scope_id, "delta:compacting")
+
+def version_key(scope_id):
+    return _key(scope_id, "version")
+
+def scope_key_pattern(scope_id):
+    """SCAN pattern matching every key of the scope's layout above."""
+    return _key(scope_id, "*")
+
+def merge_symbols(base, delta):
+    """Applies a delta overlay (with tombstones) on top of a base snapshot."""
+    merged = dict(base or {})
+    for k, v in (delta or {}).items():
+        if v == TOMBSTONE:
+            merged.pop(k, None)
+        else:
+            merged[k] = v
+    return merged
+
+def _merge_args(scope_ids, versions):
+    """KEYS and ARGV of _MERGE_LUA for the given base versions."""
+    keys = []
+    for scope_id, version in zip(scope_ids, versions):
+        keys += [version_key(scope_id), base_key(scope_id, version), frozen_delta_key(scope_id), delta_key(scope_id)]
+    return {"keys": keys, "args": [TOMBSTONE] + [str(v) for v in versions]}
+
+def _queue_snapshot(pipe, scope_ids, versions):
+    for scope_id, version in zip(scope_ids, versions):
+        pipe.get(version_key(scope_id))
+        pipe.hgetall(base_key(scope_id, version))
+        pipe.hgetall(frozen_delta_key(scope_id))
+        pipe.hgetall(delta_key(scope_id))
+    return pipe
+
+def _merge_snapshot(replies):
+    aggregated = {}
+    for i in range(0, len(replies), 4):
+        base, frozen, delta = replies[i + 1:i + 4]
+        aggregated.update(merge_symbols(merge_symbols(base, frozen), delta))
+    return aggregated
+
+def _queue_delta_write(pipe, scope_id, symbols):
+    pipe.hset(delta_key(scope_id), mapping=symbols)
+    pipe.set(_key(scope_id, "delta_since"), int(time.time()), nx=True)
+    pipe.incr(generation_key(scope_id))  # invalidates cached context for this scope
+    pipe.hlen(delta_key(scope_id))
+    return pipe
+
+class HotSymbolStore:
+    """
+    L1 hot-symbol access. Reads resolve base + delta + tombstones for all requested
+    scopes in a single round trip: a server-side Lua merge by default, or pipelined
+    MULTI/EXEC snapshots if scripting is unavailable. Bases are versioned and swapped
+    in by compact() through a version pointer.
+    """
+    def __init__(self, client, use_lua=True):
+        self.redis = client
+        self.use_lua = use_lua
+        self._versions = {}  # scope -> base version last seen, so a merge is one round trip
+        self._merge = client.register_script(_MERGE_LUA)
+        self._freeze = client.register_script(_FREEZE_LUA)
+        self._swap = client.register_script(_SWAP_LUA)
+        self._release = client.register_script(_RELEASE_LUA)
+
+    def fetch_merged(self, scope_ids):
+        """Final symbol map across scopes (later scopes override earlier ones)."""
+        if not scope_ids:
+            return {}
+        if self.use_lua:
+            try:
+                versions = [self._versions.get(s, 0) for s in scope_ids]
+                while True:
+                    flat = self._merge(**_merge_args(scope_ids, versions))
+                    if flat is not None:
+                        return dict(zip(flat[::2], flat[1::2]))
+                    # A compaction moved a version pointer; re-read them and retry
+                    versions = [int(v or 0) for v in self.redis.mget([version_key(s) for s in scope_ids])]
+                    self._versions.update(zip(scope_ids, versions))
+            except redis.exceptions.ResponseError as e:
+                # e.g. scripting disabled/ACL-restricted: keep serving via the pipeline
+                logger.warning("L1 lua merge unavailable, using pipeline error=%s", e)
+                self.use_lua = False
+        return self.fetch_merged_pipelined(scope_ids)
+
+    def fetch_merged_pipelined(self, scope_ids):
+        """Two round trips: read version pointers, then snapshot every hash atomically."""
+        versions = [int(v or 0) for v in self.redis.mget([version_key(s) for s in scope_ids])]
+        while True:
+            replies = _queue_snapshot(self.redis.pipeline(transaction=True), scope_ids, versions).execute()
+            current = [int(v or 0) for v in replies[::4]]
+            if current == versions:
+                return _merge_snapshot(replies)
+            versions = current  # a compaction swapped in between; re-read the new bases
+
+    def write_delta(self, scope_id, symbols):
+        """
+        Overlays symbols for a scope (use TOMBSTONE as a value to delete one).
+        Returns the live delta size so callers can trigger compaction on threshold.
+        """
+        return _queue_delta_write(self.redis.pipeline(transaction=True), scope_id, symbols).execute()[-1]
+
+    def compact(self, scope_id):
+        """
+        Folds delta into a new versioned base and drops tombstones:
+          1. freeze the live delta (atomic RENAME; new writes start a fresh delta),
+          2. build base:{N+1} = base:{N} + frozen delta, invisible to readers,
+          3. atomically point the version at N+1 and drop the frozen delta.
+        Readers see base:N + frozen + delta before the swap and base:N+1 + delta after,
+        which are the same map. Returns the new version, or None if nothing to do.
+        """
+        lock_key = _key(scope_id, "compaction_lock")
+        token = uuid.uuid4().hex
+        if not self.redis.set(lock_key, token, nx=True, px=COMPACTION_LOCK_MS):
+            return None
+        try:
+            version = self._freeze(keys=[
+                version_key(scope_id), delta_key(scope_id),
+                frozen_delta_key(scope_id), _key(scope_id, "delta_since"),
+            ])
+            if version < 0:
+                return None
+            new_version = version + 1
+            merged = merge_symbols(
+                self.redis.hgetall(base_key(scope_id, version)),
+                self.redis.hgetall(frozen_delta_key(scope_id)),
+            )
+            pipe = self.redis.pipeline(transaction=True)
+            pipe.delete(base_key(scope_id, new_version))
+            if merged:
+                pipe.hset(base_key(scope_id, new_version), mapping=merged)
+            pipe.execute()
+            swapped = self._swap(
+                keys=[version_key(scope_id), frozen_delta_key(scope_id),
+                      _key(scope_id, "compacted_at"), base_key(scope_id, version)],
+                args=[version, new_version, int(time.time()), BASE_RETENTION_SECONDS],
+            )
+            return new_version if swapped else None
+        finally:
+            self._release(keys=[lock_key], args=[token])
+
+    def compaction_status(self, scope_id):
+        """Delta size and compaction lag for one scope."""
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.get(version_key(scope_id))
+        pipe.hlen(delta_key(scope_id))
+        pipe.hlen(frozen_delta_key(scope_id))
+        pipe.get(_key(scope_id, "delta_since"))
+        pipe.get(_key(scope_id, "compacted_at"))
+        version, delta_size, frozen_size, delta_since, compacted_at = pipe.execute()
+        now = time.time()
+        return {
+            "scope_id": scope_id,
+            "base_version": int(version or 0),
+            "base_size": self.redis.hlen(base_key(scope_id, int(version or 0))),
+            "delta_size": delta_size,
+            "compaction_in_progress": frozen_size > 0,
+            "compaction_lag_seconds": (now - int(delta_since)) if delta_since else 0.0,
+            "last_compacted_at": int(compacted_at) if compacted_at else None,
+        }
+
+    def needs_compaction(self, status):
+        return status["delta_size"] >= COMPACT_DELTA_THRESHOLD or (
+            status["delta_size"] > 0 and status["compaction_lag_seconds"] >= COMPACT_MAX_DELTA_AGE
+        )
+
+    def scopes_with_delta(self):
+        for key in self.redis.scan_iter(match="hot_symbols:*:delta", count=500):
+            yield key.split(":")[1]
+
+class AsyncHotSymbolStore:
+    """
+    HotSymbolStore reads/writes for a redis.asyncio client (request path).
+    Without a client, each event loop uses its own default client.
+    """
+    def __init__(self, client=None, use_lua=True):
+        self._client = client
+        self.use_lua = use_lua
+        self._versions = {}
+        self._merge = None
+
+    @property
+    def redis(self):
+        return self._client if self._client is not None else _get_default_async_client()
+
+    async def fetch_merged(self, scope_ids):
+        if not scope_ids:
+            return {}
+        if self.use_lua:
+            try:
+                client = self.redis
+                if self._merge is None or self._merge.registered_client is not client:
+                    self._merge = client.register_script(_MERGE_LUA)
+                versions = [self._versions.get(s, 0) for s in scope_ids]
+                while True:
+                    flat = await self._merge(**_merge_args(scope_ids, versions))
+                    if flat is not None:
+                        return dict(zip(flat[::2], flat[1::2]))
+                    versions = [int(v or 0) for v in await client.mget([version_key(s) for s in scope_ids])]
+                    self._versions.update(zip(scope_ids, versions))
+            except redis.exceptions.ResponseError as e:
+                logger.warning("L1 lua merge unavailable, using pipeline error=%s", e)
+                self.use_lua = False
+        return await self.fetch_merged_pipelined(scope_ids)
+
+    async def fetch_merged_pipelined(self, scope_ids):
+        versions = [int(v or 0) for v in await self.redis.mget([version_key(s) for s in scope_ids])]
+        while True:
+            replies = await _queue_snapshot(self.redis.pipeline(transaction=True), scope_ids, versions).execute()
+            current = [int(v or 0) for v in replies[::4]]
+            if current == versions:
+                return _merge_snapshot(replies)
+            versions = current
+
+    async def write_delta(self, scope_id, symbols):
+        return (await _queue_delta_write(self.redis.pipeline(transaction=True), scope_id, symbols).execute())[-1]
+
+class L1CompactionWorker:
+    """Periodically compacts every scope whose delta crossed the size or age threshold."""
+    def __init__(self, store, interval=30.0):
+        self.store = store
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self.stats = {
+            "compactions": 0,
+            "errors": 0,
+            "last_run_at": None,
+            "last_run_duration_ms": 0.0,
+            "max_delta_size": 0,
+            "max_compaction_lag_seconds": 0.0,
+        }
+
+    def run_once(self):
+        """One sweep over all scopes with a live delta. Returns the scopes compacted."""
+        started = time.monotonic()
+        compacted, max_size, max_lag = [], 0, 0.0
+        for scope_id in set(self.store.scopes_with_delta()):
+            try:
+                status = self.store.compaction_status(scope_id)
+                max_size = max(max_size, status["delta_size"])
+                max_lag = max(max_lag, status["compaction_lag_seconds"])
+                if self.store.needs_compaction(status) and self.store.compact(scope_id) is not None:
+                    compacted.append(scope_id)
+            except redis.exceptions.RedisError as e:
+                self.stats["errors"] += 1
+                logger.error("L1 compaction failed scope=%s error=%s", scope_id, e)
+        self.stats.update(
+            compactions=self.stats["compactions"] + len(compacted),
+            last_run_at=time.time(),
+            last_run_duration_ms=(time.monotonic() - started) * 1000,
+            max_delta_size=max_size,
+            max_compaction_lag_seconds=max_lag,
+        )
+        return compacted
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="l1-compaction", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except redis.exceptions.RedisError as e:
+                self.stats["errors"] += 1
+                logger.error("L1 compaction sweep failed error=%s", e)
@@ -1,55 +1,190 @@
 import os
 import sys
 import json
+import uuid
+import logging
 from datetime import datetime
 
 # Path for core modules
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from core.db import get_db_connection
-from core.vector_store import MockEncoder
+from core.db import db_connection
+from core.encoders import get_encoder
+from core.vector_codec import copy_binary, vector_literal
+
+logger = logging.getLogger(__name__)
+
+DIGEST_COPY_COLUMNS = (
+    ("digest_id", "uuid"), ("scope_id", "uuid"), ("lod_level", "text"),
+    ("parent_id", "uuid"), ("text", "text"), ("embedding", "vector"), ("version", "int8"),
+)
+
+# The L2 pyramid, coarsest first. A digest's parent_id points one level up.
+LOD_LEVELS = ("session", "subsystem", "module", "file", "chunk")
+# Lines per chunk digest: chunk i of a file covers lines [i * L2_CHUNK_LINES, (i + 1) * L2_CHUNK_LINES)
+L2_CHUNK_LINES = int(os.environ.get("VAULT_L2_CHUNK_LINES", "100"))
+# Pyramid digests get stable ids from (scope, level, key), so a rebuild updates in place
+# and a child can name its parent before either is written
+DIGEST_NAMESPACE = uuid.UUID("5f1c2b7e-3a4d-4c1e-9b8a-6d2f0e4a7c31")
+# Digest rank = (1 - w) * cosine similarity to the query + w * recency, where recency
+# halves every VAULT_L2_RECENCY_HALF_LIFE_HOURS since the digest was last updated
+L2_RECENCY_WEIGHT = float(os.environ.get("VAULT_L2_RECENCY_WEIGHT", "0.2"))
+L2_RECENCY_HALF_LIFE_HOURS = float(os.environ.get("VAULT_L2_RECENCY_HALF_LIFE_HOURS", "168"))
+# Digests returned when the caller gives no limit
+L2_DEFAULT_LIMIT = int(os.environ.get("VAULT_L2_DEFAULT_LIMIT", "50"))
+
+def chunk_key(path, index):
+    return f"{path}#{index}"
+
+def chunk_lines(key):
+    """(path, first line, last line) of a chunk key."""
+    path, _, index = key.rpartition("#")
+    start = int(index) * L2_CHUNK_LINES
+    return path, start, start + L2_CHUNK_LINES - 1
+
+def parent_of(level, key):
+    """
+    (level, key) of a digest's parent, None for the session digest. Keys are the
+    chunk key, the file path, its directory ("." at the root), the first path
+    component of that directory, and "" for the scope's session digest.
+    """
+    if level == "chunk":
+        return "file", key.rpartition("#")[0]
+    if level == "file":
+        return "module", os.path.dirname(key) or "."
+    if level == "module":
+        return "subsystem", key.split("/", 1)[0] if key != "." else "."
+    if level == "subsystem":
+        return "session", ""
+    return None
+
+def affected_digests(changes):
+    """
+    {level: set of keys} touched by changed L0 records given as (path, start_line,
+    end_line): their chunks (records with line ranges) and every ancestor. Records
+    without a path only touch the session digest.
+    """
+    affected = {level: set() for level in LOD_LEVELS}
+    affected["session"].add("")
+    for path, start_line, end_line in changes:
+        if not path:
+            continue
+        if start_line is not None:
+            end_line = max(end_line if end_line is not None else start_line, start_line)
+            for index in range(start_line // L2_CHUNK_LINES, end_line // L2_CHUNK_LINES + 1):
+                affected["chunk"].add(chunk_key(path, index))
+        node = ("file", path)
+        while node:
+            affected[node[0]].add(node[1])
+            node = parent_of(*node)
+    return affected
+
+def digest_uuid(scope_id, level, key):
+    return str(uuid.uuid5(DIGEST_NAMESPACE, f"{scope_id}:{level}:{key}"))
+
+_RECENCY = "exp(-ln(2) * extract(epoch FROM now() - updated_at) / ({half_life}::float8 * 3600))"
+
+def digest_query(levels, ranked, parent_ids=False):
+    """
+    SQL template for ranked, bounded digest retrieval; placeholders are {name}s for
+    render_params. With several `levels` it zooms: level 0 ranks that level's digests,
+    and each deeper level only ranks the children (parent_id, served by idx_l2_parent)
+    of the digests picked one level up, so the rows read follow the fan-out, not the
+    scope. Each level is guaranteed {quota} of the {limit} rows; the rest go to the
+    best remaining rows, coarsest first. Rows come coarsest level first, best first
+    within a level. `levels` may be [None] for any level.
+    """
+    if ranked:
+        score = f"(1 - {{weight}}::float8) * coalesce(1 - (embedding <=> {{vec}}::vector), 0) + {{weight}}::float8 * {_RECENCY}"
+    else:
+        score = _RECENCY
+    ctes, selects = [], []
+    for i, level in enumerate(levels):
+        conditions = ["scope_id = ANY({scopes}::uuid[])"]
+        if level is not None:
+            conditions.append(f"lod_level = {{level{i}}}")
+        if i > 0:
+            conditions.append(f"parent_id IN (SELECT digest_id FROM level{i - 1})")
+        elif parent_ids:
+            conditions.append("parent_id = ANY({parent_ids}::uuid[])")
+        ctes.append(f"""level{i} AS (
+            SELECT digest_id, text, lod_level, version, {score} AS score
+            FROM l2_digests
+            WHERE {" AND ".join(conditions)}
+            ORDER BY score DESC NULLS LAST
+            LIMIT {{limit}}
+        )""")
+        selects.append(
+            f"SELECT *, row_number() OVER (ORDER BY score DESC NULLS LAST) AS rank, {i} AS depth FROM level{i}"
+        )
+    return (
+        "WITH " + ",\n        ".join(ctes)
+        + "\n    SELECT digest_id, text, lod_level, version FROM (\n"
+        + "        SELECT * FROM (\n            "
+        + "\n            UNION ALL ".join(selects)
+        + "\n        ) c ORDER BY rank > {quota}, depth, score DESC NULLS LAST LIMIT {limit}"
+        + "\n    ) d ORDER BY depth, score DESC NULLS LAST"
+    )
+
+def render_params(template, params, style):
+    """
+    Fills a {name} template for a driver: 'pyformat' (psycopg2, returns a dict) or
+    'numeric' (asyncpg, returns a list ordered to match $1, $2, ...).
+    """
+    if style == "pyformat":
+        return template.format(**{name: f"%({name})s" for name in params}), dict(params)
+    names = list(params)
+    return template.format(**{name: f"${i + 1}" for i, name in enumerate(names)}), [params[n] for n in names]
+
+def digest_params(scope_ids, levels, query_embedding=None, limit=None, parent_ids=None):
+    """(template, params) for get_digests / get_digests_async."""
+    levels = list(levels) if levels else [None]
+    limit = int(limit or L2_DEFAULT_LIMIT)
+    params = {"scopes": [str(s) for s in scope_ids], "limit": limit,
+              "quota": max(1, limit // len(levels)), "half_life": L2_RECENCY_HALF_LIFE_HOURS}
+    if query_embedding is not None:
+        params.update(vec=query_embedding, weight=L2_RECENCY_WEIGHT)
+    if parent_ids:
+        params["parent_ids"] = [str(p) for p in parent_ids]
+    params.update({f"level{i}": level for i, level in enumerate(levels) if level is not None})
+    return digest_query(levels, query_embedding is not None, bool(parent_ids)), params
 
 class L2Processor:
     def __init__(self):
-        self.encoder = MockEncoder()
+        self.encoder = get_encoder()
 
     def create_digest(self, scope_id, text, lod_level="session", parent_id=None, version=1):
         """Creates a new high-level digest in the L2 pyramid."""
-        conn = get_db_connection()
         try:
-            embedding = self.encoder.encode(text).tolist()
-            emb_str = "[" + ",".join(map(str, embedding)) + "]"
+            embedding = self.encoder.encode(text)
+            # Binary COPY has no RETURNING, so the id is minted client-side.
+            digest_id = str(uuid.uuid4())
             
-            with conn.cursor() as cur:
-                cur.execute("""
-                    INSERT INTO l2_digests (scope_id, lod_level, parent_id, text, embedding, version)
-                    VALUES (%s, %s, %s, %s, %s::vector, %s)
-                    RETURNING digest_id
-                """, (scope_id, lod_level, parent_id, text, emb_str, version))
-                digest_id = cur.fetchone()[0]
+            with db_connection() as conn, conn.cursor() as cur:
+                copy_binary(cur, "l2_digests", DIGEST_COPY_COLUMNS,
+                            [(digest_id, scope_id, lod_level, parent_id, text, embedding, version)])
                 conn.commit()
                 return digest_id
         except Exception as e:
-            print(f"L2 Processing Error: {e}")
-            conn.rollback()
+            logger.error("L2 digest write failed scope=%s level=%s error=%s", scope_id, lod_level, e)
             return None
-        finally:
-            conn.close()
 
-    def get_digests(self, scope_ids, lod_level=None):
-        """Retrieves digests for context compilation."""
-        conn = get_db_connection()
-        try:
-            with conn.cursor() as cur:
-                query = "SELECT digest_id, text, lod_level, version FROM l2_digests WHERE scope_id = ANY(%s::uuid[])"
-                params = [scope_ids]
-                if lod_level:
-                    query += " AND lod_level = %s"
-                    params.append(lod_level)
-                
-                cur.execute(query, tuple(params))
-                return cur.fetchall()
-        finally:
-            conn.close()
+    def get_digests(self, scope_ids, lod_level=None, query_embedding=None, limit=None, parent_ids=None, zoom=None):
+        """
+        Retrieves digests for context compilation as (digest_id, text, lod_level, version)
+        rows, best first: by similarity to `query_embedding` blended with recency, or
+        by recency alone. At most `limit` rows (L2_DEFAULT_LIMIT if None).
+        `lod_level` picks one level and `parent_ids` narrows it to their children.
+        `zoom` is a list of levels, coarsest first: each level only keeps the children
+        of the digests picked above it (see digest_query).
+        """
+        levels = zoom or [lod_level]
+        if query_embedding is not None:
+            query_embedding = vector_literal(query_embedding)
+        template, params = digest_params(scope_ids, levels, query_embedding, limit, parent_ids)
+        query, params = render_params(template, params, "pyformat")
+        with db_connection() as conn, conn.cursor() as cur:
+            cur.execute(query, params)
+            return cur.fetchall()
 
 if __name__ == "__main__":
     # Smoke test
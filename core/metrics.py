@@ -0,0 +1,233 @@
+import os
+import sys
+import math
+import time
+import logging
+import threading
+from bisect import bisect_left
+
+# In-process Prometheus instrumentation with no client library: counters, gauges and
+# histograms guarded by one lock each, rendered in the text exposition format by
+# render(). Metrics are per process; with several server workers, scrape each one
+# (or put them behind a multiprocess-aware exporter).
+
+LOG_LEVEL = os.environ.get("VAULT_LOG_LEVEL", "INFO")
+LOG_FORMAT = "ts=%(asctime)s level=%(levelname)s logger=%(name)s msg=%(message)s"
+
+# Seconds; spans a Redis round trip up to a slow dream batch
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+logger = logging.getLogger(__name__)
+
+def configure_logging(level=None):
+    """key=value log lines on stderr for the server and worker scripts."""
+    logging.basicConfig(level=(level or LOG_LEVEL).upper(), format=LOG_FORMAT, stream=sys.stderr)
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _label_str(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in pairs) + "}"
+
+class _Child:
+    """One label combination of a metric; hold on to it on hot paths to skip the lookup."""
+    __slots__ = ("_metric", "_key")
+
+    def __init__(self, metric, key):
+        self._metric = metric
+        self._key = key
+
+    def inc(self, amount=1):
+        self._metric._add(self._key, amount)
+
+    def set(self, value):
+        self._metric._set(self._key, value)
+
+    def observe(self, value):
+        self._metric._observe(self._key, value)
+
+    def time(self):
+        return _Timer(self)
+
+class _Timer:
+    __slots__ = ("_child", "_start")
+
+    def __init__(self, child):
+        self._child = child
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._child.observe(time.perf_counter() - self._start)
+        return False
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        self._function = None
+        (REGISTRY if registry is None else registry).register(self)
+
+    def labels(self, *values, **kwargs):
+        if kwargs:
+            values = tuple(kwargs[n] for n in self.labelnames)
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        return _Child(self, tuple(str(v) for v in values))
+
+    def set_function(self, fn):
+        """
+        Reads the value at scrape time instead: `fn()` returns a number, or for a
+        labelled metric a {label values tuple: number} dict. Errors skip the metric.
+        """
+        self._function = fn
+
+    def samples(self):
+        """(suffix, label values, extra labels, value) tuples for render()."""
+        if self._function is not None:
+            value = self._function()
+            if not self.labelnames:
+                return [("", (), (), value)] if value is not None else []
+            return [("", tuple(str(v) for v in k), (), v) for k, v in value.items()]
+        with self._lock:
+            return [("", key, (), value) for key, value in self._values.items()]
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        super().__init__(name, documentation, labelnames, registry)
+        if not self.labelnames:
+            self._values[()] = 0
+
+    def inc(self, amount=1):
+        self._add((), amount)
+
+    def _add(self, key, amount):
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        return [("_total", *rest) for _, *rest in super().samples()]
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value):
+        self._set((), value)
+
+    def inc(self, amount=1):
+        self._add((), amount)
+
+    def _set(self, key, value):
+        with self._lock:
+            self._values[key] = value
+
+    def _add(self, key, amount):
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value):
+        self._observe((), value)
+
+    def time(self):
+        return _Timer(_Child(self, ()))
+
+    def _observe(self, key, value):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # [per-bucket counts..., +Inf count] and the sum
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][i] += 1
+            entry[1] += value
+
+    def samples(self):
+        with self._lock:
+            values = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+        out = []
+        for key, counts, total in values:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, math.inf), counts):
+                cumulative += count
+                out.append(("_bucket", key, (("le", _format_value(float(bound))),), cumulative))
+            out.append(("_sum", key, (), total))
+            out.append(("_count", key, (), cumulative))
+        return out
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Duplicate metric: {metric.name}")
+            self._metrics[metric.name] = metric
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        for metric in list(self._metrics.values()):
+            try:
+                samples = metric.samples()
+            except Exception as e:
+                logger.warning("metric collection failed metric=%s error=%s", metric.name, e)
+                continue
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for suffix, key, extra, value in samples:
+                lines.append(f"{metric.name}{suffix}{_label_str(metric.labelnames, key, extra)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+def render():
+    return REGISTRY.render()
+
+# --- Vault metrics ---
+# Compile stages: l1/l2/l3 are whole tier fetches; encoding (query embedding) and
+# provenance (rendering joined L0 provenance) are the parts of l3 worth separating.
+STAGE_SECONDS = Histogram("vault_context_stage_seconds", "Time spent per context compile stage", ["stage"])
+COMPILE_SECONDS = Histogram("vault_context_compile_seconds", "End-to-end context compile time", ["cache"])
+TIER_OMITTED = Counter("vault_context_tier_omitted", "Tiers left out of a compiled block", ["tier", "reason"])
+CONTEXT_CACHE = Counter("vault_context_cache", "Context block cache lookups by result", ["result"])
+INGESTED_RECORDS = Counter("vault_ingested_records", "L0 records written", ["path"])
+INGEST_ERRORS = Counter("vault_ingest_errors", "Failed L0 writes", ["path"])
+DREAM_EVENTS = Counter("vault_dream_events", "event_log entries consolidated into L3 snippets")
+DREAM_FAILED_EVENTS = Counter("vault_dream_failed_events", "event_log entries dead-lettered because they could not be consolidated")
+DREAM_BATCH_SECONDS = Histogram("vault_dream_batch_seconds", "Time per claimed dream batch (encode, write, mark)")
+DB_POOL_CONNECTIONS = Gauge("vault_db_pool_connections", "Postgres pool connections by state", ["pool", "state"])
+EVENT_BACKLOG = Gauge("vault_event_backlog", "Pending (undreamt) event_log entries")
+EVENT_OLDEST_PENDING_AGE = Gauge("vault_event_oldest_pending_age_seconds", "Age of the oldest pending event_log entry")
+DREAM_PENDING_TRIGGERS = Gauge("vault_dream_pending_triggers", "Dream triggers waiting for the scheduler")
@@ -0,0 +1,79 @@
+import os
+import re
+import importlib
+import threading
+from typing import Protocol, Sequence, runtime_checkable
+
+# "extractive" (deterministic, local) or "python:<module>:<factory>" for a custom
+# summarizer, e.g. one backed by an LLM
+SUMMARIZER = os.environ.get("VAULT_SUMMARIZER", "extractive")
+# Upper bound on a generated digest body, in characters
+L2_SUMMARY_CHARS = int(os.environ.get("VAULT_L2_SUMMARY_CHARS", "600"))
+
+@runtime_checkable
+class Summarizer(Protocol):
+    """
+    Source texts -> one digest body for the L2 pyramid. `level` and `key` name the
+    digest being built (e.g. "file", "src/api/routes.py"). Sources arrive in a
+    deterministic order: the same inputs must give the same text, so unchanged
+    digests are not rewritten with a new version for nothing.
+    """
+    def summarize(self, texts: Sequence[str], level: str, key: str) -> str: ...
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s|\n")
+
+class ExtractiveSummarizer:
+    """
+    Local stand-in with no model: the first sentence of each distinct source, in
+    order, joined with "; " and cut at a source boundary to `max_chars`.
+    """
+    def __init__(self, max_chars=L2_SUMMARY_CHARS, max_sentence_chars=160):
+        self.max_chars = max_chars
+        self.max_sentence_chars = max_sentence_chars
+
+    def summarize(self, texts, level, key):
+        parts, seen, size = [], set(), 0
+        for i, text in enumerate(texts):
+            sentence = _SENTENCE_END.split((text or "").strip(), 1)[0].strip()
+            if len(sentence) > self.max_sentence_chars:
+                sentence = sentence[:self.max_sentence_chars - 3].rstrip() + "..."
+            if not sentence or sentence in seen:
+                continue
+            if parts and size + 2 + len(sentence) > self.max_chars:
+                parts.append(f"(+{len(texts) - i} more)")
+                break
+            seen.add(sentence)
+            parts.append(sentence)
+            size += len(sentence) + 2
+        return "; ".join(parts)
+
+_summarizer = None
+_summarizer_lock = threading.Lock()
+
+def get_summarizer(spec=None):
+    """
+    Process-wide summarizer from VAULT_SUMMARIZER (or `spec`). "python:pkg.mod:factory"
+    calls `factory()` and expects an object with summarize(texts, level, key).
+    An explicit `spec` always builds a new instance.
+    """
+    global _summarizer
+    if spec is None and _summarizer is not None:
+        return _summarizer
+    name = spec or SUMMARIZER
+    if name == "extractive":
+        summarizer = ExtractiveSummarizer()
+    elif name.startswith("python:"):
+        module, _, factory = name.split(":", 1)[1].rpartition(":")
+        if not module:
+            raise ValueError(f"Summarizer spec needs python:<module>:<factory>, got {name}")
+        summarizer = getattr(importlib.import_module(module), factory)()
+    else:
+        raise ValueError(f"Unknown summarizer: {name}")
+    if not isinstance(summarizer, Summarizer):
+        raise TypeError(f"{name} does not provide summarize(texts, level, key)")
+    if spec is None:
+        with _summarizer_lock:
+            if _summarizer is None:
+                _summarizer = summarizer
+            summarizer = _summarizer
+    return summarizer
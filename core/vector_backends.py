@@ -0,0 +1,661 @@
+import os
+import re
+import sys
+import math
+import time
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+
+# Path for core modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from core.db import db_connection
+from core.vector_codec import EMBEDDING_DTYPE, parse_vector
+from core.vector_store import VectorBackend, VectorStore, L3Match, L3Filter, snippet_rows, L3_HYBRID, rrf_scores, hybrid_candidates
+from core.vector_snapshots import SNAPSHOT_DIR, open_snapshot, list_snapshots, read_meta, snapshot_lock, append_snapshot, bytes_uuid
+from core.metrics import Gauge
+
+logger = logging.getLogger(__name__)
+
+# "pgvector" (default), "numpy" (every scope in memory) or "auto" (small scopes in
+# memory, large ones in pgvector; see RoutedVectorStore)
+VECTOR_BACKEND = os.environ.get("VAULT_VECTOR_BACKEND", "pgvector")
+# auto: scopes up to this many snippets are served from memory...
+NUMPY_MAX_SCOPE_ROWS = int(os.environ.get("VAULT_NUMPY_MAX_SCOPE_ROWS", "10000"))
+# ...while all resident scopes together stay under this (~6KB per 1536-dim row)
+NUMPY_MAX_ROWS = int(os.environ.get("VAULT_NUMPY_MAX_ROWS", "100000"))
+# Resident scopes pick up snippets written by other processes at most this late
+NUMPY_SYNC_INTERVAL = float(os.environ.get("VAULT_NUMPY_SYNC_INTERVAL", "1.0"))
+# Watermarks stop below a gap in event ids younger than this: an ingest transaction can
+# commit an id lower than ones already consolidated. Older gaps are rolled-back inserts.
+SYNC_GAP_TIMEOUT = float(os.environ.get("VAULT_NUMPY_GAP_TIMEOUT", "60"))
+# Newest events inspected for such gaps
+SYNC_HORIZON_EVENTS = 10000
+
+WARM_START_SECONDS = Gauge("vault_vector_warm_start_seconds", "Time to load in-memory vector scopes at startup")
+
+# Snippets plus the L0 fields of L3Match, in source_event_id order. Per scope (h):
+# events in (after, pending), plus rows without an event id when `nulls` is set.
+SCOPE_ROWS_SQL = """
+    SELECT s.scope_id::text, s.snippet_id::text, s.record_id::text, s.text, s.metadata,
+           r.provenance, r.confidence_hint, r.record_type, r.path, r.created_at,
+           {embedding}, s.source_event_id
+    FROM unnest(%s::uuid[], %s::int8[], %s::int8[], %s::bool[]) AS h(scope_id, after, pending, nulls)
+    JOIN l3_snippets s ON s.scope_id = h.scope_id
+    LEFT JOIN records_l0 r ON r.record_id = s.record_id
+    WHERE ((s.source_event_id > h.after AND s.source_event_id < h.pending) OR (s.source_event_id IS NULL AND h.nulls))
+"""
+# A scope is complete below its oldest unprocessed event: dream workers claim with
+# SKIP LOCKED and can commit a later batch before an earlier one. Per scope, so an
+# event stuck in one scope does not hold back the others.
+PENDING_HORIZON_SQL = """
+    SELECT r.scope_id::text, min(e.event_id)
+    FROM event_log e
+    JOIN records_l0 r ON r.record_id = e.record_id
+    WHERE e.processed_at IS NULL AND r.scope_id = ANY(%s::uuid[])
+    GROUP BY r.scope_id
+"""
+RECENT_EVENTS_SQL = """
+    SELECT event_id, created_at > now() - make_interval(secs => %s)
+    FROM event_log ORDER BY event_id DESC LIMIT %s
+"""
+# Snippets written without an event (direct add_snippets) have no watermark; a sync
+# re-reads them only when a scope holds fewer than Postgres has
+NULL_EVENT_COUNTS_SQL = """
+    SELECT scope_id::text, count(*) FROM l3_snippets
+    WHERE scope_id = ANY(%s::uuid[]) AND source_event_id IS NULL
+    GROUP BY scope_id
+"""
+_MAX_EVENT_ID = 2 ** 63 - 1
+
+def settled_horizon(cur, gap_timeout=SYNC_GAP_TIMEOUT, limit=SYNC_HORIZON_EVENTS):
+    """
+    Highest event id at or below which every event is visible: walks up the newest
+    `limit` events and stops below a recent gap in the id sequence (see dream_l2).
+    """
+    cur.execute(RECENT_EVENTS_SQL, (gap_timeout, limit))
+    events = sorted(cur.fetchall())
+    # With the whole log in view a gap before the first event counts too
+    horizon = events[0][0] - 1 if len(events) == limit else 0
+    for event_id, recent in events:
+        if event_id != horizon + 1 and recent:
+            break
+        horizon = event_id
+    return horizon
+
+def fetch_scope_rows(scope_ids, after=None, until=None, embeddings=True, held_nulls=None):
+    """
+    ({scope_id: [(embedding, row, source_event_id)]}, {scope_id: horizon}) for snippets
+    with after[scope] < source_event_id <= until, cut at each scope's pending-event
+    horizon. Without `after` (a full load) rows with no event id are included; with
+    it, only for scopes whose count of such rows exceeds `held_nulls[scope]`. A
+    scope's horizon is the event id it is now complete to: below both its oldest pending
+    event and the settled horizon, so a watermark never passes an uncommitted event.
+    """
+    scope_ids = [str(s) for s in scope_ids]
+    query = SCOPE_ROWS_SQL.format(embedding="s.embedding" if embeddings else "NULL")
+    by_scope = {}
+    with db_connection() as conn, conn.cursor() as cur:
+        settled = settled_horizon(cur)
+        cur.execute(PENDING_HORIZON_SQL, (scope_ids,))
+        pending = dict(cur.fetchall())
+        if after is None:
+            nulls = {s: True for s in scope_ids}
+        else:
+            cur.execute(NULL_EVENT_COUNTS_SQL, (scope_ids,))
+            counts = dict(cur.fetchall())
+            nulls = {s: counts.get(s, 0) > (held_nulls or {}).get(s, 0) for s in scope_ids}
+        params = [
+            scope_ids,
+            [(after or {}).get(s, 0) for s in scope_ids],
+            [min(pending.get(s) or _MAX_EVENT_ID, until + 1 if until is not None else _MAX_EVENT_ID) for s in scope_ids],
+            [nulls[s] for s in scope_ids],
+        ]
+        cur.execute(query + " ORDER BY s.source_event_id NULLS FIRST", params)
+        for scope_id, *row, embedding, event_id in cur:
+            if embeddings and not isinstance(embedding, np.ndarray):
+                embedding = parse_vector(embedding)
+            by_scope.setdefault(scope_id, []).append((embedding, tuple(row), event_id))
+    return by_scope, {s: min(settled, pending[s] - 1) if pending.get(s) is not None else settled for s in scope_ids}
+
+_TERM = re.compile(r"\w+")
+
+def _terms(text):
+    return frozenset(_TERM.findall((text or "").lower()))
+
+def _normalized(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+_FILTER_FIELDS = ("artifact_type", "branch", "source")
+
+class _FilterColumns:
+    """
+    The L3Filter fields of a scope's rows as arrays, so a filtered search builds its
+    mask with vectorised comparisons: artifact_type/branch/source as codes into a
+    per-scope vocabulary, path as a string array (rebuilt lazily after appends).
+    """
+    __slots__ = ("codes", "vocab", "paths", "_paths_array")
+
+    def __init__(self):
+        self.codes = {name: np.empty(0, dtype=np.int32) for name in _FILTER_FIELDS}
+        self.vocab = {name: {} for name in _FILTER_FIELDS}
+        self.paths = []
+        self._paths_array = np.empty(0, dtype=str)
+
+    def extend(self, count, metadatas):
+        """Adds rows count.. of the scope (same grow-by-doubling as the matrix)."""
+        metadatas = [m if isinstance(m, dict) else {} for m in metadatas]
+        needed = count + len(metadatas)
+        for name in _FILTER_FIELDS:
+            codes, vocab = self.codes[name], self.vocab[name]
+            if needed > len(codes):
+                grown = np.empty(max(needed, 2 * len(codes), 64), dtype=np.int32)
+                grown[:count] = codes[:count]
+                codes = self.codes[name] = grown
+            for i, metadata in enumerate(metadatas, count):
+                try:
+                    codes[i] = vocab.setdefault(metadata.get(name), len(vocab))
+                except TypeError:  # unhashable (list/dict) values never equal a filter value
+                    codes[i] = -1
+        del self.paths[count:]
+        self.paths.extend(str(m.get("path") or "") for m in metadatas)
+
+    def view(self, count):
+        """Columns of the first `count` rows; the caller holds the backend lock."""
+        if len(self._paths_array) != count:
+            self._paths_array = np.array(self.paths[:count], dtype=str)
+        return {name: codes[:count] for name, codes in self.codes.items()}, self.vocab, self._paths_array
+
+def _filter_mask(columns, l3_filter):
+    codes, vocab, paths = columns
+    keep = np.ones(len(paths), dtype=bool)
+    for name in _FILTER_FIELDS:
+        values = getattr(l3_filter, name)
+        if values:
+            keep &= np.isin(codes[name], [vocab[name][v] for v in values if v in vocab[name]])
+    if l3_filter.path:
+        keep &= np.char.startswith(paths, l3_filter.path)
+    return keep
+
+_NO_POSTINGS = np.empty(0, dtype=np.int32)
+
+class _TermPostings:
+    """
+    Inverted index of a scope's rows for hybrid search: term -> indices of the rows
+    containing it (grow-by-doubling int32 buffers), whose length is the term's
+    document frequency. A query touches only the postings of its own words.
+    """
+    __slots__ = ("rows", "lengths")
+
+    def __init__(self):
+        self.rows = {}     # term -> row index buffer
+        self.lengths = {}  # term -> used length of its buffer
+
+    def extend(self, count, texts):
+        """Adds rows count.. of the scope."""
+        batch = {}
+        for i, text in enumerate(texts, count):
+            for term in _terms(text):
+                batch.setdefault(term, []).append(i)
+        for term, indices in batch.items():
+            buffer, used = self.rows.get(term, _NO_POSTINGS), self.lengths.get(term, 0)
+            needed = used + len(indices)
+            if needed > len(buffer):
+                # Searches hold slices of the old buffer; they never see a half-written index.
+                grown = np.empty(max(needed, 2 * len(buffer), 8), dtype=np.int32)
+                grown[:used] = buffer[:used]
+                buffer = self.rows[term] = grown
+            buffer[used:needed] = indices
+            self.lengths[term] = needed
+
+    def view(self, terms):
+        """{term: row indices} for the given terms; the caller holds the backend lock."""
+        return {t: self.rows[t][:self.lengths[t]] for t in terms if t in self.rows}
+
+class _ScopeMatrix:
+    """One scope's unit-normalized embeddings in a grow-by-doubling float32 buffer."""
+    __slots__ = ("matrix", "count", "rows", "postings", "columns", "ids", "nulls", "watermark", "synced_at")
+
+    def __init__(self, dimension):
+        self.matrix = np.empty((0, dimension), dtype=EMBEDDING_DTYPE)
+        self.count = 0
+        self.rows = []        # (snippet_id, record_id, text, metadata, provenance, confidence, record_type, path, created_at)
+        self.postings = _TermPostings()  # lowercased words of each row's text, for hybrid search
+        self.columns = _FilterColumns()
+        self.ids = set()      # snippet ids held, so overlapping syncs never add a row twice
+        self.nulls = 0        # rows held that have no source_event_id
+        self.watermark = 0    # source_event_id up to which the scope is complete
+        self.synced_at = time.monotonic()
+
+    @classmethod
+    def from_snapshot(cls, snapshot, rows, nulls=0):
+        """Serves straight from the read-only memmap until the first append copies it."""
+        scope = cls(snapshot.embeddings.shape[1])
+        scope.matrix = snapshot.embeddings
+        scope.count = snapshot.count
+        scope.rows = rows
+        scope.postings.extend(0, [row[2] for row in rows])
+        scope.columns.extend(0, [row[3] for row in rows])
+        scope.ids = {row[0] for row in rows}
+        scope.nulls = nulls
+        scope.watermark = snapshot.watermark
+        return scope
+
+    def append(self, embeddings, rows):
+        if not rows:
+            return
+        needed = self.count + len(rows)
+        if needed > self.matrix.shape[0]:
+            # Searches hold the old buffer and count; they never see a half-written row.
+            grown = np.empty((max(needed, 2 * self.matrix.shape[0], 64), self.matrix.shape[1]), dtype=EMBEDDING_DTYPE)
+            grown[:self.count] = self.matrix[:self.count]
+            self.matrix = grown
+        self.matrix[self.count:needed] = _normalized(np.asarray(embeddings, dtype=EMBEDDING_DTYPE))
+        self.postings.extend(self.count, [row[2] for row in rows])
+        self.columns.extend(self.count, [row[3] for row in rows])
+        self.rows.extend(rows)
+        self.count = needed
+
+class NumpyVectorBackend(VectorBackend):
+    """
+    In-process L3 index: per-scope float32 matrices answered with one matmul and an
+    argpartition top-k (exact search, so `recall` is ignored). Hybrid searches rank
+    the lexical side by the summed IDF of query words a snippet contains (a stand-in
+    for Postgres ts_rank without stemming) and fuse as pgvector does. With `database=True`
+    scopes are loaded from l3_snippets on first search and re-synced past their
+    source_event_id watermark every `sync_interval` seconds; writes go to Postgres.
+    With `database=False` it is a self-contained index for tests and benchmarks.
+    """
+    def __init__(self, database=True, dimension=None, sync_interval=NUMPY_SYNC_INTERVAL, snapshot_dir=None):
+        from core.encoders import EMBEDDING_DIM
+        self.database = database
+        self.dimension = dimension or EMBEDDING_DIM
+        self.sync_interval = sync_interval
+        self.snapshot_dir = SNAPSHOT_DIR if snapshot_dir is None else snapshot_dir
+        self._scopes = OrderedDict()  # scope_id -> _ScopeMatrix, least recently searched first
+        self._lock = threading.RLock()
+        self._pg = VectorStore() if database else None
+
+    def add_snippets(self, snippets, cur=None):
+        if self.database:
+            # Postgres stays the source of truth; resident scopes catch up on their next sync.
+            return self._pg.add_snippets(snippets, cur=cur)
+        by_scope = {}
+        for rid, sid, text, metadata, emb, event_id in snippet_rows(snippets):
+            by_scope.setdefault(str(sid), []).append((emb, (None, rid, text, metadata, None, None, None, None, None), event_id))
+        with self._lock:
+            for scope_id, items in by_scope.items():
+                self._append(scope_id, items)
+        return len(snippets)
+
+    def _append(self, scope_id, items, horizon=None):
+        scope = self._scopes.get(scope_id)
+        if scope is None:
+            scope = self._scopes[scope_id] = _ScopeMatrix(self.dimension)
+        items = [item for item in items if item[1][0] is None or item[1][0] not in scope.ids]
+        scope.append([emb for emb, _, _ in items], [row for _, row, _ in items])
+        scope.ids.update(row[0] for _, row, _ in items if row[0] is not None)
+        scope.nulls += sum(1 for _, _, e in items if e is None)
+        if horizon is None:  # database=False: events arrive in order
+            horizon = max([e for _, _, e in items if e is not None], default=0)
+        # Rows past the horizon are held but re-read (and deduplicated) until it settles
+        scope.watermark = max(scope.watermark, horizon)
+        return len(items)
+
+    # --- Residency ---
+
+    def resident(self, scope_id):
+        return str(scope_id) in self._scopes
+
+    def resident_count(self, scope_id):
+        """Snippets held for a resident scope, None if it is not loaded."""
+        scope = self._scopes.get(str(scope_id))
+        return scope.count if scope is not None else None
+
+    def resident_scopes(self):
+        return len(self._scopes)
+
+    def resident_rows(self):
+        with self._lock:
+            return sum(s.count for s in self._scopes.values())
+
+    def scope_rows(self, scope_ids):
+        """Snippet counts per scope: from Postgres when database-backed, else from memory."""
+        scope_ids = [str(s) for s in scope_ids]
+        if not self.database:
+            return {s: (self._scopes[s].count if s in self._scopes else 0) for s in scope_ids}
+        with db_connection() as conn, conn.cursor() as cur:
+            cur.execute("""
+                SELECT scope_id::text, count(*) FROM l3_snippets
+                WHERE scope_id = ANY(%s::uuid[]) GROUP BY scope_id
+            """, (scope_ids,))
+            counts = dict(cur.fetchall())
+        return {s: counts.get(s, 0) for s in scope_ids}
+
+    def load(self, scope_ids):
+        """(Re)loads whole scopes: from their snapshot when there is one, else from Postgres."""
+        scope_ids = [str(s) for s in scope_ids]
+        if self.snapshot_dir:
+            scope_ids = [s for s in scope_ids if not self._load_snapshot(s)]
+        if not scope_ids:
+            return
+        fetched, horizons = fetch_scope_rows(scope_ids)
+        with self._lock:
+            for scope_id in scope_ids:
+                self._scopes.pop(scope_id, None)
+                self._append(scope_id, fetched.get(scope_id, []), horizons.get(scope_id))
+
+    def _load_snapshot(self, scope_id):
+        """
+        Maps the scope's snapshot and replays events past its watermark. Text and L0
+        fields still come from Postgres, but without the embeddings (the slow part).
+        False (caller does a full load) if the snapshot no longer matches the table.
+        """
+        snapshot = open_snapshot(scope_id, self.snapshot_dir)
+        if snapshot is None or snapshot.embeddings.shape[1] != self.dimension:
+            return False
+        rows, nulls = self._snapshot_rows(scope_id, snapshot.watermark)
+        order = [bytes_uuid(s) for s in snapshot.snippet_ids]
+        if len(rows) != snapshot.count or any(s not in rows for s in order):
+            logger.info("vector snapshot stale, full load scope=%s", scope_id)
+            return False
+        scope = _ScopeMatrix.from_snapshot(snapshot, [rows[s] for s in order], nulls)
+        with self._lock:
+            self._scopes[scope_id] = scope
+        self.sync([scope_id], force=True)
+        return True
+
+    def _snapshot_rows(self, scope_id, watermark):
+        """({snippet_id: row} the snapshot should hold, how many of them have no event id)."""
+        fetched, _ = fetch_scope_rows([scope_id], until=watermark, embeddings=False)
+        items = fetched.get(scope_id, [])
+        return {row[0]: row for _, row, _ in items}, sum(1 for _, _, e in items if e is None)
+
+    def warm_start(self, max_scope_rows=None, max_rows=None):
+        """Loads every snapshotted scope (within the limits); returns timing stats."""
+        started = time.monotonic()
+        loaded = rows = 0
+        for scope_id in list_snapshots(self.snapshot_dir):
+            count = read_meta(scope_id, self.snapshot_dir)["count"]
+            if max_scope_rows is not None and count > max_scope_rows:
+                continue
+            if max_rows is not None and rows + count > max_rows:
+                break
+            try:
+                if self._load_snapshot(scope_id):
+                    loaded += 1
+                    rows += self.resident_count(scope_id) or 0
+            except Exception as e:
+                logger.warning("vector snapshot load failed scope=%s error=%s", scope_id, e)
+        seconds = time.monotonic() - started
+        WARM_START_SECONDS.set(seconds)
+        logger.info("vector warm start scopes=%d rows=%d seconds=%.3f", loaded, rows, seconds)
+        return {"scopes": loaded, "rows": rows, "seconds": seconds}
+
+    def evict(self, scope_ids):
+        with self._lock:
+            for scope_id in scope_ids:
+                self._scopes.pop(str(scope_id), None)
+
+    def evict_lru(self, max_rows):
+        """Drops least recently searched scopes until at most `max_rows` remain resident."""
+        evicted = []
+        with self._lock:
+            total = sum(s.count for s in self._scopes.values())
+            while self._scopes and total > max_rows:
+                scope_id, scope = self._scopes.popitem(last=False)
+                total -= scope.count
+                evicted.append(scope_id)
+        return evicted
+
+    def sync(self, scope_ids=None, force=False):
+        """Appends snippets committed past each resident scope's watermark."""
+        if not self.database:
+            return 0
+        now = time.monotonic()
+        with self._lock:
+            due = {
+                s: scope for s, scope in self._scopes.items()
+                if (scope_ids is None or s in scope_ids) and (force or now - scope.synced_at >= self.sync_interval)
+            }
+            for scope in due.values():
+                scope.synced_at = now
+            after = {s: scope.watermark for s, scope in due.items()}
+            held_nulls = {s: scope.nulls for s, scope in due.items()}
+        if not due:
+            return 0
+        fetched, horizons = fetch_scope_rows(list(due), after=after, held_nulls=held_nulls)
+        added = 0
+        with self._lock:
+            for scope_id in due:
+                if scope_id in self._scopes:  # not evicted meanwhile
+                    added += self._append(scope_id, fetched.get(scope_id, []), horizons.get(scope_id))
+        return added
+
+    # --- Search ---
+
+    def search_l3(self, scope_ids, query_embedding, limit=10, recall=None, query_text=None, l3_filter=None):
+        scope_ids = [str(s) for s in scope_ids]
+        l3_filter = L3Filter.of(l3_filter)
+        query_terms = _terms(query_text) if query_text and L3_HYBRID else None
+        if self.database:
+            missing = [s for s in scope_ids if s not in self._scopes]
+            try:
+                if missing:
+                    self.load(missing)
+                self.sync(scope_ids)
+            except Exception as e:
+                logger.warning("numpy backend load failed scopes=%d error=%s", len(scope_ids), e)
+        with self._lock:
+            views = []
+            for s in scope_ids:
+                scope = self._scopes.get(s)
+                if scope is not None and scope.count:
+                    self._scopes.move_to_end(s)
+                    # rows is append-only, so indices below this count stay valid
+                    columns = scope.columns.view(scope.count) if l3_filter else None
+                    postings = scope.postings.view(query_terms) if query_terms else None
+                    views.append((scope.matrix[:scope.count], scope.rows, postings, columns))
+        if query_terms is not None:
+            return self._hybrid_top_k(views, query_embedding, query_terms, limit, l3_filter)
+        return self._top_k(views, query_embedding, limit, l3_filter)
+
+    def _scores(self, views, query_embedding, l3_filter=None):
+        """Cosine scores over all views (-inf for rows the filter excludes) and view offsets."""
+        query = np.asarray(query_embedding, dtype=EMBEDDING_DTYPE)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+        scores = np.concatenate([matrix @ query for matrix, *_ in views])
+        offsets = np.cumsum([0] + [matrix.shape[0] for matrix, *_ in views])
+        if l3_filter:
+            # Filtered rows never rank, so a filtered search still returns a full k
+            keep = np.concatenate([_filter_mask(columns, l3_filter) for *_, columns in views])
+            scores[~keep] = -np.inf
+        return scores, offsets
+
+    @staticmethod
+    def _ranked(scores, limit):
+        """Indices of the top-`limit` finite scores, best first."""
+        k = min(limit, int(np.isfinite(scores).sum()))
+        if k <= 0:
+            return np.empty(0, dtype=np.int64)
+        top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+        return top[np.argsort(-scores[top], kind="stable")]
+
+    @staticmethod
+    def _match(views, offsets, i, similarity, score=None):
+        v = int(np.searchsorted(offsets, i, side="right")) - 1
+        row = views[v][1][i - offsets[v]]
+        return L3Match(*row[:4], float(similarity), *row[4:], score)
+
+    def _top_k(self, views, query_embedding, limit, l3_filter=None):
+        if not views or limit <= 0:
+            return []
+        scores, offsets = self._scores(views, query_embedding, l3_filter)
+        return [self._match(views, offsets, i, scores[i]) for i in self._ranked(scores, limit)]
+
+    def _hybrid_top_k(self, views, query_embedding, query_terms, limit, l3_filter=None):
+        if not views or limit <= 0:
+            return []
+        scores, offsets = self._scores(views, query_embedding, l3_filter)
+        candidates = hybrid_candidates(limit)
+        semantic = [int(i) for i in self._ranked(scores, candidates)]
+        lexical = []
+        if query_terms:
+            # IDF weights scattered through the query words' postings only
+            df = dict.fromkeys(query_terms, 0)
+            for _, _, postings, _ in views:
+                for t, indices in postings.items():
+                    df[t] += len(indices)
+            idf = {t: math.log((len(scores) + 1) / (n + 0.5)) for t, n in df.items() if n}
+            lex = np.zeros(len(scores))
+            for offset, (_, _, postings, _) in zip(offsets, views):
+                for t, indices in postings.items():
+                    lex[offset + indices] += idf[t]
+            lex[~np.isfinite(scores)] = 0.0
+            lexical = [int(i) for i in self._ranked(lex, candidates) if lex[i] > 0]
+        fused = rrf_scores([semantic, lexical])
+        top = sorted(fused, key=lambda i: (-fused[i], -scores[i]))[:limit]
+        return [self._match(views, offsets, i, scores[i], fused[i]) for i in top]
+
+class RoutedVectorStore(VectorBackend):
+    """
+    Per-scope backend selection: scopes with at most `max_scope_rows` snippets are
+    searched in memory (loaded on first use, least recently used evicted beyond
+    `max_rows`); larger scopes go to pgvector. A request spanning both kinds merges
+    the two result lists by fused rank (hybrid) or similarity. Writes always go to Postgres.
+    """
+    def __init__(self, pg=None, memory=None, max_scope_rows=NUMPY_MAX_SCOPE_ROWS, max_rows=NUMPY_MAX_ROWS):
+        self.pg = pg or VectorStore()
+        self.memory = memory or NumpyVectorBackend()
+        self.max_scope_rows = max_scope_rows
+        self.max_rows = max_rows
+        self._large = set()  # scopes routed to pgvector (scopes only grow)
+        self._lock = threading.Lock()
+        self.stats = {"memory_searches": 0, "pgvector_searches": 0, "loads": 0, "evictions": 0}
+
+    def add_snippets(self, snippets, cur=None):
+        return self.pg.add_snippets(snippets, cur=cur)
+
+    def route(self, scope_ids):
+        """Splits scope_ids into (in-memory scopes, pgvector scopes), loading small scopes."""
+        scope_ids = [str(s) for s in scope_ids]
+        unknown = [s for s in scope_ids if s not in self._large and not self.memory.resident(s)]
+        if unknown:
+            try:
+                counts = self.memory.scope_rows(unknown)
+            except Exception as e:
+                logger.warning("vector routing failed, using pgvector scopes=%d error=%s", len(unknown), e)
+                return [s for s in scope_ids if self.memory.resident(s)], [s for s in scope_ids if not self.memory.resident(s)]
+            small = [s for s in unknown if counts[s] <= self.max_scope_rows]
+            with self._lock:
+                self._large.update(s for s in unknown if counts[s] > self.max_scope_rows)
+            if small:
+                self.memory.load(small)
+                self.stats["loads"] += len(small)
+        # Scopes that outgrew the limit since they were loaded move to pgvector
+        for s in scope_ids:
+            if (self.memory.resident_count(s) or 0) > self.max_scope_rows:
+                self.memory.evict([s])
+                with self._lock:
+                    self._large.add(s)
+        self.stats["evictions"] += len(self.memory.evict_lru(self.max_rows))
+        memory = [s for s in scope_ids if s not in self._large]
+        return memory, [s for s in scope_ids if s in self._large]
+
+    def search_l3(self, scope_ids, query_embedding, limit=10, recall=None, query_text=None, l3_filter=None):
+        memory, large = self.route(scope_ids)
+        matches = []
+        if memory:
+            self.stats["memory_searches"] += 1
+            matches.append(self.memory.search_l3(memory, query_embedding, limit, query_text=query_text, l3_filter=l3_filter))
+        if large:
+            self.stats["pgvector_searches"] += 1
+            matches.append(self.pg.search_l3(
+                large, query_embedding, limit=limit, recall=recall, query_text=query_text, l3_filter=l3_filter,
+            ))
+        return _merge(matches, limit)
+
+    async def search_l3_async(self, scope_ids, query_embedding, limit=10, recall=None, query_text=None, l3_filter=None):
+        # Routing may load a scope and the matmul is CPU work; both run off the loop
+        memory, large = await asyncio.to_thread(self.route, scope_ids)
+        parts = []
+        if memory:
+            self.stats["memory_searches"] += 1
+            parts.append(asyncio.to_thread(self.memory.search_l3, memory, query_embedding, limit, None, query_text, l3_filter))
+        if large:
+            self.stats["pgvector_searches"] += 1
+            parts.append(self.pg.search_l3_async(
+                large, query_embedding, limit=limit, recall=recall, query_text=query_text, l3_filter=l3_filter,
+            ))
+        return _merge(await asyncio.gather(*parts), limit)
+
+    def warm_start(self):
+        return self.memory.warm_start(max_scope_rows=self.max_scope_rows, max_rows=self.max_rows)
+
+    def snapshot(self):
+        return dict(self.stats, resident_scopes=self.memory.resident_scopes(), resident_rows=self.memory.resident_rows(),
+                    pgvector_scopes=len(self._large), max_scope_rows=self.max_scope_rows, max_rows=self.max_rows)
+
+def _merge(parts, limit):
+    """
+    One best-first list from the per-backend lists. Cosine similarities compare
+    across backends; fused scores do not (each side fused its own candidate lists),
+    so hybrid results are merged by fusing the sides' ranks once more.
+    """
+    parts = [list(part) for part in parts if part]
+    if len(parts) <= 1:
+        return parts[0][:limit] if parts else []
+    matches = [m for part in parts for m in part]
+    if all(m.score is None for m in matches):
+        return sorted(matches, key=lambda m: -m.similarity)[:limit]
+    fused = rrf_scores([[id(m) for m in part] for part in parts])
+    ranked = sorted(matches, key=lambda m: (-fused[id(m)], -(m.score or 0.0), -m.similarity))
+    return [m._replace(score=fused[id(m)]) for m in ranked[:limit]]
+
+def update_snapshots(scope_ids, root=None, dimension=None):
+    """
+    Brings each scope's embedding snapshot up to date by appending the snippets
+    consolidated since its watermark (the first call writes the whole scope).
+    Run by the dream worker after it commits; returns {scope_id: rows in snapshot}.
+    """
+    from core.encoders import EMBEDDING_DIM
+    root = root or SNAPSHOT_DIR
+    dimension = dimension or EMBEDDING_DIM
+    counts = {}
+    for scope_id in (str(s) for s in scope_ids):
+        with snapshot_lock(scope_id, root):
+            existing = open_snapshot(scope_id, root)
+            if existing is None:
+                fetched, horizons = fetch_scope_rows([scope_id])
+                have = set()
+            else:
+                # The snapshot does not record which rows lack an event id; any such row
+                # in Postgres is re-read and deduplicated below
+                fetched, horizons = fetch_scope_rows([scope_id], after={scope_id: existing.watermark})
+                have = {bytes_uuid(s) for s in existing.snippet_ids}
+            # A snapshot holds exactly the rows up to its watermark; later ones wait for it to settle
+            watermark = max(horizons[scope_id], existing.watermark if existing is not None else 0)
+            items = [item for item in fetched.get(scope_id, [])
+                     if item[1][0] not in have and (item[2] is None or item[2] <= watermark)]
+            embeddings = _normalized(np.asarray([emb for emb, _, _ in items], dtype=EMBEDDING_DTYPE).reshape(-1, dimension))
+            counts[scope_id] = append_snapshot(
+                scope_id, embeddings, [row[0] for _, row, _ in items], [row[1] for _, row, _ in items],
+                watermark, dimension, root,
+            )
+    return counts
+
+def get_vector_store(spec=None):
+    name = spec or VECTOR_BACKEND
+    if name == "pgvector":
+        return VectorStore()
+    if name == "numpy":
+        return NumpyVectorBackend()
+    if name == "auto":
+        return RoutedVectorStore()
+    raise ValueError(f"Unknown vector backend: {name}")
@@ -0,0 +1,141 @@
+import io
+import json
+import struct
+import uuid
+import threading
+import logging
+import numpy as np
+import psycopg2
+from psycopg2.extensions import new_type, new_array_type, register_type
+
+logger = logging.getLogger(__name__)
+
+# Vector wire encoding for pgvector.
+# Writes go through binary COPY (pgvector's `vector_recv` format: 2-byte dim,
+# 2 unused bytes, big-endian float32s), which skips float->text formatting on
+# our side and text parsing on the server. psycopg2 has no binary bind
+# parameters, so single query vectors are sent as a compact float32 literal
+# that round-trips exactly. Embeddings read back are parsed into float32 arrays.
+
+EMBEDDING_DTYPE = np.float32
+
+_FLOAT32_FORMATS = {}
+_VECTOR_HEADER = struct.Struct(">HH")
+_COPY_SIGNATURE = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+_COPY_TRAILER = struct.pack(">h", -1)
+
+_registered = False
+_register_lock = threading.Lock()
+
+def as_float32(embedding):
+    """Coerces a list/ndarray embedding into a contiguous 1-D float32 array."""
+    arr = np.ascontiguousarray(embedding, dtype=EMBEDDING_DTYPE)
+    if arr.ndim != 1:
+        raise ValueError(f"expected a 1-D embedding, got shape {arr.shape}")
+    return arr
+
+def vector_literal(embedding):
+    """
+    Compact pgvector text literal. '%.9g' is the shortest printf format that
+    round-trips every float32, ~35% smaller and ~3x faster than str(float).
+    """
+    arr = as_float32(embedding)
+    fmt = _FLOAT32_FORMATS.get(arr.shape[0])
+    if fmt is None:
+        fmt = _FLOAT32_FORMATS[arr.shape[0]] = "[" + ",".join(["%.9g"] * arr.shape[0]) + "]"
+    return fmt % tuple(arr.tolist())
+
+def pack_vector(embedding):
+    """pgvector binary (recv/send) representation."""
+    arr = as_float32(embedding)
+    return _VECTOR_HEADER.pack(arr.shape[0], 0) + arr.astype(">f4").tobytes()
+
+def unpack_vector(data):
+    dim, _ = _VECTOR_HEADER.unpack_from(data)
+    return np.frombuffer(data, dtype=">f4", count=dim, offset=4).astype(EMBEDDING_DTYPE)
+
+def parse_vector(value, cur=None):
+    """Typecaster for vector columns: '[1,2,3]' -> float32 ndarray."""
+    if value is None:
+        return None
+    return np.array(value[1:-1].split(","), dtype=EMBEDDING_DTYPE)
+
+def _encode_field(kind, value):
+    if kind == "uuid":
+        return value.bytes if isinstance(value, uuid.UUID) else uuid.UUID(str(value)).bytes
+    if kind == "text":
+        return value.encode("utf-8")
+    if kind == "jsonb":
+        # jsonb binary format: version byte 1 followed by the JSON text
+        if not isinstance(value, (str, bytes)):
+            value = json.dumps(value)
+        return b"\x01" + (value.encode("utf-8") if isinstance(value, str) else value)
+    if kind == "vector":
+        return pack_vector(value)
+    if kind == "int4":
+        return struct.pack(">i", value)
+    if kind == "int8":
+        return struct.pack(">q", value)
+    raise ValueError(f"Unsupported COPY field type: {kind}")
+
+def copy_binary(cur, table, columns, rows):
+    """
+    Bulk-writes rows with COPY ... FROM STDIN (FORMAT BINARY).
+    `columns` is a sequence of (name, kind) with kind in uuid/text/jsonb/vector/int4/int8.
+    Runs inside the cursor's current transaction; returns the row count.
+    """
+    kinds = [kind for _, kind in columns]
+    field_count = struct.pack(">h", len(kinds))
+    buf = io.BytesIO()
+    buf.write(_COPY_SIGNATURE)
+    count = 0
+    for row in rows:
+        buf.write(field_count)
+        for kind, value in zip(kinds, row):
+            if value is None:
+                buf.write(b"\xff\xff\xff\xff")
+                continue
+            data = _encode_field(kind, value)
+            buf.write(struct.pack(">i", len(data)))
+            buf.write(data)
+        count += 1
+    buf.write(_COPY_TRAILER)
+    buf.seek(0)
+    names = ", ".join(name for name, _ in columns)
+    cur.copy_expert(f"COPY {table} ({names}) FROM STDIN WITH (FORMAT BINARY)", buf)
+    return count
+
+def register_vector_types(conn):
+    """
+    Registers the vector typecaster process-wide. pgvector's register_vector() runs
+    an unbounded catalog query on every connection it is given, which can block
+    behind in-flight DDL (e.g. init_db/migrations holding catalog locks). Here the
+    OID is looked up once per process under statement/lock timeouts; on failure we
+    log and keep working with text vectors.
+    """
+    global _registered
+    if _registered:
+        return True
+    with _register_lock:
+        if _registered:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SET LOCAL statement_timeout = '2s'")
+                cur.execute("SET LOCAL lock_timeout = '1s'")
+                cur.execute("SELECT to_regtype('vector')::oid, to_regtype('_vector')::oid")
+                oid, array_oid = cur.fetchone()
+            conn.rollback()
+        except psycopg2.Error as e:
+            conn.rollback()
+            logger.warning("pgvector type registration skipped error=%s", e)
+            return False
+        if oid is None:
+            logger.warning("pgvector type registration skipped: 'vector' type not found")
+            return False
+        vector = new_type((oid,), "VECTOR", parse_vector)
+        register_type(vector)
+        if array_oid is not None:
+            register_type(new_array_type((array_oid,), "VECTORARRAY", vector))
+        _registered = True
+        return True
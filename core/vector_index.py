@@ -0,0 +1,296 @@
+import os
+import sys
+import math
+import logging
+from dataclasses import dataclass, replace
+from typing import Optional
+
+# Path for core modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from core.db import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+# Default ANN method for new indexes ('hnsw' or 'ivfflat')
+ANN_METHOD = os.environ.get("VAULT_ANN_METHOD", "hnsw")
+# Default recall/latency trade-off for search_l3 (profile name or 0.0-1.0)
+ANN_RECALL = os.environ.get("VAULT_ANN_RECALL", "balanced")
+
+# Query-time knobs per profile. Both GUCs are set; pgvector ignores the one for the other method.
+RECALL_PROFILES = {
+    "fast": {"hnsw.ef_search": 20, "ivfflat.probes": 1},
+    "balanced": {"hnsw.ef_search": 64, "ivfflat.probes": 10},
+    "accurate": {"hnsw.ef_search": 200, "ivfflat.probes": 40},
+    "exact": {"hnsw.ef_search": 1000, "ivfflat.probes": 1000},
+}
+EF_SEARCH_RANGE = (10, 400)
+PROBES_RANGE = (1, 100)
+
+# Scoped and metadata-filtered searches on pgvector >= 0.8 keep scanning the index
+# until enough rows pass the filter ('strict_order', 'relaxed_order' or 'off').
+# Older versions run filtered searches as an exact scan over the filtered rows.
+ITERATIVE_SCAN = os.environ.get("VAULT_ANN_ITERATIVE_SCAN", "strict_order")
+ITERATIVE_SCAN_MODES = ("strict_order", "relaxed_order", "off")
+PGVECTOR_VERSION_SQL = "SELECT extversion FROM pg_extension WHERE extname = 'vector'"
+# Without iterative scans the scope condition filters the index scan's output, so the
+# scan is widened by the scopes' share of l3_snippets; scopes are counted up to this many rows.
+SCOPE_COUNT_CAP = 100000
+HNSW_MAX_EF_SEARCH = 1000  # pgvector's upper bound for hnsw.ef_search
+SCOPE_SHARE_SQL = """
+    SELECT (SELECT count(*) FROM (SELECT 1 FROM l3_snippets WHERE scope_id = ANY({scopes}) LIMIT {cap}) s),
+           (SELECT reltuples::int8 FROM pg_class WHERE oid = 'l3_snippets'::regclass)
+"""
+
+VECTOR_TABLES = ("l3_snippets", "l2_digests")
+
+@dataclass
+class IndexSpec:
+    """Describes one ANN index over a vector column."""
+    table: str
+    method: str = ANN_METHOD
+    m: int = 16                   # HNSW: graph degree
+    ef_construction: int = 64     # HNSW: build-time candidate list
+    lists: Optional[int] = None   # IVFFlat: clusters (None = rows/1000, min 10)
+    column: str = "embedding"
+    opclass: str = "vector_cosine_ops"
+
+    def __post_init__(self):
+        if self.table not in VECTOR_TABLES:
+            raise ValueError(f"Unknown vector table: {self.table}")
+        if self.method not in ("hnsw", "ivfflat"):
+            raise ValueError(f"Unknown ANN method: {self.method}")
+
+    @property
+    def name(self):
+        return f"idx_{self.table}_{self.column}_{self.method}"
+
+    def with_params(self):
+        if self.method == "hnsw":
+            return f"(m = {int(self.m)}, ef_construction = {int(self.ef_construction)})"
+        return f"(lists = {int(self.lists or 10)})"
+
+    def create_sql(self, name=None, concurrently=True):
+        return (
+            f"CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}IF NOT EXISTS {name or self.name} "
+            f"ON {self.table} USING {self.method} ({self.column} {self.opclass}) WITH {self.with_params()}"
+        )
+
+DEFAULT_SPECS = [IndexSpec("l3_snippets"), IndexSpec("l2_digests")]
+
+def search_settings(recall=None):
+    """
+    Maps a recall/latency knob to pgvector query GUCs.
+    `recall` is a profile name from RECALL_PROFILES or a float in [0, 1]
+    (0 = fastest, 1 = highest recall).
+    """
+    recall = ANN_RECALL if recall is None else recall
+    if isinstance(recall, str):
+        if recall in RECALL_PROFILES:
+            return dict(RECALL_PROFILES[recall])
+        recall = float(recall)
+    recall = min(max(float(recall), 0.0), 1.0)
+    ef_lo, ef_hi = EF_SEARCH_RANGE
+    pr_lo, pr_hi = PROBES_RANGE
+    return {
+        "hnsw.ef_search": int(round(ef_lo + (ef_hi - ef_lo) * recall)),
+        "ivfflat.probes": int(round(pr_lo + (pr_hi - pr_lo) * recall)),
+    }
+
+def supports_iterative_scan(version):
+    """True for pgvector versions (extversion strings) with hnsw/ivfflat.iterative_scan."""
+    try:
+        return tuple(int(p) for p in str(version).split(".")[:2]) >= (0, 8)
+    except ValueError:
+        return False
+
+def _iterative_mode():
+    return ITERATIVE_SCAN if ITERATIVE_SCAN in ITERATIVE_SCAN_MODES else "strict_order"
+
+def uses_iterative_scan(iterative):
+    """True when searches run iterative index scans (pgvector >= 0.8 and not turned off)."""
+    return bool(iterative) and _iterative_mode() != "off"
+
+def filter_settings(iterative, filtered, scope_share=None, settings=None):
+    """
+    GUCs that keep a scoped or filtered ANN search returning a full k: iterative index
+    scans where pgvector has them. Otherwise metadata filters turn index scans off, so
+    Postgres filters first and sorts the survivors exactly; an unfiltered search widens
+    ef_search/probes in `settings` by 1 / `scope_share` (see scope_share()), falling
+    back to the exact scan for a scope too small for the widest HNSW scan.
+    """
+    if uses_iterative_scan(iterative):
+        # ivfflat only scans iteratively in relaxed order; callers re-sort by distance
+        return {"hnsw.iterative_scan": _iterative_mode(), "ivfflat.iterative_scan": "relaxed_order"}
+    if filtered:
+        return {"enable_indexscan": "off"}
+    if scope_share is None or settings is None:
+        return {}
+    share, capped = scope_share
+    if share >= 1.0:
+        return {}
+    ef_search = math.ceil(settings["hnsw.ef_search"] / max(share, 1e-9))
+    if ef_search > HNSW_MAX_EF_SEARCH and not capped:
+        return {"enable_indexscan": "off"}
+    return {
+        "hnsw.ef_search": min(ef_search, HNSW_MAX_EF_SEARCH),
+        "ivfflat.probes": math.ceil(settings["ivfflat.probes"] / max(share, 1e-9)),
+    }
+
+def scope_share(count, table_rows):
+    """
+    (share of l3_snippets in the searched scopes, whether the count hit SCOPE_COUNT_CAP)
+    from SCOPE_SHARE_SQL. A capped count understates the share of a large scope.
+    """
+    count = int(count or 0)
+    return count / max(int(table_rows or 0), count, 1), count >= SCOPE_COUNT_CAP
+
+_iterative_scan = None
+
+def iterative_scan_available(cur):
+    """Checks the installed pgvector once per process."""
+    global _iterative_scan
+    if _iterative_scan is None:
+        cur.execute(PGVECTOR_VERSION_SQL)
+        row = cur.fetchone()
+        _iterative_scan = bool(row) and supports_iterative_scan(row[0])
+    return _iterative_scan
+
+async def iterative_scan_available_async(conn):
+    global _iterative_scan
+    if _iterative_scan is None:
+        _iterative_scan = supports_iterative_scan(await conn.fetchval(PGVECTOR_VERSION_SQL))
+    return _iterative_scan
+
+def set_local_sql(guc, value):
+    # Values come from search_settings/filter_settings: ints or fixed keywords
+    return f"SET LOCAL {guc} = {value if isinstance(value, str) else int(value)}"
+
+def apply_search_settings(cur, recall=None, limit=None, filtered=False, scope_ids=None):
+    """
+    Sets the ANN knobs for the current transaction only (SET LOCAL). `filtered` adds
+    filter_settings for a search with metadata filters; `scope_ids` for one over scopes.
+    """
+    settings = search_settings(recall)
+    if limit:
+        # HNSW never returns more than ef_search candidates
+        settings["hnsw.ef_search"] = max(settings["hnsw.ef_search"], int(limit))
+    iterative = iterative_scan_available(cur)
+    share = None
+    if scope_ids is not None and not filtered and not uses_iterative_scan(iterative):
+        cur.execute(SCOPE_SHARE_SQL.format(scopes="%s::uuid[]", cap="%s"), (list(scope_ids), SCOPE_COUNT_CAP))
+        share = scope_share(*cur.fetchone())
+    settings.update(filter_settings(iterative, filtered, share, settings))
+    for guc, value in settings.items():
+        cur.execute(set_local_sql(guc, value))
+    return settings
+
+def _autocommit_connection():
+    # CREATE/DROP INDEX CONCURRENTLY cannot run inside a transaction block, and a
+    # long build must not pin a pooled connection, so use a dedicated one.
+    conn = get_db_connection()
+    conn.autocommit = True
+    return conn
+
+def _index_validity(cur, name):
+    """True/False for an existing index's indisvalid, None if it does not exist."""
+    cur.execute("""
+        SELECT i.indisvalid FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid
+        WHERE c.relname = %s AND c.relkind = 'i'
+    """, (name,))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+def _resolve_lists(cur, spec):
+    if spec.method != "ivfflat" or spec.lists:
+        return spec
+    cur.execute(f"SELECT count(*) FROM {spec.table}")
+    rows = cur.fetchone()[0]
+    return replace(spec, lists=max(rows // 1000, 10))
+
+def ensure_index(spec, concurrently=True, rebuild=False, maintenance_work_mem=None):
+    """
+    Creates the index if missing. Builds CONCURRENTLY by default so ingest keeps writing.
+    A leftover invalid index (interrupted concurrent build) is dropped and rebuilt.
+    rebuild=True builds a replacement side-by-side and swaps it in (new parameters).
+    Returns the action taken: 'exists', 'created' or 'rebuilt'.
+    """
+    conn = _autocommit_connection()
+    try:
+        with conn.cursor() as cur:
+            if maintenance_work_mem:
+                cur.execute("SET maintenance_work_mem = %s", (maintenance_work_mem,))
+            spec = _resolve_lists(cur, spec)
+            valid = _index_validity(cur, spec.name)
+            drop = "DROP INDEX CONCURRENTLY" if concurrently else "DROP INDEX"
+
+            if valid is False:
+                logger.warning("Dropping invalid index left by an interrupted build index=%s", spec.name)
+                cur.execute(f"{drop} IF EXISTS {spec.name}")
+                valid = None
+
+            if valid is None:
+                cur.execute(spec.create_sql(concurrently=concurrently))
+                return "created"
+            if not rebuild:
+                return "exists"
+
+            # Side-by-side rebuild: queries keep using the old index until the swap, and the
+            # two renames commit together, so the name never points at no index.
+            tmp_name, old_name = f"{spec.name}_rebuild", f"{spec.name}_old"
+            cur.execute(f"{drop} IF EXISTS {tmp_name}")
+            cur.execute(f"{drop} IF EXISTS {old_name}")  # left by an interrupted swap
+            cur.execute(spec.create_sql(name=tmp_name, concurrently=concurrently))
+            cur.execute("BEGIN")
+            cur.execute(f"ALTER INDEX {spec.name} RENAME TO {old_name}")
+            cur.execute(f"ALTER INDEX {tmp_name} RENAME TO {spec.name}")
+            cur.execute("COMMIT")
+            cur.execute(f"{drop} IF EXISTS {old_name}")
+            return "rebuilt"
+    finally:
+        conn.close()
+
+def ensure_indexes(specs=None, **kwargs):
+    """Ensures every spec (default: HNSW on l3_snippets and l2_digests)."""
+    return {spec.name: ensure_index(spec, **kwargs) for spec in (specs or DEFAULT_SPECS)}
+
+def drop_index(spec, concurrently=True):
+    conn = _autocommit_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"DROP INDEX {'CONCURRENTLY ' if concurrently else ''}IF EXISTS {spec.name}")
+    finally:
+        conn.close()
+
+def index_status():
+    """Lists ANN indexes on the vector tables and any index builds in progress."""
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT c.relname, t.relname, am.amname, i.indisvalid, pg_relation_size(c.oid)
+                FROM pg_index i
+                JOIN pg_class c ON c.oid = i.indexrelid
+                JOIN pg_class t ON t.oid = i.indrelid
+                JOIN pg_am am ON am.oid = c.relam
+                WHERE t.relname = ANY(%s) AND am.amname IN ('hnsw', 'ivfflat')
+                ORDER BY c.relname
+            """, (list(VECTOR_TABLES),))
+            indexes = [
+                {"name": name, "table": table, "method": method, "valid": valid, "size_bytes": size}
+                for name, table, method, valid, size in cur.fetchall()
+            ]
+            cur.execute("""
+                SELECT t.relname, p.phase, p.blocks_done, p.blocks_total, p.tuples_done, p.tuples_total
+                FROM pg_stat_progress_create_index p
+                JOIN pg_class t ON t.oid = p.relid
+                WHERE t.relname = ANY(%s)
+            """, (list(VECTOR_TABLES),))
+            builds = [
+                {"table": table, "phase": phase, "blocks_done": bd, "blocks_total": bt,
+                 "tuples_done": td, "tuples_total": tt}
+                for table, phase, bd, bt, td, tt in cur.fetchall()
+            ]
+            conn.rollback()
+            return {"indexes": indexes, "builds_in_progress": builds}
+    finally:
+        conn.close()
@@ -0,0 +1,115 @@
+import os
+import json
+import time
+import uuid
+import fcntl
+from contextlib import contextmanager
+from collections import namedtuple
+import numpy as np
+
+# Per-scope embedding snapshots for in-memory vector backends. A scope directory holds
+#   embeddings.f32  contiguous unit-normalized float32 rows (count x dimension)
+#   ids.bin         (snippet_id, record_id) as 16+16 raw UUID bytes per row
+#   meta.json       {format, scope_id, dimension, count, watermark, updated_at}
+# Writers append rows to the two data files and then atomically replace meta.json, so
+# `count` in meta is authoritative and a reader never sees a torn row: bytes past it
+# (an interrupted append) are truncated by the next writer. `watermark` is the
+# source_event_id up to which the scope is complete; readers replay events after it.
+
+SNAPSHOT_DIR = os.environ.get("VAULT_SNAPSHOT_DIR", "")
+SNAPSHOT_FORMAT = 1
+
+EMBEDDINGS_FILE = "embeddings.f32"
+IDS_FILE = "ids.bin"
+META_FILE = "meta.json"
+LOCK_FILE = ".lock"
+
+IDS_DTYPE = np.dtype([("snippet_id", "V16"), ("record_id", "V16")])
+_NULL_UUID = bytes(16)
+
+Snapshot = namedtuple("Snapshot", ["scope_id", "embeddings", "snippet_ids", "record_ids", "watermark", "count"])
+
+def scope_dir(scope_id, root=None):
+    return os.path.join(root or SNAPSHOT_DIR, str(scope_id))
+
+def uuid_bytes(value):
+    if value is None:
+        return _NULL_UUID
+    return value.bytes if isinstance(value, uuid.UUID) else uuid.UUID(str(value)).bytes
+
+def bytes_uuid(value):
+    value = bytes(value)
+    return None if value == _NULL_UUID else str(uuid.UUID(bytes=value))
+
+def read_meta(scope_id, root=None):
+    try:
+        with open(os.path.join(scope_dir(scope_id, root), META_FILE)) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return meta if meta.get("format") == SNAPSHOT_FORMAT else None
+
+def list_snapshots(root=None):
+    """Scope ids that have a readable snapshot."""
+    root = root or SNAPSHOT_DIR
+    if not root or not os.path.isdir(root):
+        return []
+    return [name for name in os.listdir(root) if read_meta(name, root) is not None]
+
+def open_snapshot(scope_id, root=None):
+    """Memory-maps a scope's snapshot read-only; None if there is none."""
+    meta = read_meta(scope_id, root)
+    if meta is None:
+        return None
+    path, count, dim = scope_dir(scope_id, root), meta["count"], meta["dimension"]
+    if count == 0:
+        embeddings = np.empty((0, dim), dtype=np.float32)
+        ids = np.empty(0, dtype=IDS_DTYPE)
+    else:
+        embeddings = np.memmap(os.path.join(path, EMBEDDINGS_FILE), dtype=np.float32, mode="r", shape=(count, dim))
+        ids = np.memmap(os.path.join(path, IDS_FILE), dtype=IDS_DTYPE, mode="r", shape=(count,))
+    return Snapshot(str(scope_id), embeddings, ids["snippet_id"], ids["record_id"], meta["watermark"], count)
+
+@contextmanager
+def snapshot_lock(scope_id, root=None):
+    """Exclusive per-scope writer lock (dream workers may run in several processes)."""
+    path = scope_dir(scope_id, root)
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, LOCK_FILE), "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def append_snapshot(scope_id, embeddings, snippet_ids, record_ids, watermark, dimension, root=None):
+    """
+    Appends unit-normalized rows and advances the watermark. Call under snapshot_lock.
+    Returns the new row count.
+    """
+    path = scope_dir(scope_id, root)
+    os.makedirs(path, exist_ok=True)
+    meta = read_meta(scope_id, root) or {"count": 0, "watermark": 0}
+    count = meta["count"]
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32).reshape(-1, dimension)
+    ids = np.empty(len(snippet_ids), dtype=IDS_DTYPE)
+    ids["snippet_id"] = [uuid_bytes(s) for s in snippet_ids]
+    ids["record_id"] = [uuid_bytes(r) for r in record_ids]
+    for name, itemsize, data in ((EMBEDDINGS_FILE, 4 * dimension, embeddings), (IDS_FILE, IDS_DTYPE.itemsize, ids)):
+        with open(os.path.join(path, name), "ab") as f:
+            f.truncate(count * itemsize)  # drop a torn tail from an interrupted append
+            f.seek(count * itemsize)
+            f.write(data.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+    new_meta = {
+        "format": SNAPSHOT_FORMAT, "scope_id": str(scope_id), "dimension": dimension,
+        "count": count + len(ids), "watermark": max(meta["watermark"], watermark), "updated_at": time.time(),
+    }
+    tmp = os.path.join(path, META_FILE + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(new_meta, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, os.path.join(path, META_FILE))
+    return new_meta["count"]
@@ -1,70 +1,294 @@
 import psycopg2
-from pgvector.psycopg2 import register_vector
 import os
 import sys
-import numpy as np
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from collections import namedtuple
+from dataclasses import dataclass
+from typing import Optional, Tuple
+from psycopg2.extras import Json
 
 # Path for secure utility
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from utils.secret_utility import get_secret
-from core.db import get_db_connection
+from core.db import db_connection
+from core.vector_index import apply_search_settings
+from core.vector_codec import copy_binary, vector_literal
+# Re-exported: MockEncoder used to live here
+from core.encoders import MockEncoder, get_encoder
 
-class VectorStore:
-    def __init__(self):
-        self.conn = get_db_connection()
-        # Skipped register_vector as it can hang in some environments
-        self.cur = self.conn.cursor()
+logger = logging.getLogger(__name__)
 
+SNIPPET_COPY_COLUMNS = (
+    ("record_id", "uuid"), ("scope_id", "uuid"), ("text", "text"),
+    ("metadata", "jsonb"), ("embedding", "vector"), ("source_event_id", "int8"),
+)
+
+# Hybrid retrieval: a lexical candidate list (exact identifiers, error strings and
+# paths that embeddings blur) fused with the vector candidates by reciprocal rank.
+# Used whenever search_l3 is given the query text; "0" restores vector-only ranking.
+L3_HYBRID = os.environ.get("VAULT_L3_HYBRID", "1") == "1"
+# Reciprocal rank fusion constant: score = sum over lists of 1 / (RRF_K + rank)
+RRF_K = int(os.environ.get("VAULT_RRF_K", "60"))
+# Each candidate list holds this many times the requested limit
+HYBRID_CANDIDATE_FACTOR = int(os.environ.get("VAULT_HYBRID_CANDIDATE_FACTOR", "4"))
+
+# One L3 hit plus the L0 fields needed to render it as an authoritative anchor.
+# Still indexable like the old (snippet_id, record_id, text, metadata, similarity) rows.
+# `score` is the fused rank score of a hybrid search (None for vector-only results).
+L3Match = namedtuple("L3Match", [
+    "snippet_id", "record_id", "text", "metadata", "similarity",
+    "provenance", "confidence", "record_type", "path", "created_at", "score",
+], defaults=(None,))
+
+@dataclass(frozen=True)
+class L3Filter:
+    """
+    Metadata constraints on L3 snippets (the fields consolidate_l3 writes). `path` is
+    a prefix ("src/api/"); the others match any of their values. None does not filter.
+    """
+    path: Optional[str] = None
+    artifact_type: Optional[Tuple[str, ...]] = None
+    branch: Optional[Tuple[str, ...]] = None
+    source: Optional[Tuple[str, ...]] = None
+
+    def __post_init__(self):
+        for name in ("artifact_type", "branch", "source"):
+            value = getattr(self, name)
+            if isinstance(value, str):
+                object.__setattr__(self, name, (value,))
+            elif value is not None:
+                object.__setattr__(self, name, tuple(value) or None)
+
+    def __bool__(self):
+        return any(getattr(self, name) for name in ("path", "artifact_type", "branch", "source"))
+
+    @classmethod
+    def of(cls, value):
+        """An L3Filter from an L3Filter, a dict of its fields or None; None if it filters nothing."""
+        if value is None:
+            return None
+        flt = value if isinstance(value, cls) else cls(**value)
+        return flt or None
+
+    def as_dict(self):
+        """JSON-friendly form (cache keys, logs)."""
+        return {name: getattr(self, name) for name in ("path", "artifact_type", "branch", "source") if getattr(self, name)}
+
+    def where(self, placeholder):
+        """
+        (SQL conditions on l3_snippets, params) with placeholder(i) rendering the i-th
+        param. Single values share one jsonb containment, which the GIN index on
+        metadata serves; several values for a field become an OR of containments.
+        JSON params are dicts (callers adapt them for their driver).
+        """
+        conditions, params = [], []
+
+        def param(value):
+            params.append(value)
+            return placeholder(len(params) - 1)
+
+        fields = {name: getattr(self, name) for name in ("artifact_type", "branch", "source") if getattr(self, name)}
+        single = {name: values[0] for name, values in fields.items() if len(values) == 1}
+        if single:
+            conditions.append(f"metadata @> {param(single)}::jsonb")
+        for name, values in fields.items():
+            if len(values) > 1:
+                conditions.append("(" + " OR ".join(f"metadata @> {param({name: v})}::jsonb" for v in values) + ")")
+        if self.path:
+            # Prefix match served by the (scope_id, metadata->>'path') text_pattern_ops index
+            escaped = self.path.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            conditions.append(f"metadata->>'path' LIKE {param(escaped + '%')}")
+        return conditions, params
+
+    def matches(self, metadata):
+        """The same constraints in Python, for in-memory backends."""
+        metadata = metadata or {}
+        for name in ("artifact_type", "branch", "source"):
+            values = getattr(self, name)
+            if values and metadata.get(name) not in values:
+                return False
+        return not self.path or str(metadata.get("path") or "").startswith(self.path)
+
+def filter_sql(l3_filter, placeholder):
+    """(" AND ..." to append to a scope_id WHERE clause, params) for an optional L3Filter."""
+    if not l3_filter:
+        return "", []
+    conditions, params = l3_filter.where(placeholder)
+    return "".join(f" AND {c}" for c in conditions), params
+
+# Vector-only search. Using <=> for cosine distance in pgvector. Ordering by the raw
+# distance (not the derived similarity) lets the HNSW/IVFFlat index serve it, and the
+# query vector is sent and parsed once. L0 fields are joined onto the top-k only,
+# after the ANN scan. Filters sit in the scan's WHERE so the index (iteratively) or
+# the planner applies them before the LIMIT, never after it.
+VECTOR_L3_SQL = """
+    SELECT n.snippet_id, n.record_id, n.text, n.metadata, 1 - n.distance AS cosine_similarity,
+           r.provenance, r.confidence_hint, r.record_type, r.path, r.created_at
+    FROM (
+        SELECT snippet_id, record_id, text, metadata, embedding <=> {vec}::vector AS distance
+        FROM l3_snippets
+        WHERE scope_id = ANY({scopes}::uuid[]){filters}
+        ORDER BY distance
+        LIMIT {limit}
+    ) n
+    LEFT JOIN records_l0 r ON r.record_id = n.record_id
+    ORDER BY n.distance
+"""
+
+# Both candidate lists and the fusion in one statement. Each list is cut at
+# {candidates} inside its own subquery so the HNSW index serves the vector side and
+# the GIN index on text_tsv the lexical side. The lexical query ORs the query's
+# terms ('english' drops stopwords), so a natural-language question still matches
+# snippets that share only its identifiers. Placeholders are filled per driver.
+HYBRID_L3_SQL = """
+    WITH semantic AS (
+        SELECT snippet_id, row_number() OVER (ORDER BY distance) AS rank
+        FROM (
+            SELECT snippet_id, embedding <=> {vec}::vector AS distance
+            FROM l3_snippets
+            WHERE scope_id = ANY({scopes}::uuid[]){filters}
+            ORDER BY distance
+            LIMIT {candidates}
+        ) s
+    ),
+    lexical AS (
+        SELECT snippet_id, row_number() OVER (ORDER BY lex_rank DESC) AS rank
+        FROM (
+            SELECT snippet_id, ts_rank(text_tsv, q) AS lex_rank
+            FROM l3_snippets
+            CROSS JOIN (SELECT CAST(replace(plainto_tsquery('english', {query})::text, ' & ', ' | ') AS tsquery) AS q) t
+            WHERE scope_id = ANY({scopes}::uuid[]) AND text_tsv @@ q{filters}
+            ORDER BY lex_rank DESC
+            LIMIT {candidates}
+        ) l
+    ),
+    fused AS (
+        SELECT snippet_id, sum(1.0 / ({k} + rank))::float8 AS score
+        FROM (SELECT snippet_id, rank FROM semantic UNION ALL SELECT snippet_id, rank FROM lexical) c
+        GROUP BY snippet_id
+        ORDER BY score DESC
+        LIMIT {limit}
+    )
+    SELECT n.snippet_id, n.record_id, n.text, n.metadata, 1 - (n.embedding <=> {vec}::vector) AS cosine_similarity,
+           r.provenance, r.confidence_hint, r.record_type, r.path, r.created_at, f.score
+    FROM fused f
+    JOIN l3_snippets n ON n.snippet_id = f.snippet_id
+    LEFT JOIN records_l0 r ON r.record_id = n.record_id
+    ORDER BY f.score DESC, cosine_similarity DESC
+"""
+
+def rrf_scores(rankings, k=None):
+    """{key: fused score} for best-first key lists (reciprocal rank fusion, ranks from 1)."""
+    k = RRF_K if k is None else k
+    scores = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, 1):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+    return scores
+
+def hybrid_candidates(limit):
+    return max(int(limit), 1) * HYBRID_CANDIDATE_FACTOR
+
+def snippet_rows(snippets):
+    """Pads (record_id, scope_id, text, metadata, embedding) tuples with a None source_event_id."""
+    return [s if len(s) == 6 else (*s, None) for s in snippets]
+
+class VectorBackend(ABC):
+    """
+    L3 snippet index interface. Snippets are (record_id, scope_id, text, metadata,
+    embedding[, source_event_id]) tuples; searches return L3Match rows, best first.
+    """
     def add_snippet(self, record_id, scope_id, text, metadata, embedding):
         """Inserts a new L3 snippet with its vector embedding."""
+        return self.add_snippets([(record_id, scope_id, text, metadata, embedding)]) == 1
+
+    @abstractmethod
+    def add_snippets(self, snippets, cur=None):
+        """Writes snippets; returns the number written (0 on failure)."""
+
+    @abstractmethod
+    def search_l3(self, scope_ids, query_embedding, limit=10, recall=None, query_text=None, l3_filter=None):
+        """
+        Top-`limit` snippets of `scope_ids` by cosine similarity or, given `query_text`
+        (and L3_HYBRID), by rank fusion of the vector and lexical candidates. With
+        `l3_filter` (an L3Filter) only matching snippets are ranked. Raises on failure.
+        """
+
+    async def search_l3_async(self, scope_ids, query_embedding, limit=10, recall=None, query_text=None, l3_filter=None):
+        return await asyncio.to_thread(self.search_l3, scope_ids, query_embedding, limit, recall, query_text, l3_filter)
+
+    def close(self):
+        pass
+
+class VectorStore(VectorBackend):
+    """
+    pgvector backend. Each call borrows a connection from the shared pool; the
+    pgvector typecaster is registered once per process by the pool (core.vector_codec).
+    """
+    def add_snippets(self, snippets, cur=None):
+        """
+        Bulk-inserts snippet tuples with binary COPY. With `cur`, writes inside the
+        caller's transaction and leaves the commit to it. Returns the number of rows
+        written (0 on failure).
+        """
+        snippets = snippet_rows(snippets)
+        if cur is not None:
+            return copy_binary(cur, "l3_snippets", SNIPPET_COPY_COLUMNS, snippets)
         try:
-            # Manually cast to vector string for Postgres
-            emb_str = "[" + ",".join(map(str, embedding)) + "]"
-            self.cur.execute("""
-                INSERT INTO l3_snippets (record_id, scope_id, text, metadata, embedding)
-                VALUES (%s, %s, %s, %s, %s::vector)
-            """, (record_id, scope_id, text, metadata, emb_str))
-            self.conn.commit()
-            return True
+            with db_connection() as conn, conn.cursor() as cur:
+                count = copy_binary(cur, "l3_snippets", SNIPPET_COPY_COLUMNS, snippets)
+                conn.commit()
+                return count
         except Exception as e:
-            print(f"Error adding snippet to L3: {e}")
-            self.conn.rollback()
-            return False
+            logger.error("L3 snippet write failed rows=%d error=%s", len(snippets), e)
+            return 0
 
-    def search_l3(self, scope_ids, query_embedding, limit=10):
-        """Performs a semantic search across multiple scopes."""
+    def search_l3(self, scope_ids, query_embedding, limit=10, recall=None, query_text=None, l3_filter=None):
+        """
+        Performs a semantic search across multiple scopes. Returns L3Match rows that
+        carry the L0 provenance/confidence of each hit (one round trip for any limit).
+        `recall` trades latency for ANN recall ('fast', 'balanced', 'accurate',
+        'exact' or 0.0-1.0); see core.vector_index.search_settings. With `query_text`
+        the lexical candidates are fused in (HYBRID_L3_SQL), still one round trip.
+        `l3_filter` restricts the scan itself, so a filtered search still returns `limit`.
+        A failed query raises, so the compiler reports the tier unavailable rather than empty.
+        """
+        l3_filter = L3Filter.of(l3_filter)
+        filters, filter_params = filter_sql(l3_filter, lambda i: f"%(f{i})s")
+        params = {f"f{i}": Json(v) if isinstance(v, dict) else v for i, v in enumerate(filter_params)}
+        params.update(vec=vector_literal(query_embedding), scopes=scope_ids, limit=limit)
         try:
-            # Using <=> for cosine distance in pgvector
-            emb_str = "[" + ",".join(map(str, query_embedding)) + "]"
-            self.cur.execute("""
-                SELECT snippet_id, record_id, text, metadata, 1 - (embedding <=> %s::vector) AS cosine_similarity
-                FROM l3_snippets
-                WHERE scope_id = ANY(%s::uuid[])
-                ORDER BY cosine_similarity DESC
-                LIMIT %s
-            """, (emb_str, scope_ids, limit))
-            return self.cur.fetchall()
+            with db_connection() as conn, conn.cursor() as cur:
+                if query_text and L3_HYBRID:
+                    params.update(query=query_text, candidates=hybrid_candidates(limit), k=RRF_K)
+                    apply_search_settings(cur, recall, params["candidates"], filtered=bool(l3_filter), scope_ids=scope_ids)
+                    cur.execute(HYBRID_L3_SQL.format(
+                        vec="%(vec)s", scopes="%(scopes)s", query="%(query)s", filters=filters,
+                        candidates="%(candidates)s", k="%(k)s", limit="%(limit)s",
+                    ), params)
+                else:
+                    apply_search_settings(cur, recall, limit, filtered=bool(l3_filter), scope_ids=scope_ids)
+                    cur.execute(VECTOR_L3_SQL.format(
+                        vec="%(vec)s", scopes="%(scopes)s", filters=filters, limit="%(limit)s",
+                    ), params)
+                return [L3Match(*row) for row in cur.fetchall()]
         except Exception as e:
-            print(f"L3 Search Error: {e}")
-            return []
+            logger.warning("L3 search failed scopes=%d error=%s", len(scope_ids), e)
+            raise
+
+    async def search_l3_async(self, scope_ids, query_embedding, limit=10, recall=None, query_text=None, l3_filter=None):
+        # asyncpg twin of search_l3 (the /context request path)
+        from core.async_db import search_l3_async
+        return await search_l3_async(
+            scope_ids, query_embedding, limit=limit, recall=recall, query_text=query_text, l3_filter=l3_filter,
+        )
 
     def close(self):
-        self.cur.close()
-        self.conn.close()
-
-# Mock Embedding Engine for phase 1
-class MockEncoder:
-    def __init__(self, dimension=1536):
-        self.dimension = dimension
-
-    def encode(self, text):
-        """Generates a stable mock embedding for a given text."""
-        # Use simple hash-based seed for reproducibility in dev
-        import hashlib
-        seed = int(hashlib.md5(text.encode()).hexdigest(), 16) % (2**32)
-        random_gen = np.random.RandomState(seed)
-        vec = random_gen.randn(self.dimension)
-        return vec / np.linalg.norm(vec)
+        # Connections are borrowed per call from the shared pool; nothing to release here.
+        pass
+
+PgVectorBackend = VectorStore
 
 if __name__ == "__main__":
     # Smoke test
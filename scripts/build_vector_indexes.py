@@ -0,0 +1,40 @@
+import os
+import sys
+import json
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from core.vector_index import IndexSpec, VECTOR_TABLES, ensure_index, drop_index, index_status
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage pgvector ANN indexes on l3_snippets / l2_digests")
+    parser.add_argument("--table", choices=VECTOR_TABLES, action="append",
+                        help="table to index (repeatable; default: both)")
+    parser.add_argument("--method", choices=["hnsw", "ivfflat"], default="hnsw")
+    parser.add_argument("--m", type=int, default=16, help="HNSW graph degree")
+    parser.add_argument("--ef-construction", type=int, default=64, help="HNSW build candidate list")
+    parser.add_argument("--lists", type=int, default=None, help="IVFFlat clusters (default rows/1000)")
+    parser.add_argument("--maintenance-work-mem", default=None, help="e.g. 2GB, speeds up large builds")
+    parser.add_argument("--rebuild", action="store_true", help="build side-by-side with new parameters and swap")
+    parser.add_argument("--blocking", action="store_true", help="build without CONCURRENTLY (blocks writes)")
+    parser.add_argument("--drop", action="store_true", help="drop the index instead of building it")
+    parser.add_argument("--status", action="store_true", help="print index and build status only")
+    args = parser.parse_args()
+
+    if args.status:
+        print(json.dumps(index_status(), indent=2))
+        return
+
+    for table in args.table or VECTOR_TABLES:
+        spec = IndexSpec(table, method=args.method, m=args.m,
+                         ef_construction=args.ef_construction, lists=args.lists)
+        if args.drop:
+            drop_index(spec, concurrently=not args.blocking)
+            print(f"{spec.name}: dropped")
+            continue
+        action = ensure_index(spec, concurrently=not args.blocking, rebuild=args.rebuild,
+                              maintenance_work_mem=args.maintenance_work_mem)
+        print(f"{spec.name}: {action}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+import os
+import sys
+import json
+import time
+import argparse
+import redis
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from core.hot_symbols import HotSymbolStore, L1CompactionWorker
+
+def main():
+    parser = argparse.ArgumentParser(description="Compact L1 hot-symbol deltas into versioned bases")
+    parser.add_argument("--scope", action="append", help="compact this scope now (repeatable)")
+    parser.add_argument("--loop", action="store_true", help="keep sweeping every --interval seconds")
+    parser.add_argument("--interval", type=float, default=30.0)
+    parser.add_argument("--status", action="store_true", help="print delta size/lag for --scope and exit")
+    args = parser.parse_args()
+
+    store = HotSymbolStore(redis.Redis(host='localhost', port=6379, decode_responses=True))
+    if args.status:
+        for scope_id in args.scope or set(store.scopes_with_delta()):
+            print(json.dumps(store.compaction_status(scope_id)))
+        return
+    if args.scope:
+        for scope_id in args.scope:
+            print(f"{scope_id}: version {store.compact(scope_id)}")
+        return
+
+    worker = L1CompactionWorker(store, interval=args.interval)
+    while True:
+        compacted = worker.run_once()
+        print(f"Compacted {len(compacted)} scope(s): {json.dumps(worker.stats)}")
+        if not args.loop:
+            break
+        time.sleep(args.interval)
+
+if __name__ == "__main__":
+    main()
@@ -1,60 +1,261 @@
 import os
 import sys
-import json
+import time
+import logging
+import argparse
+from psycopg2.extras import execute_values
 
 # Path for core logic
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from core.db import get_db_connection
-from core.l2_processor import L2Processor
-
-def dream_l2_summary():
-    """Builds the first L2 Session Digest (The 'Bird's Eye View')."""
-    print("--- DREAM CYCLE: L2 PYRAMID BUILD ---")
-    
-    conn = get_db_connection()
-    l2 = L2Processor()
-    
+from core.db import db_connection
+from core.encoders import get_encoder
+from core.summarizers import get_summarizer
+from core.vector_codec import vector_literal
+from core.context_cache import bump_generations
+from core.l2_processor import LOD_LEVELS, affected_digests, parent_of, chunk_lines, digest_uuid
+from core.metrics import configure_logging
+from scripts.dream_l3 import snippet_text
+
+logger = logging.getLogger(__name__)
+
+# Events folded into the pyramid per run; the rest wait for the next run
+L2_MAX_EVENTS = int(os.environ.get("VAULT_L2_MAX_EVENTS", "10000"))
+# A gap in event ids younger than this may be an ingest that has not committed yet, so
+# watermarks stop below it; older gaps are rolled-back inserts and are stepped over
+L2_GAP_TIMEOUT = float(os.environ.get("VAULT_L2_GAP_TIMEOUT", "60"))
+# Most recent L0 records read per changed file, and for the session digest
+L2_MAX_SOURCES = int(os.environ.get("VAULT_L2_MAX_SOURCES", "200"))
+# pg_try_advisory_xact_lock(class, hashtext(scope)): one builder per scope at a time
+L2_LOCK_CLASS = 0x4C32
+
+HORIZON_SQL = """
+    SELECT event_id, created_at > now() - make_interval(secs => %s)
+    FROM event_log WHERE event_id > %s ORDER BY event_id LIMIT %s
+"""
+CHANGES_SQL = """
+    SELECT r.scope_id::text, e.event_id, r.path, r.start_line, r.end_line
+    FROM event_log e
+    JOIN records_l0 r ON r.record_id = e.record_id
+    WHERE e.event_id > %s AND e.event_id <= %s
+"""
+# Latest live (not superseded) records of each changed file
+FILE_RECORDS_SQL = """
+    SELECT p.path, r.start_line, r.end_line, r.record_type, r.payload
+    FROM unnest(%s::text[]) AS p(path)
+    CROSS JOIN LATERAL (
+        SELECT start_line, end_line, record_type, payload, created_at
+        FROM records_l0 r
+        WHERE r.scope_id = %s AND r.path = p.path
+          AND NOT EXISTS (SELECT 1 FROM records_l0 s WHERE s.supersedes = r.record_id)
+        ORDER BY created_at DESC
+        LIMIT %s
+    ) r
+    ORDER BY p.path, r.created_at
+"""
+SESSION_RECORDS_SQL = """
+    SELECT record_type, payload FROM (
+        SELECT record_type, payload, created_at
+        FROM records_l0 r
+        WHERE r.scope_id = %s AND r.path IS NULL
+          AND NOT EXISTS (SELECT 1 FROM records_l0 s WHERE s.supersedes = r.record_id)
+        ORDER BY created_at DESC
+        LIMIT %s
+    ) recent ORDER BY created_at
+"""
+UPSERT_SQL = """
+    INSERT INTO l2_digests (digest_id, scope_id, lod_level, digest_key, parent_id, text, embedding, version, updated_at)
+    VALUES %s
+    ON CONFLICT (digest_id) DO UPDATE SET
+        text = EXCLUDED.text, embedding = EXCLUDED.embedding, parent_id = EXCLUDED.parent_id,
+        version = l2_digests.version + 1, updated_at = now()
+    WHERE l2_digests.text IS DISTINCT FROM EXCLUDED.text
+"""
+UPSERT_TEMPLATE = "(%s, %s, %s, %s, %s, %s, %s::vector, 1, now())"
+# Digests whose sources are all gone (deleted files, emptied chunks) would otherwise keep
+# ranking with their old text; one statement, so parents and children go together
+DELETE_SQL = "DELETE FROM l2_digests WHERE digest_id = ANY(%s::uuid[])"
+WATERMARKS_SQL = """
+    SELECT s.scope_id::text, COALESCE(w.event_id,
+        CASE WHEN EXISTS (SELECT 1 FROM records_l0 r WHERE r.scope_id = s.scope_id) THEN 0 END)
+    FROM scopes s LEFT JOIN l2_watermarks w ON w.scope_id = s.scope_id
+"""
+WATERMARK_SQL = """
+    INSERT INTO l2_watermarks (scope_id, event_id) VALUES (%s, %s)
+    ON CONFLICT (scope_id) DO UPDATE SET
+        event_id = GREATEST(l2_watermarks.event_id, EXCLUDED.event_id), updated_at = now()
+"""
+
+def digest_label(level, key):
+    if level == "chunk":
+        path, first, last = chunk_lines(key)
+        return f"{path} L{first}-{last}"
+    return key if level != "session" else ""
+
+def settled_horizon(cur, after, limit=L2_MAX_EVENTS, gap_timeout=L2_GAP_TIMEOUT):
+    """
+    Highest event id the pyramid may be built to: walks up from `after` through at
+    most `limit` events and stops below a recent gap in the id sequence, where an
+    ingest transaction may still commit an event.
+    """
+    cur.execute(HORIZON_SQL, (gap_timeout, after, limit))
+    horizon = after
+    for event_id, recent in cur.fetchall():
+        if event_id != horizon + 1 and recent:
+            break
+        horizon = event_id
+    return horizon
+
+def regenerate(affected, file_records, session_records, stored_children, summarizer):
+    """
+    Texts for every affected digest, built bottom-up: chunks from the L0 records in
+    their line range, files from their chunks plus records without lines, modules,
+    subsystems and the session from their children (stored ones, replaced by any
+    regenerated here). Returns {(level, key): text}; digests left with no sources map
+    to None (to be deleted) and no longer count as their parent's children.
+    """
+    texts = {}
+    for level in reversed(LOD_LEVELS):
+        for key in sorted(affected.get(level, ())):
+            sources = []
+            if level == "chunk":
+                path, first, last = chunk_lines(key)
+                sources = [text for start, end, text in file_records.get(path, [])
+                           if start is not None and start <= last and (end if end is not None else start) >= first]
+            elif level == "file":
+                sources = [text for start, _, text in file_records.get(key, []) if start is None]
+            elif level == "session":
+                sources = list(session_records)
+            children = dict(stored_children.get((level, key), {}))
+            children.update({child: text for child, text in texts.items() if parent_of(*child) == (level, key)})
+            sources += [children[child] for child in sorted(children) if children[child] is not None]
+            if not sources:
+                texts[(level, key)] = None
+                continue
+            body = summarizer.summarize(sources, level, key)
+            label = digest_label(level, key)
+            texts[(level, key)] = f"{label}: {body}" if label else body
+    return texts
+
+def build_scope(cur, scope_id, changes, summarizer, encoder):
+    """
+    Rewrites the digests that `changes` ((path, start_line, end_line) of new L0
+    records) touch, plus their ancestors, in the caller's transaction. Digests whose
+    text comes out unchanged keep their version; digests left without sources are
+    deleted. Returns the number of digests regenerated or deleted.
+    """
+    affected = affected_digests(changes)
+    paths = sorted(affected["file"])
+    file_records = {}
+    if paths:
+        cur.execute(FILE_RECORDS_SQL, (paths, scope_id, L2_MAX_SOURCES))
+        for path, start, end, rtype, payload in cur.fetchall():
+            file_records.setdefault(path, []).append((start, end, snippet_text(rtype, payload)))
+    cur.execute(SESSION_RECORDS_SQL, (scope_id, L2_MAX_SOURCES))
+    session_records = [snippet_text(rtype, payload) for rtype, payload in cur.fetchall()]
+
+    # Unchanged siblings: everything stored under an affected parent
+    parents = [digest_uuid(scope_id, level, key) for level in LOD_LEVELS[:-1] for key in affected[level]]
+    cur.execute("""
+        SELECT lod_level, digest_key, text FROM l2_digests
+        WHERE parent_id = ANY(%s::uuid[]) AND digest_key IS NOT NULL
+    """, (parents,))
+    stored_children = {}
+    for level, key, text in cur.fetchall():
+        stored_children.setdefault(parent_of(level, key), {})[(level, key)] = text
+
+    texts = regenerate(affected, file_records, session_records, stored_children, summarizer)
+    removed = [digest_uuid(scope_id, *node) for node, text in texts.items() if text is None]
+    if removed:
+        cur.execute(DELETE_SQL, (removed,))
+    texts = {node: text for node, text in texts.items() if text is not None}
+    if not texts:
+        return len(removed)
+    # Parents first: parent_id references must exist when a child is written
+    order = sorted(texts, key=lambda node: LOD_LEVELS.index(node[0]))
+    embeddings = encoder.encode_batch([texts[node] for node in order])
+    rows = []
+    for (level, key), embedding in zip(order, embeddings):
+        parent = parent_of(level, key)
+        rows.append((
+            digest_uuid(scope_id, level, key), scope_id, level, key,
+            # A regenerated child always regenerates its parent (it is one of its sources)
+            digest_uuid(scope_id, *parent) if parent else None,
+            texts[(level, key)], vector_literal(embedding),
+        ))
+    execute_values(cur, UPSERT_SQL, rows, template=UPSERT_TEMPLATE)
+    return len(rows) + len(removed)
+
+def build_l2_pyramid(scope_ids=None, max_events=L2_MAX_EVENTS):
+    """
+    Incremental L2 pyramid build: folds the events past each scope's watermark
+    (l2_watermarks) into the digests they affect, one transaction per scope, and
+    advances the watermarks. Work is proportional to the records changed, not to
+    the scope. `scope_ids` limits the run to those scopes. Returns stats.
+    """
+    logger.info("dream cycle started stage=l2")
+    started = time.monotonic()
+    summarizer = get_summarizer()
+    encoder = get_encoder()
+    stats = {"events": 0, "scopes": 0, "digests": 0, "skipped_scopes": 0, "horizon": None, "seconds": 0.0}
+    only = {str(s) for s in scope_ids} if scope_ids else None
+
     try:
-        with conn.cursor() as cur:
-            # 1. Fetch available scope
-            cur.execute("SELECT scope_id FROM scopes WHERE owner_id = 'wxu' LIMIT 1")
-            row = cur.fetchone()
-            if not row:
-                print("No scope found.")
-                return
-            scope_id = row[0]
-            
-            # 2. Check if a session digest for today exists
-            cur.execute("SELECT digest_id FROM l2_digests WHERE scope_id = %s AND lod_level = 'session' LIMIT 1", (scope_id,))
-            if cur.fetchone():
-                print("Session digest already exists for this scope. Skipping manual ingest.")
-                return
-
-            # 3. Create Session Summary (The 'Bird's Eye View')
-            # In a full system, this would be an LLM-synthesized summary of L0 records.
-            summary_text = (
-                "Infrastructure Convergence: Corrected local Redis port conflict with gcs_server "
-                "and integrated vaulted PQC credentials for secure multi-tenant memory retrieval. "
-                "Enforced L0 verifiability with explicit tool and dependency provenance for "
-                "authoritative grounding."
-            )
-            
-            digest_id = l2.create_digest(
-                scope_id=scope_id,
-                text=summary_text,
-                lod_level="session",
-                version=1
-            )
-            
-            if digest_id:
-                print(f"L2 Session Digest Created: {digest_id}")
-            else:
-                print("Failed to create L2 Digest.")
+        with db_connection() as conn, conn.cursor() as cur:
+            # Scopes without a watermark start from the beginning of the log if they have
+            # records, and hold nothing back (None) if they do not
+            cur.execute(WATERMARKS_SQL)
+            watermarks = {s: w for s, w in cur.fetchall() if only is None or s in only}
+            after = min((w for w in watermarks.values() if w is not None), default=0)
+            horizon = settled_horizon(cur, after, max_events)
+            stats["horizon"] = horizon
+            cur.execute(CHANGES_SQL, (after, horizon))
+            changes = {}
+            for scope_id, event_id, path, start_line, end_line in cur.fetchall():
+                if (only is None or scope_id in only) and event_id > (watermarks.get(scope_id) or 0):
+                    changes.setdefault(scope_id, set()).add((path, start_line, end_line))
+                    stats["events"] += 1
+            conn.commit()
+
+            held = set()
+            for scope_id, scope_changes in sorted(changes.items()):
+                try:
+                    cur.execute("SELECT pg_try_advisory_xact_lock(%s, hashtext(%s))", (L2_LOCK_CLASS, scope_id))
+                    if not cur.fetchone()[0]:
+                        # Another builder has the scope; its watermark stays for the next run
+                        conn.rollback()
+                        held.add(scope_id)
+                        stats["skipped_scopes"] += 1
+                        continue
+                    stats["digests"] += build_scope(cur, scope_id, sorted(scope_changes, key=str), summarizer, encoder)
+                    cur.execute(WATERMARK_SQL, (scope_id, horizon))
+                    conn.commit()
+                    stats["scopes"] += 1
+                    bump_generations([scope_id])
+                except Exception as e:
+                    conn.rollback()
+                    held.add(scope_id)
+                    stats["skipped_scopes"] += 1
+                    logger.error("l2 build failed scope=%s error=%s", scope_id, e)
 
+            # Scopes with no events up to the horizon are complete to it as well
+            idle = sorted(scope for scope, mark in watermarks.items() if (mark or 0) < horizon and scope not in held)
+            for scope_id in idle:
+                cur.execute(WATERMARK_SQL, (scope_id, horizon))
+            conn.commit()
     except Exception as e:
-        print(f"L2 Dream Failure: {e}")
-    finally:
-        conn.close()
+        logger.error("dream cycle failed stage=l2 error=%s", e)
+
+    stats["seconds"] = time.monotonic() - started
+    logger.info("dream cycle finished stage=l2 events=%d scopes=%d digests=%d horizon=%s",
+                stats["events"], stats["scopes"], stats["digests"], stats["horizon"])
+    return stats
 
 if __name__ == "__main__":
-    dream_l2_summary()
+    parser = argparse.ArgumentParser(description="Fold new L0 records into the L2 digest pyramid")
+    parser.add_argument("--scope", action="append", help="only these scopes (repeatable)")
+    parser.add_argument("--max-events", type=int, default=L2_MAX_EVENTS, help="events folded in per run")
+    args = parser.parse_args()
+    configure_logging()
+    result = build_l2_pyramid(args.scope, args.max_events)
+    print(f"{result['events']} events -> {result['digests']} digests in {result['scopes']} scopes "
+          f"(horizon {result['horizon']}, {result['seconds']:.2f}s)")
@@ -1,77 +1,187 @@
 import os
 import sys
 import json
+import time
+import logging
+import argparse
 from datetime import datetime
+from multiprocessing import Pool
 
 # Path for secure utility and core logic
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from core.db import get_db_connection
-from core.vector_store import VectorStore, MockEncoder
-
-def consolidate_l3():
-    """Incremental Dream Consolidation: Promotes L0 Events into L3 Vector Snippets."""
-    print("--- DREAM CYCLE: L3 CONSOLIDATION ---")
-    
-    conn = get_db_connection()
+from core.db import db_connection
+from core.vector_store import VectorStore
+from core.encoders import get_encoder
+from core.context_cache import bump_generations
+from core.metrics import DREAM_EVENTS, DREAM_FAILED_EVENTS, DREAM_BATCH_SECONDS, configure_logging
+from core.vector_snapshots import SNAPSHOT_DIR
+
+logger = logging.getLogger(__name__)
+
+# Events claimed (and committed) per transaction
+DREAM_BATCH_SIZE = int(os.environ.get("VAULT_DREAM_BATCH_SIZE", "200"))
+
+# Claims the oldest pending events. SKIP LOCKED lets concurrent workers take disjoint
+# batches instead of queueing on each other's row locks; the locks are held until the
+# batch's snippets and processed_at marks commit together. {scopes} optionally limits
+# the claim to some scopes (benchmarks draining only their scratch scope).
+CLAIM_SQL = """
+    SELECT e.event_id, r.record_id, r.scope_id, r.record_type, r.payload, r.path, r.source, r.scope_type, r.branch
+    FROM event_log e
+    JOIN records_l0 r ON e.record_id = r.record_id
+    WHERE e.processed_at IS NULL{scopes}
+    ORDER BY e.event_id ASC
+    LIMIT %s
+    FOR UPDATE OF e SKIP LOCKED
+"""
+# A poison event (one that cannot be consolidated) is dead-lettered: marked processed
+# with its error, so it leaves the backlog instead of failing the oldest batch forever.
+FAIL_SQL = "UPDATE event_log SET processed_at = now(), error = %s WHERE event_id = %s"
+
+def snippet_text(rtype, payload):
+    """Extracts the L3 text: the directive/resolution for known types, JSON otherwise."""
+    if rtype == 'user_wish':
+        return f"User Wish/Directive: {payload.get('directive', '')}"
+    if rtype == 'command_success':
+        return f"Command Success: {payload.get('resolution', '')} - {payload.get('issue', '')}"
+    return json.dumps(payload)
+
+def consolidate_batch(vs, encoder, batch_size=DREAM_BATCH_SIZE, scope_ids=None):
+    """
+    Claims one batch, writes its snippets and marks its events in a single transaction.
+    If the batch fails, its events are retried one by one and those that still fail are
+    dead-lettered (FAIL_SQL); if every one of them fails the cause is not the events,
+    so the error is raised and the batch stays pending.
+    Returns (events processed, scope ids touched); (0, set()) when nothing is claimable.
+    `scope_ids` restricts the claim to events of those scopes.
+    """
+    with db_connection() as conn, conn.cursor() as cur:
+        if scope_ids:
+            cur.execute(CLAIM_SQL.format(scopes=" AND r.scope_id = ANY(%s::uuid[])"), ([str(s) for s in scope_ids], batch_size))
+        else:
+            cur.execute(CLAIM_SQL.format(scopes=""), (batch_size,))
+        events = cur.fetchall()
+        if not events:
+            conn.rollback()
+            return 0, set()
+
+        # Savepoints keep the claim's row locks while a failed write is undone
+        cur.execute("SAVEPOINT batch")
+        try:
+            _consolidate(vs, encoder, cur, events)
+            done = events
+        except Exception as e:
+            cur.execute("ROLLBACK TO SAVEPOINT batch")
+            logger.warning("dream batch failed, retrying events one by one events=%d error=%s", len(events), e)
+            done, failed = [], []
+            for event in events:
+                cur.execute("SAVEPOINT event")
+                try:
+                    _consolidate(vs, encoder, cur, [event])
+                    done.append(event)
+                except Exception as event_error:
+                    cur.execute("ROLLBACK TO SAVEPOINT event")
+                    failed.append((event, event_error))
+            if not done:
+                raise
+            for (eid, *_), event_error in failed:
+                logger.error("dream event dead-lettered event_id=%s error=%s", eid, event_error)
+                cur.execute(FAIL_SQL, (str(event_error)[:1000], eid))
+            DREAM_FAILED_EVENTS.inc(len(failed))
+        conn.commit()
+        return len(events), {str(sid) for _, _, sid, *_ in done}
+
+def _consolidate(vs, encoder, cur, events):
+    """Writes the snippets of claimed `events` and marks them processed, in `cur`'s transaction."""
+    snippets = []
+    for eid, rid, sid, rtype, payload, path, source, scope_type, branch in events:
+        metadata = {
+            "path": path,
+            "artifact_type": rtype,
+            "source": source,
+            "scope_type": scope_type,
+            "branch": branch,
+            "repo_id": "agent-memory-vault"
+        }
+        snippets.append((eid, rid, sid, snippet_text(rtype, payload), metadata))
+
+    # One batched encode for the whole claim (L3 Semantic Anchors)
+    embeddings = encoder.encode_batch([text for _, _, _, text, _ in snippets])
+    # source_event_id is the watermark in-memory indexes sync from (core.vector_backends)
+    vs.add_snippets(
+        [(rid, sid, text, metadata, emb, eid) for (eid, rid, sid, text, metadata), emb in zip(snippets, embeddings)],
+        cur=cur
+    )
+    cur.execute(
+        "UPDATE event_log SET processed_at = %s WHERE event_id = ANY(%s)",
+        (datetime.now(), [eid for eid, *_ in events])
+    )
+
+def consolidate_l3(batch_size=DREAM_BATCH_SIZE, time_budget=None, scope_ids=None):
+    """
+    Incremental Dream Consolidation: Promotes L0 Events into L3 Vector Snippets.
+    Drains event_log (only the events of `scope_ids`, if given) batch by batch until
+    it is empty or `time_budget` seconds have passed. Safe to run in several
+    processes at once. Returns throughput stats.
+    """
+    logger.info("dream cycle started stage=l3")
+
     vs = VectorStore()
-    encoder = MockEncoder() # Default 1536 dim for pgvector
-    
-    try:
-        with conn.cursor() as cur:
-            # 1. Fetch pending L0 events
-            cur.execute("""
-                SELECT e.event_id, r.record_id, r.scope_id, r.record_type, r.payload, r.path, r.source, r.scope_type, r.branch
-                FROM event_log e
-                JOIN records_l0 r ON e.record_id = r.record_id
-                WHERE e.processed_at IS NULL
-                ORDER BY e.event_id ASC
-                LIMIT 100
-            """)
-            events = cur.fetchall()
-            
-            if not events:
-                print("No pending events for consolidation.")
-                return
-
-            print(f"Found {len(events)} pending events. Dream processing...")
-
-            for eid, rid, sid, rtype, payload, path, source, scope_type, branch in events:
-                # 2. Extract Text Snippet for L3
-                # For code, it's the raw content; for wishes/decisions, it's the JSON summary.
-                snippet_text = ""
-                if rtype == 'user_wish':
-                    snippet_text = f"User Wish/Directive: {payload.get('directive', '')}"
-                elif rtype == 'command_success':
-                    snippet_text = f"Command Success: {payload.get('resolution', '')} - {payload.get('issue', '')}"
-                else:
-                    snippet_text = json.dumps(payload)
-
-                # 3. Generate Embedding (L3 Semantic Anchor)
-                embedding = encoder.encode(snippet_text).tolist()
-
-                # 4. Insert into L3 Index
-                metadata = {
-                    "path": path, 
-                    "artifact_type": rtype, 
-                    "source": source,
-                    "scope_type": scope_type,
-                    "branch": branch,
-                    "repo_id": "agent-memory-vault"
-                }
-                vs.add_snippet(rid, sid, snippet_text, json.dumps(metadata), embedding)
-                
-                # 5. Mark Event as Processed (Atomic promotion)
-                cur.execute("UPDATE event_log SET processed_at = %s WHERE event_id = %s", (datetime.now(), eid))
-            
-            conn.commit()
-            print(f"Successfully dreamt {len(events)} L3 snippets.")
+    encoder = get_encoder() # Default 1536 dim for pgvector
+    started = time.monotonic()
+    stats = {"pid": os.getpid(), "events": 0, "batches": 0, "seconds": 0.0, "events_per_sec": 0.0}
+    touched = set()
 
+    try:
+        while time_budget is None or time.monotonic() - started < time_budget:
+            batch_started = time.monotonic()
+            count, batch_scopes = consolidate_batch(vs, encoder, batch_size, scope_ids)
+            if not count:
+                break
+            DREAM_BATCH_SECONDS.observe(time.monotonic() - batch_started)
+            DREAM_EVENTS.inc(count)
+            stats["events"] += count
+            stats["batches"] += 1
+            touched |= batch_scopes
+            bump_generations(batch_scopes)
     except Exception as e:
-        print(f"Dream Failure: {e}")
-        conn.rollback()
+        logger.error("dream cycle failed stage=l3 error=%s", e)
     finally:
         vs.close()
-        conn.close()
+
+    if SNAPSHOT_DIR and touched:
+        # Lets in-memory vector backends start from a memmap instead of re-reading the scopes
+        from core.vector_backends import update_snapshots
+        try:
+            update_snapshots(touched)
+        except Exception as e:
+            logger.error("vector snapshot update failed scopes=%d error=%s", len(touched), e)
+
+    stats["seconds"] = time.monotonic() - started
+    if stats["seconds"] > 0:
+        stats["events_per_sec"] = stats["events"] / stats["seconds"]
+    logger.info("dream cycle finished stage=l3 events=%d batches=%d events_per_sec=%.0f",
+                stats["events"], stats["batches"], stats["events_per_sec"])
+    return stats
+
+def _worker(args):
+    return consolidate_l3(*args)
+
+def run_workers(workers, batch_size=DREAM_BATCH_SIZE, time_budget=None, scope_ids=None):
+    """Drains the backlog (of `scope_ids`, if given) with `workers` processes; returns each worker's stats."""
+    if workers <= 1:
+        return [consolidate_l3(batch_size, time_budget, scope_ids)]
+    with Pool(workers) as pool:
+        return pool.map(_worker, [(batch_size, time_budget, scope_ids)] * workers)
 
 if __name__ == "__main__":
-    consolidate_l3()
+    parser = argparse.ArgumentParser(description="Promote pending L0 events into L3 snippets")
+    parser.add_argument("--workers", type=int, default=1, help="parallel worker processes")
+    parser.add_argument("--batch-size", type=int, default=DREAM_BATCH_SIZE)
+    parser.add_argument("--time-budget", type=float, default=None, help="stop claiming after this many seconds")
+    args = parser.parse_args()
+    configure_logging()
+    results = run_workers(args.workers, args.batch_size, args.time_budget)
+    for r in results:
+        print(f"worker {r['pid']}: {r['events']} events, {r['batches']} batches, {r['events_per_sec']:.0f} events/sec")
+    print(f"total: {sum(r['events'] for r in results)} events")
@@ -93,19 +93,30 @@ def setup_postgres():
         action VARCHAR(20),
         version BIGINT NOT NULL,
         processed_at TIMESTAMP WITH TIME ZONE,
+        error TEXT,
         created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
     );
+    ALTER TABLE event_log ADD COLUMN IF NOT EXISTS error TEXT;
     
     CREATE TABLE IF NOT EXISTS l2_digests (
         digest_id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
         scope_id UUID REFERENCES scopes(scope_id),
         lod_level VARCHAR(20),
+        digest_key TEXT,
         parent_id UUID REFERENCES l2_digests(digest_id),
         text TEXT NOT NULL,
         embedding VECTOR(1536),
         version BIGINT NOT NULL,
         updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
     );
+    ALTER TABLE l2_digests ADD COLUMN IF NOT EXISTS digest_key TEXT;
+    
+    -- Last event folded into each scope's L2 pyramid (scripts/dream_l2.py)
+    CREATE TABLE IF NOT EXISTS l2_watermarks (
+        scope_id UUID PRIMARY KEY REFERENCES scopes(scope_id),
+        event_id BIGINT NOT NULL DEFAULT 0,
+        updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+    );
     
     CREATE TABLE IF NOT EXISTS l3_snippets (
         snippet_id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
@@ -114,13 +125,41 @@ def setup_postgres():
         text TEXT NOT NULL,
         metadata JSONB,
         embedding VECTOR(1536),
+        source_event_id BIGINT,
+        text_tsv TSVECTOR GENERATED ALWAYS AS (to_tsvector('english', text)) STORED,
         updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
     );
+    ALTER TABLE l3_snippets ADD COLUMN IF NOT EXISTS source_event_id BIGINT;
+    ALTER TABLE l3_snippets ADD COLUMN IF NOT EXISTS text_tsv TSVECTOR GENERATED ALWAYS AS (to_tsvector('english', text)) STORED;
     
     CREATE INDEX IF NOT EXISTS idx_records_scope_path ON records_l0(scope_id, path);
     CREATE INDEX IF NOT EXISTS idx_records_scope_type ON records_l0(scope_type);
     CREATE INDEX IF NOT EXISTS idx_records_source ON records_l0(source);
     CREATE INDEX IF NOT EXISTS idx_l2_scope_lod ON l2_digests(scope_id, lod_level);
+    CREATE INDEX IF NOT EXISTS idx_l2_parent ON l2_digests(parent_id);
+    -- Incremental L2 builds: digests addressed by (level, key), live records by supersedes
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_l2_digest_key ON l2_digests(scope_id, lod_level, digest_key);
+    CREATE INDEX IF NOT EXISTS idx_records_supersedes ON records_l0(supersedes) WHERE supersedes IS NOT NULL;
+    
+    -- Dream backlog: the partial index only holds unprocessed events, so claiming the
+    -- oldest pending batch stays cheap however long event_log grows.
+    CREATE INDEX IF NOT EXISTS idx_event_log_pending ON event_log(event_id) WHERE processed_at IS NULL;
+    CREATE INDEX IF NOT EXISTS idx_event_log_record ON event_log(record_id);
+    CREATE INDEX IF NOT EXISTS idx_event_log_processed_at ON event_log(processed_at) WHERE processed_at IS NOT NULL;
+    -- Dead-lettered events (scripts/dream_l3.py): processed, with the error that stopped them
+    CREATE INDEX IF NOT EXISTS idx_event_log_failed ON event_log(event_id) WHERE error IS NOT NULL;
+    -- In-memory vector backends catch up on a scope from its last consolidated event
+    CREATE INDEX IF NOT EXISTS idx_l3_snippets_scope_event ON l3_snippets(scope_id, source_event_id);
+    -- Lexical side of hybrid L3 search (core.vector_store.HYBRID_L3_SQL)
+    CREATE INDEX IF NOT EXISTS idx_l3_snippets_text_tsv ON l3_snippets USING gin (text_tsv);
+    -- Metadata filters on L3 search (core.vector_store.L3Filter): containment on
+    -- artifact_type/branch/source, prefix match on path
+    CREATE INDEX IF NOT EXISTS idx_l3_snippets_metadata ON l3_snippets USING gin (metadata jsonb_path_ops);
+    CREATE INDEX IF NOT EXISTS idx_l3_snippets_scope_path ON l3_snippets (scope_id, (metadata->>'path') text_pattern_ops);
+    
+    -- ANN indexes (HNSW, cosine). Rebuild/retune on live data with scripts/build_vector_indexes.py.
+    CREATE INDEX IF NOT EXISTS idx_l3_snippets_embedding_hnsw ON l3_snippets USING hnsw (embedding vector_cosine_ops) WITH (m = 16, ef_construction = 64);
+    CREATE INDEX IF NOT EXISTS idx_l2_digests_embedding_hnsw ON l2_digests USING hnsw (embedding vector_cosine_ops) WITH (m = 16, ef_construction = 64);
     """
     
     ret, out, err = run_sudo_command(["psql", "-d", db_name, "-c", schema_sql], sudo_pass, user="postgres")
@@ -0,0 +1,40 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from core.db import get_db_connection
+
+# Same definitions as init_db.py; built CONCURRENTLY so ingest keeps writing.
+EVENT_LOG_INDEXES = [
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_event_log_pending ON event_log(event_id) WHERE processed_at IS NULL",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_event_log_record ON event_log(record_id)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_event_log_processed_at ON event_log(processed_at) WHERE processed_at IS NOT NULL",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_event_log_failed ON event_log(event_id) WHERE error IS NOT NULL",
+]
+
+def migrate():
+    conn = get_db_connection()
+    conn.autocommit = True  # CREATE INDEX CONCURRENTLY cannot run in a transaction
+    try:
+        with conn.cursor() as cur:
+            # Dead-letter column; nullable without a default, so a catalog-only change
+            cur.execute("ALTER TABLE event_log ADD COLUMN IF NOT EXISTS error TEXT")
+            print("event_log.error: ok")
+            for sql in EVENT_LOG_INDEXES:
+                name = sql.split("IF NOT EXISTS ")[1].split()[0]
+                # An interrupted concurrent build leaves an invalid index that IF NOT EXISTS would keep
+                cur.execute("""
+                    SELECT 1 FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid
+                    WHERE c.relname = %s AND NOT i.indisvalid
+                """, (name,))
+                if cur.fetchone():
+                    cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+                cur.execute(sql)
+                print(f"{name}: ok")
+            cur.execute("ANALYZE event_log")
+    finally:
+        conn.close()
+    print("MIGRATION_SUCCESS")
+
+if __name__ == "__main__":
+    migrate()
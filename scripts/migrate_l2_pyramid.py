@@ -0,0 +1,48 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from core.db import get_db_connection
+
+# Same definitions as init_db.py. The incremental L2 builder (scripts/dream_l2.py)
+# addresses digests by (level, key) and keeps a per-scope event watermark.
+SCHEMA = [
+    "ALTER TABLE l2_digests ADD COLUMN IF NOT EXISTS digest_key TEXT",
+    """
+    CREATE TABLE IF NOT EXISTS l2_watermarks (
+        scope_id UUID PRIMARY KEY REFERENCES scopes(scope_id),
+        event_id BIGINT NOT NULL DEFAULT 0,
+        updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+]
+# Built CONCURRENTLY so ingest and the dream cycle keep writing
+INDEXES = {
+    "idx_l2_digest_key": "UNIQUE INDEX CONCURRENTLY IF NOT EXISTS idx_l2_digest_key ON l2_digests(scope_id, lod_level, digest_key)",
+    "idx_records_supersedes": "INDEX CONCURRENTLY IF NOT EXISTS idx_records_supersedes ON records_l0(supersedes) WHERE supersedes IS NOT NULL",
+}
+
+def migrate():
+    conn = get_db_connection()
+    conn.autocommit = True  # CREATE INDEX CONCURRENTLY cannot run in a transaction
+    try:
+        with conn.cursor() as cur:
+            for statement in SCHEMA:
+                cur.execute(statement)
+            print("l2 schema: ok")
+            for name, definition in INDEXES.items():
+                # An interrupted concurrent build leaves an invalid index that IF NOT EXISTS would keep
+                cur.execute("""
+                    SELECT 1 FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid
+                    WHERE c.relname = %s AND NOT i.indisvalid
+                """, (name,))
+                if cur.fetchone():
+                    cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+                cur.execute(f"CREATE {definition}")
+                print(f"{name}: ok")
+    finally:
+        conn.close()
+    print("MIGRATION_SUCCESS")
+
+if __name__ == "__main__":
+    migrate()
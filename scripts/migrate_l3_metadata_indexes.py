@@ -0,0 +1,35 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from core.db import get_db_connection
+
+# Same definitions as init_db.py, built CONCURRENTLY so consolidation keeps writing.
+# They serve L3Filter: jsonb containment (artifact_type/branch/source) and path prefixes.
+INDEXES = {
+    "idx_l3_snippets_metadata": "ON l3_snippets USING gin (metadata jsonb_path_ops)",
+    "idx_l3_snippets_scope_path": "ON l3_snippets (scope_id, (metadata->>'path') text_pattern_ops)",
+}
+
+def migrate():
+    conn = get_db_connection()
+    conn.autocommit = True  # CREATE INDEX CONCURRENTLY cannot run in a transaction
+    try:
+        with conn.cursor() as cur:
+            for name, definition in INDEXES.items():
+                # An interrupted concurrent build leaves an invalid index that IF NOT EXISTS would keep
+                cur.execute("""
+                    SELECT 1 FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid
+                    WHERE c.relname = %s AND NOT i.indisvalid
+                """, (name,))
+                if cur.fetchone():
+                    cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+                cur.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} {definition}")
+                print(f"{name}: ok")
+            cur.execute("ANALYZE l3_snippets")
+    finally:
+        conn.close()
+    print("MIGRATION_SUCCESS")
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,35 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from core.db import get_db_connection
+
+# Same definitions as init_db.py. Adding a nullable column without a default is a
+# catalog-only change; the index is built CONCURRENTLY so consolidation keeps writing.
+# Existing snippets keep a NULL source_event_id: in-memory backends load them with
+# the rest of the scope and only sync on later events.
+INDEX_NAME = "idx_l3_snippets_scope_event"
+INDEX_SQL = f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {INDEX_NAME} ON l3_snippets(scope_id, source_event_id)"
+
+def migrate():
+    conn = get_db_connection()
+    conn.autocommit = True  # CREATE INDEX CONCURRENTLY cannot run in a transaction
+    try:
+        with conn.cursor() as cur:
+            cur.execute("ALTER TABLE l3_snippets ADD COLUMN IF NOT EXISTS source_event_id BIGINT")
+            print("l3_snippets.source_event_id: ok")
+            # An interrupted concurrent build leaves an invalid index that IF NOT EXISTS would keep
+            cur.execute("""
+                SELECT 1 FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid
+                WHERE c.relname = %s AND NOT i.indisvalid
+            """, (INDEX_NAME,))
+            if cur.fetchone():
+                cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {INDEX_NAME}")
+            cur.execute(INDEX_SQL)
+            print(f"{INDEX_NAME}: ok")
+    finally:
+        conn.close()
+    print("MIGRATION_SUCCESS")
+
+if __name__ == "__main__":
+    migrate()
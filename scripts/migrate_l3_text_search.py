@@ -0,0 +1,40 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from core.db import get_db_connection
+
+# Same definitions as init_db.py. A STORED generated column is computed for every
+# existing row, so the ALTER rewrites l3_snippets under an exclusive lock: run it in
+# a quiet window on large tables. The GIN index is then built CONCURRENTLY.
+# The expression's text search config must stay in step with HYBRID_L3_SQL.
+COLUMN_SQL = """
+    ALTER TABLE l3_snippets ADD COLUMN IF NOT EXISTS
+    text_tsv TSVECTOR GENERATED ALWAYS AS (to_tsvector('english', text)) STORED
+"""
+INDEX_NAME = "idx_l3_snippets_text_tsv"
+INDEX_SQL = f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {INDEX_NAME} ON l3_snippets USING gin (text_tsv)"
+
+def migrate():
+    conn = get_db_connection()
+    conn.autocommit = True  # CREATE INDEX CONCURRENTLY cannot run in a transaction
+    try:
+        with conn.cursor() as cur:
+            cur.execute(COLUMN_SQL)
+            print("l3_snippets.text_tsv: ok")
+            # An interrupted concurrent build leaves an invalid index that IF NOT EXISTS would keep
+            cur.execute("""
+                SELECT 1 FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid
+                WHERE c.relname = %s AND NOT i.indisvalid
+            """, (INDEX_NAME,))
+            if cur.fetchone():
+                cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {INDEX_NAME}")
+            cur.execute(INDEX_SQL)
+            print(f"{INDEX_NAME}: ok")
+            cur.execute("ANALYZE l3_snippets")
+    finally:
+        conn.close()
+    print("MIGRATION_SUCCESS")
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,39 @@
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from core.db import db_connection, close_pool
+from core.vector_backends import update_snapshots
+from core.vector_snapshots import SNAPSHOT_DIR, read_meta
+
+def main():
+    parser = argparse.ArgumentParser(description="Write or refresh per-scope embedding snapshots")
+    parser.add_argument("--scope", action="append", help="snapshot this scope (repeatable); default: every scope with snippets")
+    parser.add_argument("--dir", default=SNAPSHOT_DIR, help="snapshot directory (default: VAULT_SNAPSHOT_DIR)")
+    parser.add_argument("--status", action="store_true", help="print snapshot metadata and exit")
+    args = parser.parse_args()
+    if not args.dir:
+        parser.error("set VAULT_SNAPSHOT_DIR or pass --dir")
+
+    scope_ids = args.scope
+    if not scope_ids:
+        with db_connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT DISTINCT scope_id::text FROM l3_snippets")
+            scope_ids = [row[0] for row in cur.fetchall()]
+    try:
+        if args.status:
+            for scope_id in scope_ids:
+                print(json.dumps(read_meta(scope_id, args.dir) or {"scope_id": scope_id, "snapshot": None}))
+            return
+        for scope_id in scope_ids:
+            started = time.monotonic()
+            count = update_snapshots([scope_id], root=args.dir)[scope_id]
+            print(f"{scope_id}: {count} rows ({time.monotonic() - started:.2f}s)")
+    finally:
+        close_pool()
+
+if __name__ == "__main__":
+    main()
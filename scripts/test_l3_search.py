@@ -4,6 +4,7 @@ import json
 
 # Path for secure utility and vstore
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from core.db import db_connection
 from core.vector_store import VectorStore, MockEncoder
 
 def test_l3_search(query: str):
@@ -12,8 +13,9 @@ def test_l3_search(query: str):
     encoder = MockEncoder()
     
     # 1. Get scope IDs from database (active scopes)
-    vs.cur.execute("SELECT scope_id FROM scopes WHERE owner_id = 'wxu';")
-    scope_ids = [row[0] for row in vs.cur.fetchall()]
+    with db_connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT scope_id FROM scopes WHERE owner_id = 'wxu';")
+        scope_ids = [row[0] for row in cur.fetchall()]
     
     if not scope_ids:
         print("No active scopes found for search.")
@@ -23,16 +25,17 @@ def test_l3_search(query: str):
     # 2. Encode search query
     query_vec = encoder.encode(query).tolist()
     
-    # 3. Perform semantic L3 lookup
-    results = vs.search_l3(scope_ids, query_vec, limit=5)
+    # 3. Perform hybrid (semantic + lexical) L3 lookup
+    results = vs.search_l3(scope_ids, query_vec, limit=5, query_text=query)
     
     if not results:
         print("No matches found in L3.")
     else:
-        for sid, rid, text, metadata, sim in results:
-            print(f"[Match - {sim:.4f}] {text}")
-            print(f"  Record ID: {rid}")
-            print(f"  Metadta: {metadata}")
+        for match in results:
+            print(f"[Match - {match.similarity:.4f}] {match.text}")
+            print(f"  Record ID: {match.record_id}")
+            print(f"  Metadta: {match.metadata}")
+            print(f"  Provenance: {match.provenance}")
             print("---")
 
     print("--- L3 SEARCH COMPLETE ---")
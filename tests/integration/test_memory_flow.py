@@ -1,6 +1,6 @@
 import pytest
 import uuid
-from core.db import get_db_connection, insert_l0_record
+from core.db import get_db_connection, insert_l0_record, insert_l0_records, event_log_status
 from core.models import MemoryRecord, Provenance
 from core.vector_store import VectorStore, MockEncoder
 
@@ -53,7 +53,113 @@ def test_l0_to_l3_ingest_flow(test_scope):
     
     assert len(results) > 0
     match = results[0]
-    # match is (snippet_id, record_id, text, metadata, sim)
+    # match is an L3Match (snippet_id, record_id, text, metadata, similarity, provenance, ...)
     assert match[1] == record.record_id
     assert "Full Flow Test <NULL_BYTE>" in match[2]
+    # L0 fields arrive with the match instead of a follow-up lookup
+    assert match.provenance["tool"] == "pytest"
+    assert match.record_type == "integration_test"
     vs.close()
+
+def test_hybrid_l3_search_runs(test_scope):
+    from scripts.dream_l3 import consolidate_l3
+    prov = Provenance(tool="pytest", version="1.0.0", source="integration")
+    records = [
+        MemoryRecord(scope_id=test_scope, record_type="integration_test", payload={"msg": msg}, provenance=prov)
+        for msg in ("ECONNRESET from pg_bouncer_reconnect in the pool", "Unrelated note about the weather")
+    ]
+    assert insert_l0_records(records) == 2
+    consolidate_l3()
+
+    vs = VectorStore()
+    query = "why does pg_bouncer_reconnect fail"
+    query_vec = MockEncoder().encode(query).tolist()
+    # Both the plain and the filtered statement must run (and the lexical side must match)
+    results = vs.search_l3([test_scope], query_vec, limit=2, query_text=query)
+    assert results and results[0].score is not None
+    assert "pg_bouncer_reconnect" in results[0].text
+    filtered = vs.search_l3([test_scope], query_vec, limit=2, query_text=query, l3_filter={"path": "no/such/"})
+    assert filtered == []
+
+    import asyncio
+    from core.async_db import close_async_pool
+
+    async def run():
+        try:
+            return await vs.search_l3_async([test_scope], query_vec, limit=2, query_text=query)
+        finally:
+            await close_async_pool()
+    assert [m.snippet_id for m in asyncio.run(run())] == [m.snippet_id for m in results]
+    vs.close()
+
+def test_l0_batch_ingest(test_scope):
+    scope_id = test_scope
+    prov = Provenance(tool="pytest", version="1.0.0", source="integration")
+    records = [
+        MemoryRecord(
+            scope_id=scope_id,
+            record_type="integration_test",
+            payload={"msg": f"Batch record {i} \x00"},
+            provenance=prov
+        )
+        for i in range(25)
+    ]
+
+    assert insert_l0_records(records) == 25
+
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT r.scope_type, r.payload->>'msg', count(e.event_id)
+                FROM records_l0 r JOIN event_log e ON e.record_id = r.record_id
+                WHERE r.scope_id = %s
+                GROUP BY r.scope_type, r.payload->>'msg'
+            """, (scope_id,))
+            rows = cur.fetchall()
+    finally:
+        conn.close()
+
+    assert len(rows) == 25
+    assert all(scope_type == "workspace" and events == 1 for scope_type, _, events in rows)
+    assert all("<NULL_BYTE>" in msg for _, msg, _ in rows)
+
+def test_concurrent_dream_workers_claim_disjoint_batches(test_scope):
+    from concurrent.futures import ThreadPoolExecutor
+    from scripts.dream_l3 import consolidate_l3
+    prov = Provenance(tool="pytest", version="1.0.0", source="integration")
+    records = [
+        MemoryRecord(scope_id=test_scope, record_type="integration_test", payload={"msg": f"Dream {i}"}, provenance=prov)
+        for i in range(60)
+    ]
+    assert insert_l0_records(records) == 60
+
+    with ThreadPoolExecutor(3) as pool:
+        stats = list(pool.map(lambda _: consolidate_l3(batch_size=10), range(3)))
+    assert sum(s["events"] for s in stats) >= 60
+
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT r.record_id, count(s.snippet_id), bool_and(e.processed_at IS NOT NULL)
+                FROM records_l0 r
+                JOIN event_log e ON e.record_id = r.record_id
+                LEFT JOIN l3_snippets s ON s.record_id = r.record_id
+                WHERE r.scope_id = %s
+                GROUP BY r.record_id
+            """, (test_scope,))
+            rows = cur.fetchall()
+    finally:
+        conn.close()
+    assert len(rows) == 60
+    assert all(snippets == 1 and processed for _, snippets, processed in rows)
+
+def test_event_log_status_reports_backlog(test_scope):
+    prov = Provenance(tool="pytest", version="1.0.0", source="integration")
+    record = MemoryRecord(scope_id=test_scope, record_type="integration_test", payload={"msg": "lag"}, provenance=prov)
+    assert insert_l0_record(record) is True
+    status = event_log_status(window_seconds=60)
+    assert status["backlog"] >= 1
+    assert status["oldest_pending_event_id"] is not None
+    assert status["oldest_pending_age_seconds"] >= 0
@@ -0,0 +1,20 @@
+from benchmarks.suite import check
+
+def results(p95, ingest):
+    return {"sizes": {"10k": {"context": {"p50_ms": 20.0, "p95_ms": p95, "p99_ms": p95 * 1.5},
+                              "ingest": {"records_per_sec": ingest}}}}
+
+def test_p95_target_and_baseline_regressions():
+    baseline = results(100.0, 5000.0)
+    assert check(results(110.0, 4500.0), baseline) == []  # within 20%
+    failures = check(results(250.0, 3000.0), baseline)
+    assert any("exceeds the 200ms target" in f for f in failures)
+    assert any("context.p95_ms" in f for f in failures)
+    assert any("ingest.records_per_sec" in f for f in failures)  # lower throughput is worse
+    assert check(results(150.0, 9000.0), None) == []  # no baseline: only the target applies
+
+def test_git_revision_is_the_repos_from_any_cwd(tmp_path, monkeypatch):
+    from benchmarks.suite import git_revision
+    monkeypatch.chdir(tmp_path)
+    revision = git_revision()
+    assert revision["commit"] is None or len(revision["commit"]) == 40
@@ -0,0 +1,41 @@
+import time
+from core.budget import ContextBlock, EstimateTokenizer, get_tokenizer, pack_blocks, TIER_HEADERS
+
+tok = EstimateTokenizer()
+
+def blocks(tier, n, words=20, top=1.0):
+    return [ContextBlock(tier, f"{tier} block {i} " + "word " * words, score=top - i / 100) for i in range(n)]
+
+def test_estimator_is_conservative_and_cheap():
+    assert tok.count("") == 0
+    assert tok.count("one two three four") >= 4
+    assert tok.count("x" * 400) == 100
+    text = "### RECORD: abc\nEvidence: fixed redis port {\"tool\": \"x\"}\n" * 300
+    start = time.perf_counter()
+    for _ in range(100):
+        tok.count(text)
+    assert (time.perf_counter() - start) / 100 < 0.001
+    assert isinstance(get_tokenizer("estimate"), EstimateTokenizer)
+
+def test_reserved_blocks_survive_a_tiny_budget():
+    result = pack_blocks(blocks("L3", 5), 10, tok, reserved_tail=["## GUARDRAILS " + "rule " * 30])
+    assert result.text.startswith("## GUARDRAILS")
+    assert result.dropped_blocks == {"L3": 5}
+    assert TIER_HEADERS["L3"] not in result.text
+
+def test_quotas_then_leftover_by_score():
+    l1, l3 = blocks("L1", 10), blocks("L3", 10, top=0.5)
+    result = pack_blocks(l1 + l3, 500, tok, quotas={"L1": 0.2, "L3": 0.8})
+    assert result.tokens_used <= 500
+    # L1 is held to its quota in the first pass even though it outscores L3...
+    assert result.tier_tokens["L3"] > result.tier_tokens["L1"]
+    # ...and within a tier the best blocks win, emitted in their original order
+    kept = [b for b in l3 if b.text in result.text]
+    assert kept == l3[:len(kept)]
+    assert result.text.index(TIER_HEADERS["L1"]) < result.text.index(TIER_HEADERS["L3"])
+
+def test_unused_quota_flows_to_other_tiers():
+    l3 = blocks("L3", 30)
+    result = pack_blocks(l3, 1000, tok, quotas={"L1": 0.5, "L3": 0.5})
+    assert result.tier_tokens["L3"] > 500
+    assert result.tokens_used <= 1000
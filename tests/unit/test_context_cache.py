@@ -0,0 +1,113 @@
+import time
+import pytest
+from core.context_cache import ContextCache, bump_generations
+
+fakeredis = pytest.importorskip("fakeredis")
+
+@pytest.fixture
+def client():
+    return fakeredis.FakeRedis(decode_responses=True)
+
+def test_hit_until_scope_generation_bumps(client):
+    cache = ContextCache(client)
+    key = cache.key("q", ["a", "b"], 6000)
+    assert cache.get(key) is None
+    cache.put(key, "block")
+    assert cache.get(cache.key("q", ["a", "b"], 6000)) == "block"
+    # Different budget or scope order is a different block
+    assert cache.key("q", ["a", "b"], 4000) != key
+    assert cache.key("q", ["b", "a"], 6000) != key
+
+    bump_generations(["b"], client=client)
+    assert cache.get(cache.key("q", ["a", "b"], 6000)) is None
+    stats = cache.snapshot()
+    assert (stats["hits"], stats["misses"]) == (1, 2)
+
+def test_lru_eviction_and_ttl(client):
+    cache = ContextCache(client, max_entries=2)
+    for q in ("q1", "q2"):
+        cache.put(cache.key(q, ["a"], 100), q)
+    cache.get(cache.key("q1", ["a"], 100))  # q1 becomes most recent
+    cache.put(cache.key("q3", ["a"], 100), "q3")
+    assert cache.get(cache.key("q2", ["a"], 100)) is None
+    assert cache.get(cache.key("q1", ["a"], 100)) == "q1"
+    assert cache.snapshot()["evictions"] == 1
+
+    expiring = ContextCache(client, ttl=0.01)
+    key = expiring.key("q", ["a"], 100)
+    expiring.put(key, "block")
+    time.sleep(0.02)
+    assert expiring.get(key) is None
+
+def test_redis_tier_shared_between_processes(client):
+    key = ContextCache(client, redis_tier=True).key("q", ["a"], 100)
+    ContextCache(client, redis_tier=True).put(key, "block")
+    other = ContextCache(client, redis_tier=True)
+    assert other.get(key) == "block"
+    assert other.snapshot()["redis_hits"] == 1
+
+def test_compiler_serves_repeat_requests_from_cache(client, monkeypatch):
+    from core.context_compiler import ContextCompiler
+    from core.budget import ContextBlock
+    c = ContextCompiler(cache=ContextCache(client))
+    calls = []
+    monkeypatch.setattr(c, "_fetch_l1_blocks", lambda scope_ids: calls.append("L1") or [ContextBlock("L1", "- focus: x")])
+    monkeypatch.setattr(c, "_fetch_l2_blocks", lambda query, scope_ids, opts: [])
+    monkeypatch.setattr(c, "_fetch_l3_blocks", lambda query, scope_ids, opts: [])
+    first = c.compile_multiscale_context("q", ["s"])
+    assert c.compile_multiscale_context("q", ["s"]) == first
+    assert calls == ["L1"]
+    c.compile_multiscale_context("q", ["s"], token_budget=500)  # other options, other entry
+    assert calls == ["L1", "L1"]
+    assert c.compile("q", ["s"]).tokens_used == c.compile("q", ["s"]).tokens_used > 0
+    bump_generations(["s"], client=client)
+    c.compile_multiscale_context("q", ["s"])
+    assert calls == ["L1", "L1", "L1"]
+
+def test_redis_outage_bypasses_cache(client, monkeypatch):
+    import redis
+    cache = ContextCache(client)
+    def down(keys):
+        raise redis.exceptions.ConnectionError("down")
+    monkeypatch.setattr(client, "mget", down)
+    assert cache.key("q", ["a"], 100) is None
+    monkeypatch.undo()
+    # Still inside the back-off window: no Redis call, no caching
+    assert cache.key("q", ["a"], 100) is None
+    assert cache.snapshot()["bypassed"] == 2
+
+def test_default_async_client_is_per_loop_and_closed_on_loop_change(monkeypatch):
+    import asyncio
+    import redis.asyncio
+    from core import context_cache
+
+    class FakeAsyncRedis:
+        def __init__(self, **kwargs):
+            self.closed_on = None
+        async def aclose(self):
+            self.closed_on = asyncio.get_running_loop()
+
+    monkeypatch.setattr(redis.asyncio, "Redis", FakeAsyncRedis)
+    monkeypatch.setattr(context_cache, "_default_async_clients", {})
+
+    async def current():
+        return context_cache._get_default_async_client()
+
+    first_loop = asyncio.new_event_loop()
+    try:
+        first = first_loop.run_until_complete(current())
+        assert first_loop.run_until_complete(current()) is first
+
+        async def switch_and_close():
+            second = context_cache._get_default_async_client()
+            await context_cache.close_async_clients()
+            return second
+
+        second = asyncio.run(switch_and_close())
+        # The stale client was closed on the loop it belongs to, the new one by close_async_clients
+        assert second is not first
+        assert first.closed_on is first_loop
+        assert second.closed_on is not None
+        assert context_cache._default_async_clients == {}
+    finally:
+        first_loop.close()
@@ -0,0 +1,172 @@
+import time
+import pytest
+from core.context_compiler import ContextCompiler
+from core.budget import ContextBlock
+
+@pytest.fixture
+def compiler(monkeypatch):
+    c = ContextCompiler(tier_deadlines_ms={"L1": 200, "L2": 200, "L3": 200})
+    monkeypatch.setattr(c.cache, "key", lambda *args: None)  # no Redis here; always compile
+    monkeypatch.setattr(c, "_fetch_l1_blocks", lambda scope_ids: [ContextBlock("L1", "- focus: x", 1.0)])
+    monkeypatch.setattr(c, "_fetch_l2_blocks", lambda query, scope_ids, opts: [ContextBlock("L2", "### DIGEST (v1): d", 0.9)])
+    monkeypatch.setattr(c, "_fetch_l3_blocks", lambda query, scope_ids, opts: [ContextBlock("L3", "### RECORD: r", 0.8)])
+    return c
+
+def test_tiers_render_in_order(compiler):
+    context = compiler.compile_multiscale_context("q", ["s"])
+    assert "[CONTEXT STATUS]" not in context
+    assert context.index("[L1]") < context.index("[L2]") < context.index("[L3]") < context.index("GUARDRAILS")
+
+def test_tiers_run_concurrently(compiler, monkeypatch):
+    def slow(blocks):
+        def fetch(*args):
+            time.sleep(0.1)
+            return blocks
+        return fetch
+    monkeypatch.setattr(compiler, "_fetch_l1_blocks", slow([ContextBlock("L1", "L1")]))
+    monkeypatch.setattr(compiler, "_fetch_l2_blocks", slow([ContextBlock("L2", "L2")]))
+    monkeypatch.setattr(compiler, "_fetch_l3_blocks", slow([ContextBlock("L3", "L3")]))
+    start = time.monotonic()
+    context = compiler.compile_multiscale_context("q", ["s"])
+    assert time.monotonic() - start < 0.19
+    assert "L1" in context and "L2" in context and "L3" in context
+
+def test_late_tier_is_omitted_and_flagged(compiler, monkeypatch):
+    def stuck(query, scope_ids, opts):
+        time.sleep(0.3)
+        return [ContextBlock("L3", "### RECORD: r")]
+    monkeypatch.setattr(compiler, "_fetch_l3_blocks", stuck)
+    start = time.monotonic()
+    context = compiler.compile_multiscale_context("q", ["s"], tier_deadlines_ms={"L3": 30})
+    assert time.monotonic() - start < 0.2
+    assert context.startswith("## [CONTEXT STATUS] PARTIAL")
+    assert "L3 (deadline 30ms exceeded)" in context
+    assert "### RECORD" not in context
+    assert "[L1]" in context and "GUARDRAILS" in context
+
+def test_failed_tier_is_flagged(compiler, monkeypatch):
+    def boom(scope_ids):
+        raise ConnectionError("redis down")
+    monkeypatch.setattr(compiler, "_fetch_l1_blocks", boom)
+    context = compiler.compile_multiscale_context("q", ["s"])
+    assert "L1 (unavailable)" in context
+    assert "[L2]" in context
+
+def test_l3_blocks_render_joined_provenance(monkeypatch):
+    from core.vector_store import L3Match
+    c = ContextCompiler()
+    matches = [
+        L3Match("s1", "r1", "Redis Protocol Error fix", {}, 0.91, {"tool": "FullCleanup"}, 0.9, "command_success", None, None),
+        L3Match("s2", "r2", "orphan snippet", {}, 0.5, None, None, None, None, None),
+    ]
+    calls = []
+    monkeypatch.setattr(c.vs, "search_l3", lambda scope_ids, vec, limit, recall, query_text, l3_filter: calls.append(query_text) or matches)
+    blocks = c._fetch_l3_blocks("redis", ["s"], c.defaults)
+    assert calls == ["redis"]
+    assert [b.score for b in blocks] == [0.91, 0.5]
+    assert "### RECORD: r1" in blocks[0].text
+    assert 'L0 Provenance: {"tool": "FullCleanup"}' in blocks[0].text
+    assert "Confidence: 0.90" in blocks[0].text
+    assert "Provenance missing" in blocks[1].text
+
+def test_l3_blocks_keep_fused_order():
+    from core.context_compiler import _l3_blocks
+    from core.vector_store import L3Match
+    # A lexical hit ranked first by fusion despite a lower cosine similarity
+    matches = [
+        L3Match("s1", "r1", "Redis Protocol Error", {}, 0.42, None, None, None, None, None, 0.032),
+        L3Match("s2", "r2", "close paraphrase", {}, 0.88, None, None, None, None, None, 0.016),
+    ]
+    blocks = _l3_blocks(matches)
+    assert "r1" in blocks[0].text and "score: 0.4200" in blocks[0].text
+    # the packing score follows the fused score, on the similarity scale
+    assert [b.score for b in blocks] == [pytest.approx(0.88), pytest.approx(0.44)]
+
+def test_budget_keeps_guardrails_and_whole_blocks(compiler, monkeypatch):
+    records = [ContextBlock("L3", f"### RECORD: r{i}\n" + "evidence " * 60, score=1 - i / 10) for i in range(8)]
+    monkeypatch.setattr(compiler, "_fetch_l3_blocks", lambda query, scope_ids, opts: records)
+    result = compiler.compile("q", ["s"], token_budget=400)
+    assert result.tokens_used <= 400
+    assert "EVIDENCE_REQUIREMENT" in result.text and "TRUNCATED" not in result.text
+    kept = [r for r in records if r.text in result.text]
+    assert kept and kept == records[:len(kept)]  # best scores first, never a partial record
+    assert result.dropped_blocks["L3"] == len(records) - len(kept)
+
+def test_async_compile_cancels_late_tier(compiler, monkeypatch):
+    import asyncio
+    cancelled = []
+    async def l1(scope_ids):
+        await asyncio.sleep(0.05)
+        return [ContextBlock("L1", "- focus: x", 1.0)]
+    async def l2(query, scope_ids, opts):
+        await asyncio.sleep(0.05)
+        return []
+    async def l3(query, scope_ids, opts):
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+    monkeypatch.setattr(compiler, "_fetch_l1_blocks_async", l1)
+    monkeypatch.setattr(compiler, "_fetch_l2_blocks_async", l2)
+    monkeypatch.setattr(compiler, "_fetch_l3_blocks_async", l3)
+    monkeypatch.setattr(compiler.cache, "key_async", lambda *args: asyncio.sleep(0))
+    opts = compiler.options(tier_deadlines_ms={"L3": 100})
+
+    async def run():
+        start = time.monotonic()
+        # Many concurrent requests on one thread: latency stays at the slowest tier
+        results = await asyncio.gather(*(compiler.compile_async("q", ["s"], opts) for _ in range(50)))
+        return time.monotonic() - start, results
+    elapsed, results = asyncio.run(run())
+    assert elapsed < 0.5
+    assert len(cancelled) == 50
+    assert all(r.omitted_tiers == ["L3 (deadline 100ms exceeded)"] and "- focus: x" in r.text for r in results)
+
+def test_per_request_options_do_not_leak_across_threads(compiler, monkeypatch):
+    from concurrent.futures import ThreadPoolExecutor
+    def l3(query, scope_ids, opts):
+        time.sleep(0.01)  # hold the request open so others interleave
+        return [ContextBlock("L3", f"### RECORD: {query}\n" + "evidence " * 40, score=1 - i / 100) for i in range(20)]
+    monkeypatch.setattr(compiler, "_fetch_l3_blocks", l3)
+    requests = [(f"q{i}", 300 + 50 * (i % 8)) for i in range(64)]
+
+    def run(req):
+        query, budget = req
+        return compiler.compile(query, [f"scope-{query}"], token_budget=budget)
+
+    start = time.monotonic()
+    serial = [run(r) for r in requests[:8]]
+    serial_per_request = (time.monotonic() - start) / 8
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        results = list(pool.map(run, requests))
+    threaded_per_request = (time.monotonic() - start) / len(requests)
+
+    for (query, budget), result in zip(requests, results):
+        assert result.token_budget == budget and result.tokens_used <= budget
+        assert f"### RECORD: {query}\n" in result.text
+        assert not any(f"### RECORD: q{j}\n" in result.text for j in range(64) if f"q{j}" != query)
+    assert compiler.defaults.token_budget == 6000  # requests never touch the shared defaults
+    assert threaded_per_request < serial_per_request / 2
+
+def test_l3_filter_option_reaches_search_and_cache_key(compiler):
+    opts = compiler.options(l3_filter={"branch": "main", "path": "src/api/"})
+    assert opts.l3_filter.branch == ("main",)
+    assert opts.cache_variant() != compiler.defaults.cache_variant()
+    assert compiler.options(l3_filter={}).l3_filter is None
+
+def test_l2_fetch_is_ranked_and_bounded_by_the_l2_budget(monkeypatch):
+    c = ContextCompiler()
+    calls = []
+    def get_digests(scope_ids, **kwargs):
+        calls.append(kwargs)
+        return [("d1", "overview", "session", 3), ("d2", "api module", "module", 1)]
+    monkeypatch.setattr(c.l2, "get_digests", get_digests)
+    opts = c.options(token_budget=2400, l2_zoom=["session", "module"])
+    blocks = c._fetch_l2_blocks("retry policy", ["s"], opts)
+    assert calls[0]["limit"] == opts.l2_limit() == 5  # 2400 * 0.25 // 120
+    assert calls[0]["zoom"] == ("session", "module")
+    assert calls[0]["query_embedding"] is c.query_embeddings.encode("retry policy")
+    assert [b.text for b in blocks] == ["### DIGEST (v3): overview", "### DIGEST (v1): api module"]
+    assert blocks[0].score > blocks[1].score
@@ -0,0 +1,112 @@
+import pytest
+import threading
+from psycopg2 import extensions
+from psycopg2.pool import PoolError
+from core.db import ConnectionPool
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, sql, params=None):
+        if self.conn.broken:
+            raise extensions.QueryCanceledError("server closed the connection")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+        self.broken = False
+        self.in_transaction = False
+        self.rollbacks = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def get_transaction_status(self):
+        if self.in_transaction:
+            return extensions.TRANSACTION_STATUS_INTRANS
+        return extensions.TRANSACTION_STATUS_IDLE
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.in_transaction = False
+
+    def close(self):
+        self.closed = 1
+
+def make_pool(**kwargs):
+    opened = []
+    def connect():
+        conn = FakeConnection()
+        opened.append(conn)
+        return conn
+    return ConnectionPool(connect=connect, **kwargs), opened
+
+def test_pool_reuses_connections():
+    pool, opened = make_pool(min_size=0, max_size=2)
+    for _ in range(5):
+        with pool.connection() as conn:
+            pass
+    assert len(opened) == 1
+    stats = pool.stats()
+    assert stats["checkouts"] == 5
+    assert stats["connections_opened"] == 1
+    assert stats["idle"] == 1 and stats["in_use"] == 0
+
+def test_pool_resets_open_transactions_on_return():
+    pool, _ = make_pool(min_size=0, max_size=1)
+    with pool.connection() as conn:
+        conn.in_transaction = True
+    assert conn.rollbacks == 1
+    assert pool.stats()["idle"] == 1
+
+def test_pool_times_out_when_exhausted():
+    pool, _ = make_pool(min_size=0, max_size=1, checkout_timeout=0.05)
+    held = pool.getconn()
+    with pytest.raises(PoolError):
+        pool.getconn()
+    assert pool.stats()["checkout_timeouts"] == 1
+    pool.putconn(held)
+
+def test_pool_hands_connection_to_waiter():
+    pool, opened = make_pool(min_size=0, max_size=1, checkout_timeout=2)
+    held = pool.getconn()
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(pool.getconn()))
+    waiter.start()
+    pool.putconn(held)
+    waiter.join(timeout=2)
+    assert got == [held]
+    assert len(opened) == 1
+
+def test_pool_recycles_expired_and_unhealthy_connections():
+    pool, opened = make_pool(min_size=0, max_size=2, max_lifetime=0)
+    with pool.connection():
+        pass
+    with pool.connection():
+        pass
+    assert len(opened) == 2
+    assert opened[0].closed
+
+    pool, opened = make_pool(min_size=0, max_size=2, health_check_after=0)
+    with pool.connection() as conn:
+        conn.broken = True
+    with pool.connection() as fresh:
+        pass
+    assert fresh is not conn
+    assert pool.stats()["health_check_failures"] == 1
+
+def test_pool_open_prefills_min_size():
+    pool, opened = make_pool(min_size=3, max_size=5)
+    pool.open()
+    assert len(opened) == 3
+    assert pool.stats()["idle"] == 3
+    pool.close()
+    assert all(c.closed for c in opened)
+    assert pool.stats()["size"] == 0
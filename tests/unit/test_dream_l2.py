@@ -0,0 +1,42 @@
+from core.l2_processor import affected_digests
+from core.summarizers import ExtractiveSummarizer
+from scripts.dream_l2 import regenerate, settled_horizon
+
+class Cur:
+    def __init__(self, rows):
+        self.rows = rows
+    def execute(self, sql, params):
+        self.params = params
+    def fetchall(self):
+        return self.rows
+
+def test_regenerate_only_touches_affected_digests():
+    affected = affected_digests([("src/api/routes.py", 10, 12)])
+    file_records = {"src/api/routes.py": [(10, 12, "Adds the health route."), (None, None, "Routes module.")]}
+    # an unchanged sibling module stored under the same subsystem
+    stored = {("subsystem", "src"): {("module", "src/db"): "src/db: Pool setup."}}
+    texts = regenerate(affected, file_records, [], stored, ExtractiveSummarizer())
+    assert set(texts) == {("chunk", "src/api/routes.py#0"), ("file", "src/api/routes.py"), ("module", "src/api"),
+                          ("subsystem", "src"), ("session", "")}
+    assert texts[("chunk", "src/api/routes.py#0")] == "src/api/routes.py L0-99: Adds the health route."
+    assert texts[("file", "src/api/routes.py")].startswith("src/api/routes.py: Routes module.")
+    assert "Pool setup" in texts[("subsystem", "src")] and "health route" in texts[("subsystem", "src")]
+
+def test_regenerate_marks_digests_without_sources_for_deletion():
+    affected = affected_digests([("a.py", 300, 300)])
+    texts = regenerate(affected, {}, [], {}, ExtractiveSummarizer())
+    assert set(texts) == {(level, key) for level, keys in affected.items() for key in keys}
+    assert all(text is None for text in texts.values())
+
+    # A deleted file drops out of its module, whose other stored child is kept
+    stored = {("module", "src/api"): {("file", "src/api/old.py"): "src/api/old.py: Stale.",
+                                      ("file", "src/api/routes.py"): "src/api/routes.py: Routes."}}
+    texts = regenerate(affected_digests([("src/api/old.py", None, None)]), {}, [], stored, ExtractiveSummarizer())
+    assert texts[("file", "src/api/old.py")] is None
+    assert "Routes" in texts[("module", "src/api")] and "Stale" not in texts[("module", "src/api")]
+
+def test_settled_horizon_stops_at_recent_gap_only():
+    # 12 is missing: old gap (rolled back) is stepped over, recent gap at 15 stops the walk
+    cur = Cur([(11, False), (13, False), (14, True), (16, True), (17, True)])
+    assert settled_horizon(cur, 10, limit=100, gap_timeout=60) == 14
+    assert settled_horizon(Cur([]), 10) == 10
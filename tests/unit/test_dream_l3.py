@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+import scripts.dream_l3 as dream_l3
+
+class Conn:
+    """One claimed batch; records statements and the outcome of the transaction."""
+    def __init__(self, events):
+        self.events, self.sql, self.committed = events, [], False
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc):
+        return False
+    def cursor(self):
+        return self
+    def execute(self, sql, params=None):
+        self.sql.append((sql, params))
+    def fetchall(self):
+        return self.events
+    def commit(self):
+        self.committed = True
+    def rollback(self):
+        pass
+
+class Encoder:
+    def encode_batch(self, texts):
+        if any("poison" in t for t in texts):
+            raise ValueError("cannot encode")
+        return [np.zeros(4, dtype=np.float32) for _ in texts]
+
+class Store:
+    def __init__(self):
+        self.written = []
+    def add_snippets(self, snippets, cur=None):
+        self.written.extend(snippets)
+        return len(snippets)
+
+def event(eid, directive):
+    return (eid, f"r{eid}", "scope", "user_wish", {"directive": directive}, None, "cli", "repo", "main")
+
+def test_poison_event_is_dead_lettered_and_the_rest_commit(monkeypatch):
+    conn = Conn([event(1, "poison"), event(2, "keep tabs"), event(3, "use ruff")])
+    monkeypatch.setattr(dream_l3, "db_connection", lambda: conn)
+    store = Store()
+    assert dream_l3.consolidate_batch(store, Encoder()) == (3, {"scope"})
+    assert conn.committed
+    assert [s[5] for s in store.written] == [2, 3]
+    failed = [params for sql, params in conn.sql if sql == dream_l3.FAIL_SQL]
+    assert failed == [("cannot encode", 1)]
+
+def test_failure_of_every_event_is_raised_and_nothing_commits(monkeypatch):
+    conn = Conn([event(1, "poison"), event(2, "poison too")])
+    monkeypatch.setattr(dream_l3, "db_connection", lambda: conn)
+    with pytest.raises(ValueError):
+        dream_l3.consolidate_batch(Store(), Encoder())
+    assert not conn.committed
+    assert not any(sql == dream_l3.FAIL_SQL for sql, _ in conn.sql)
@@ -0,0 +1,85 @@
+import time
+import threading
+from core.dream_scheduler import DreamScheduler
+
+def make(debounce=0.05, max_delay=1.0, max_concurrent=1, job_time=0.0):
+    runs = []
+    lock = threading.Lock()
+    def job():
+        with lock:
+            runs.append(time.monotonic())
+        time.sleep(job_time)
+    scheduler = DreamScheduler([job], debounce=debounce, max_delay=max_delay, max_concurrent=max_concurrent)
+    scheduler.start()
+    return scheduler, runs
+
+def test_burst_coalesces_into_one_run():
+    scheduler, runs = make()
+    try:
+        seqs = [scheduler.trigger() for _ in range(500)]
+        assert scheduler.wait(seqs[-1], timeout=2)
+        assert len(runs) == 1
+        stats = scheduler.snapshot()
+        assert stats["triggers"] == 500 and stats["coalesced"] == 499
+        assert stats["pending_triggers"] == 0 and stats["last_run_triggers"] == 500
+    finally:
+        scheduler.stop(timeout=1)
+
+def test_trigger_during_run_gets_its_own_run():
+    scheduler, runs = make(debounce=0.01, job_time=0.1)
+    try:
+        first = scheduler.trigger()
+        time.sleep(0.05)  # first run is now executing
+        second = scheduler.trigger()
+        assert scheduler.wait(first, timeout=2)
+        assert scheduler.wait(second, timeout=2)
+        assert len(runs) == 2
+    finally:
+        scheduler.stop(timeout=1)
+
+def test_max_delay_bounds_a_steady_stream():
+    scheduler, runs = make(debounce=0.05, max_delay=0.1)
+    try:
+        start = time.monotonic()
+        while time.monotonic() - start < 0.3:
+            scheduler.trigger()
+            time.sleep(0.01)  # never quiet for the debounce window
+        assert len(runs) >= 2
+    finally:
+        scheduler.stop(timeout=1)
+
+def test_run_now_skips_debounce_and_reports_errors():
+    def boom():
+        raise RuntimeError("db down")
+    scheduler = DreamScheduler([boom], debounce=5.0)
+    scheduler.start()
+    try:
+        start = time.monotonic()
+        assert scheduler.run_now(timeout=1)
+        assert time.monotonic() - start < 1
+        stats = scheduler.snapshot()
+        assert stats["errors"] == 1 and "db down" in stats["last_error"]
+    finally:
+        scheduler.stop(timeout=1)
+
+def test_concurrency_is_capped():
+    active, peak = [0], [0]
+    lock = threading.Lock()
+    def job():
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.05)
+        with lock:
+            active[0] -= 1
+    scheduler = DreamScheduler([job], debounce=0.0, max_delay=0.0, max_concurrent=2)
+    scheduler.start()
+    try:
+        seqs = []
+        for _ in range(10):
+            seqs.append(scheduler.trigger())
+            time.sleep(0.01)
+        assert scheduler.wait(seqs[-1], timeout=2)
+        assert peak[0] <= 2
+    finally:
+        scheduler.stop(timeout=1)
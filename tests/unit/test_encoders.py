@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+from core.encoders import Encoder, MockEncoder, QueryEmbeddingCache, get_encoder
+
+def test_mock_batch_matches_single_encodes():
+    enc = MockEncoder()
+    texts = ["alpha", "beta", "alpha", ""]
+    batch = enc.encode_batch(texts)
+    assert batch.shape == (4, 1536) and batch.dtype == np.float32
+    np.testing.assert_allclose(np.linalg.norm(batch, axis=1), 1.0, rtol=1e-5)
+    np.testing.assert_array_equal(batch[0], enc.encode("alpha"))
+    np.testing.assert_array_equal(batch[0], batch[2])
+    assert abs(float(batch[0] @ batch[1])) < 0.15  # unrelated texts are near-orthogonal
+    assert isinstance(enc, Encoder)
+
+def test_mock_is_stable_across_instances_and_dimensions():
+    np.testing.assert_array_equal(MockEncoder().encode("x"), MockEncoder().encode("x"))
+    assert MockEncoder(dimension=8).encode_batch(["x", "y"]).shape == (2, 8)
+    assert MockEncoder().encode_batch([]).shape == (0, 1536)
+
+def test_query_cache_skips_encoding_repeats():
+    calls = []
+    class Counting(MockEncoder):
+        def encode(self, text):
+            calls.append(text)
+            return super().encode(text)
+    cache = QueryEmbeddingCache(Counting(dimension=8), max_entries=2)
+    first = cache.encode("q1")
+    assert cache.encode("q1") is first
+    assert not first.flags.writeable
+    cache.encode("q2")
+    cache.encode("q3")  # evicts q1
+    cache.encode("q1")
+    assert calls == ["q1", "q2", "q3", "q1"]
+    assert cache.stats == {"hits": 1, "misses": 4, "evictions": 2}
+
+def test_query_cache_encodes_concurrent_misses_once():
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+    calls = []
+    class Slow(MockEncoder):
+        def encode(self, text):
+            calls.append(text)
+            time.sleep(0.05)
+            return super().encode(text)
+    cache = QueryEmbeddingCache(Slow(dimension=8))
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        vectors = list(pool.map(cache.encode, ["q"] * 4))
+    assert calls == ["q"]
+    assert all(v is vectors[0] for v in vectors)
+
+def test_get_encoder_is_shared_and_validates_spec():
+    assert get_encoder() is get_encoder()
+    assert isinstance(get_encoder("mock"), MockEncoder)
+    with pytest.raises(ValueError):
+        get_encoder("word2vec")
@@ -0,0 +1,82 @@
+import pytest
+from core.hot_symbols import (
+    HotSymbolStore, merge_symbols, base_key, delta_key, frozen_delta_key, version_key, TOMBSTONE,
+)
+
+def test_merge_symbols_applies_tombstones():
+    base = {"focus": "x", "bug": "old", "gone": "1"}
+    delta = {"bug": "new", "gone": TOMBSTONE, "next": "n"}
+    assert merge_symbols(base, delta) == {"focus": "x", "bug": "new", "next": "n"}
+    assert merge_symbols(None, {"a": TOMBSTONE}) == {}
+
+def seed(client):
+    client.hset("hot_symbols:a:base", mapping={"focus": "x", "bug": "old", "gone": "1"})
+    client.hset("hot_symbols:a:delta", mapping={"bug": "new", "gone": TOMBSTONE, "next": "n"})
+    client.hset("hot_symbols:b:base", mapping={"focus": "y", "z": "1"})
+    client.hset("hot_symbols:b:delta", mapping={"z": TOMBSTONE})
+
+def test_lua_and_pipeline_merges_agree():
+    fakeredis = pytest.importorskip("fakeredis")
+    try:
+        import lupa  # noqa: F401  (fakeredis needs it for EVAL)
+    except ImportError:
+        pytest.skip("fakeredis Lua support not installed")
+    client = fakeredis.FakeRedis(decode_responses=True)
+    seed(client)
+    store = HotSymbolStore(client)
+    lua = store.fetch_merged(["a", "b", "missing"])
+    piped = store.fetch_merged_pipelined(["a", "b", "missing"])
+    assert lua == {"focus": "y", "bug": "new", "next": "n"}
+    assert list(lua.items()) == list(piped.items())
+    assert store.fetch_merged([]) == {}
+
+def test_compaction_swaps_in_new_base_without_changing_reads():
+    fakeredis = pytest.importorskip("fakeredis")
+    try:
+        import lupa  # noqa: F401
+    except ImportError:
+        pytest.skip("fakeredis Lua support not installed")
+    client = fakeredis.FakeRedis(decode_responses=True)
+    seed(client)
+    store = HotSymbolStore(client)
+    before = store.fetch_merged(["a"])
+
+    # A write landing while a compaction is in flight (after the freeze) must survive it
+    store._freeze(keys=[version_key("a"), delta_key("a"), frozen_delta_key("a"), "hot_symbols:a:delta_since"])
+    store.write_delta("a", {"late": "1"})
+    assert store.fetch_merged(["a"]) == store.fetch_merged_pipelined(["a"]) == {**before, "late": "1"}
+
+    assert store.compact("a") == 1
+    assert client.hgetall(base_key("a", 1)) == {"focus": "x", "bug": "new", "next": "n"}
+    assert not client.exists(frozen_delta_key("a"))
+    assert store.fetch_merged(["a"]) == store.fetch_merged_pipelined(["a"]) == {**before, "late": "1"}
+
+    # A reader that cached version 0 retries against the moved pointer; only declared keys are read
+    reader = HotSymbolStore(client)
+    reader._versions["a"] = 0
+    assert reader.fetch_merged(["a"]) == {**before, "late": "1"}
+    assert reader.use_lua and reader._versions["a"] == 1
+
+    status = store.compaction_status("a")
+    assert status["base_version"] == 1 and status["delta_size"] == 1
+    assert store.compact("missing") is None
+
+def test_async_store_matches_sync_store():
+    import asyncio
+    fakeredis = pytest.importorskip("fakeredis")
+    try:
+        import lupa  # noqa: F401
+    except ImportError:
+        pytest.skip("fakeredis Lua support not installed")
+    from core.hot_symbols import AsyncHotSymbolStore
+    server = fakeredis.FakeServer()
+    sync_store = HotSymbolStore(fakeredis.FakeRedis(server=server, decode_responses=True))
+    seed(sync_store.redis)
+
+    async def run():
+        store = AsyncHotSymbolStore(fakeredis.FakeAsyncRedis(server=server, decode_responses=True))
+        assert await store.write_delta("b", {"late": "1"}) == 2
+        return await store.fetch_merged(["a", "b"]), await store.fetch_merged_pipelined(["a", "b"])
+    lua, piped = asyncio.run(run())
+    assert lua == piped == sync_store.fetch_merged(["a", "b"])
+    assert lua["late"] == "1"
@@ -0,0 +1,49 @@
+from core.l2_processor import digest_params, render_params
+
+def test_single_level_query_is_ranked_and_bounded():
+    template, params = digest_params(["s1"], ["session"], query_embedding="[0.1,0.2]", limit=7)
+    sql, args = render_params(template, params, "pyformat")
+    assert "lod_level = %(level0)s" in sql and "embedding <=> %(vec)s::vector" in sql
+    assert "ORDER BY score DESC NULLS LAST" in sql and "LIMIT %(limit)s" in sql
+    assert args["limit"] == 7 and args["quota"] == 7 and args["level0"] == "session" and args["scopes"] == ["s1"]
+
+def test_zoom_chains_levels_through_parent_ids():
+    template, params = digest_params(["s1"], ["subsystem", "module", "file"], limit=5)
+    sql, args = render_params(template, params, "numeric")
+    assert "embedding" not in sql  # no query vector: recency only
+    assert "parent_id IN (SELECT digest_id FROM level0)" in sql
+    assert "parent_id IN (SELECT digest_id FROM level1)" in sql
+    # deeper levels are reached only through parent_id, so idx_l2_parent bounds the scan
+    assert "parent_id IS NULL" not in sql
+    # every level is guaranteed its share of the limit before the rest is handed out
+    assert "ORDER BY rank > $3, depth" in sql
+    assert "ORDER BY depth, score DESC" in sql
+    # every $n is bound, in order
+    assert len(args) == max(int(n) for n in __import__("re").findall(r"\$(\d+)", sql))
+    assert args[:3] == [["s1"], 5, 1] and args[-3:] == ["subsystem", "module", "file"]
+
+def test_parent_ids_and_any_level():
+    template, params = digest_params(["s1"], None, parent_ids=["p1"])
+    sql, args = render_params(template, params, "pyformat")
+    assert "lod_level" not in sql.split("FROM l2_digests")[1].split("ORDER BY")[0]
+    assert "parent_id = ANY(%(parent_ids)s::uuid[])" in sql and args["parent_ids"] == ["p1"]
+
+def test_affected_digests_cover_chunks_and_ancestors(monkeypatch):
+    from core import l2_processor
+    monkeypatch.setattr(l2_processor, "L2_CHUNK_LINES", 100)
+    affected = l2_processor.affected_digests([("src/api/routes.py", 95, 120), ("README.md", None, None), (None, None, None)])
+    assert affected["chunk"] == {"src/api/routes.py#0", "src/api/routes.py#1"}
+    assert affected["file"] == {"src/api/routes.py", "README.md"}
+    assert affected["module"] == {"src/api", "."}
+    assert affected["subsystem"] == {"src", "."}
+    assert affected["session"] == {""}
+
+def test_parent_chain_and_stable_ids():
+    from core.l2_processor import parent_of, digest_uuid
+    node, chain = ("chunk", "src/api/routes.py#3"), []
+    while node:
+        chain.append(node)
+        node = parent_of(*node)
+    assert chain == [("chunk", "src/api/routes.py#3"), ("file", "src/api/routes.py"), ("module", "src/api"),
+                     ("subsystem", "src"), ("session", "")]
+    assert digest_uuid("s1", "file", "a.py") == digest_uuid("s1", "file", "a.py") != digest_uuid("s2", "file", "a.py")
@@ -0,0 +1,50 @@
+from core.metrics import Registry, Counter, Gauge, Histogram, REGISTRY
+
+def test_render_prometheus_text():
+    registry = Registry()
+    requests = Counter("t_requests", "Requests", ["path"], registry=registry)
+    requests.labels("single").inc()
+    requests.labels(path="batch").inc(3)
+    latency = Histogram("t_latency_seconds", "Latency", buckets=(0.01, 0.1), registry=registry)
+    for value in (0.005, 0.01, 0.05, 2):
+        latency.observe(value)
+    text = registry.render()
+    assert "# TYPE t_requests counter" in text
+    assert 't_requests_total{path="single"} 1' in text
+    assert 't_requests_total{path="batch"} 3' in text
+    assert "# TYPE t_latency_seconds histogram" in text
+    assert 't_latency_seconds_bucket{le="0.01"} 2' in text  # le is inclusive
+    assert 't_latency_seconds_bucket{le="0.1"} 3' in text
+    assert 't_latency_seconds_bucket{le="+Inf"} 4' in text
+    assert "t_latency_seconds_count 4" in text
+    assert "t_latency_seconds_sum 2.065" in text
+
+def test_function_metrics_are_read_at_scrape_and_errors_skip_them():
+    registry = Registry()
+    backlog = {"n": 5}
+    Gauge("t_backlog", "Backlog", registry=registry).set_function(lambda: backlog["n"])
+    Gauge("t_pool", "Pool", ["state"], registry=registry).set_function(lambda: {("idle",): 2, ("in_use",): 1})
+    Gauge("t_broken", "Broken", registry=registry).set_function(lambda: 1 / 0)
+    backlog["n"] = 7
+    text = registry.render()
+    assert "t_backlog 7" in text
+    assert 't_pool{state="idle"} 2' in text and 't_pool{state="in_use"} 1' in text
+    assert "t_broken" not in text
+
+def test_compile_records_stage_latencies(monkeypatch):
+    from core.context_compiler import ContextCompiler
+    from core.budget import ContextBlock
+    c = ContextCompiler()
+    monkeypatch.setattr(c.cache, "key", lambda *args: None)
+    monkeypatch.setattr(c, "_fetch_l1_blocks", lambda scope_ids: [ContextBlock("L1", "- focus: x")])
+    monkeypatch.setattr(c, "_fetch_l2_blocks", lambda query, scope_ids, opts: [])
+    monkeypatch.setattr(c.vs, "search_l3", lambda *args, **kwargs: [])
+    before = REGISTRY.render()
+    c.compile("q", ["s"])
+    after = REGISTRY.render()
+
+    def count(text, stage):
+        prefix = f'vault_context_stage_seconds_count{{stage="{stage}"}} '
+        return next((int(line[len(prefix):]) for line in text.splitlines() if line.startswith(prefix)), 0)
+    for stage in ("l1", "l2", "l3", "encoding", "provenance", "assembly"):
+        assert count(after, stage) == count(before, stage) + 1
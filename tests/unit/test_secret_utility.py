@@ -0,0 +1,63 @@
+import pytest
+import subprocess
+from utils import secret_utility
+
+class FakeKeystore:
+    def __init__(self, secrets):
+        self.secrets = dict(secrets)
+        self.calls = 0
+
+    def run(self, cmd, **kwargs):
+        self.calls += 1
+        if cmd[0] == "/bin/sh":
+            keys = cmd[4:]
+            out = "".join(f"{k}\0{self.secrets[k]}\n\0" for k in keys if k in self.secrets)
+            return subprocess.CompletedProcess(cmd, 0, stdout=out, stderr="")
+        key = cmd[2]
+        if key not in self.secrets:
+            raise subprocess.CalledProcessError(1, cmd, stderr="not found")
+        return subprocess.CompletedProcess(cmd, 0, stdout=self.secrets[key] + "\n", stderr="")
+
+@pytest.fixture
+def keystore(monkeypatch):
+    fake = FakeKeystore({"VAULT_API_KEY": "k1", "VAULT_DB_USER": "vault"})
+    monkeypatch.setattr(secret_utility.subprocess, "run", fake.run)
+    secret_utility.invalidate_secrets()
+    yield fake
+    secret_utility.invalidate_secrets()
+
+def test_get_secret_is_cached(keystore):
+    assert secret_utility.get_secret("VAULT_DB_USER") == "vault"
+    assert secret_utility.get_secret("VAULT_DB_USER") == "vault"
+    assert keystore.calls == 1
+
+def test_missing_secret_is_not_refetched_every_call(keystore):
+    assert secret_utility.get_secret("NOPE") is None
+    assert secret_utility.get_secret("NOPE") is None
+    assert keystore.calls == 1
+
+def test_preload_uses_one_keystore_call(keystore):
+    loaded = secret_utility.preload_secrets(("VAULT_API_KEY", "VAULT_DB_USER", "VAULT_DB_PASS"))
+    assert sorted(loaded) == ["VAULT_API_KEY", "VAULT_DB_USER"]
+    assert secret_utility.get_secret("VAULT_API_KEY") == "k1"
+    assert keystore.calls == 1
+
+def test_ttl_expiry_refetches(keystore, monkeypatch):
+    monkeypatch.setattr(secret_utility, "SECRET_TTL", 0.0001)
+    secret_utility.get_secret("VAULT_DB_USER")
+    import time; time.sleep(0.001)
+    secret_utility.get_secret("VAULT_DB_USER")
+    assert keystore.calls == 2
+
+def test_verify_secret_picks_up_rotation(keystore, monkeypatch):
+    assert secret_utility.verify_secret("VAULT_API_KEY", "k1")
+    keystore.secrets["VAULT_API_KEY"] = "k2"
+    # Fresh cache entry: a mismatch does not hammer the keystore
+    assert not secret_utility.verify_secret("VAULT_API_KEY", "k2")
+    monkeypatch.setattr(secret_utility, "ROTATION_RECHECK_INTERVAL", 0)
+    assert secret_utility.verify_secret("VAULT_API_KEY", "k2")
+    assert not secret_utility.verify_secret("VAULT_API_KEY", None)
+
+def test_verify_secret_fallback(keystore):
+    assert secret_utility.verify_secret("NOPE", "dev", fallback="dev")
+    assert not secret_utility.verify_secret("NOPE", "other", fallback="dev")
@@ -0,0 +1,19 @@
+import pytest
+from core.summarizers import ExtractiveSummarizer, Summarizer, get_summarizer
+
+def test_extractive_is_deterministic_and_bounded():
+    s = ExtractiveSummarizer(max_chars=40)
+    texts = ["Fixes the pool. Long tail here.", "Fixes the pool. Again.", "Adds retries.", "Another line entirely here."]
+    out = s.summarize(texts, "file", "a.py")
+    assert out == s.summarize(texts, "file", "a.py")
+    assert out == "Fixes the pool.; Adds retries.; (+1 more)"
+
+def test_get_summarizer_specs():
+    assert isinstance(get_summarizer("extractive"), Summarizer)
+    assert isinstance(get_summarizer("python:core.summarizers:ExtractiveSummarizer"), ExtractiveSummarizer)
+    with pytest.raises(ValueError):
+        get_summarizer("python:nomodule")
+    with pytest.raises(ValueError):
+        get_summarizer("llm")
+    with pytest.raises(TypeError):
+        get_summarizer("python:builtins:object")
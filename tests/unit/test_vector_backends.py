@@ -0,0 +1,164 @@
+import uuid
+import asyncio
+import numpy as np
+from core.vector_backends import NumpyVectorBackend, RoutedVectorStore
+from core.vector_store import L3Match, L3Filter, filter_sql
+
+DIM = 32
+
+def corpus(n, seed=0):
+    return np.random.default_rng(seed).standard_normal((n, DIM)).astype(np.float32)
+
+def test_numpy_search_matches_brute_force_cosine():
+    backend = NumpyVectorBackend(database=False, dimension=DIM)
+    a, b = corpus(300, 1), corpus(200, 2) * 5  # unnormalized: similarity must still be cosine
+    backend.add_snippets([(f"a{i}", "A", f"a{i}", {}, v) for i, v in enumerate(a)])
+    backend.add_snippets([(f"b{i}", "B", f"b{i}", {}, v) for i, v in enumerate(b)])
+    query = corpus(1, 3)[0]
+
+    matches = backend.search_l3(["A", "B"], query, limit=10)
+    both = np.vstack([a, b])
+    cosine = both @ query / (np.linalg.norm(both, axis=1) * np.linalg.norm(query))
+    expected = [f"a{i}" if i < 300 else f"b{i - 300}" for i in np.argsort(-cosine)[:10]]
+    assert [m.record_id for m in matches] == expected
+    assert np.allclose([m.similarity for m in matches], np.sort(cosine)[::-1][:10], atol=1e-5)
+    assert all(isinstance(m, L3Match) for m in matches)
+
+    assert {m.record_id[0] for m in backend.search_l3(["A"], query, limit=50)} == {"a"}
+    assert len(backend.search_l3(["A"], query, limit=1000)) == 300
+    assert backend.search_l3(["unknown"], query) == []
+
+def test_numpy_backend_grows_without_disturbing_results():
+    backend = NumpyVectorBackend(database=False, dimension=DIM)
+    vectors = corpus(1000, 4)
+    for start in range(0, 1000, 70):  # several buffer doublings
+        backend.add_snippets([(str(i), "S", str(i), {}, vectors[i]) for i in range(start, min(start + 70, 1000))])
+    assert backend.resident_count("S") == 1000
+    top = backend.search_l3(["S"], vectors[123], limit=1)[0]
+    assert top.record_id == "123" and top.similarity > 0.999
+
+def test_hybrid_search_surfaces_exact_identifiers():
+    backend = NumpyVectorBackend(database=False, dimension=DIM)
+    vectors = corpus(200, 6)
+    texts = [f"routine note {i}" for i in range(200)]
+    texts[150] = "FullCleanup fixed the Redis Protocol Error in cleanup_redis.py"
+    backend.add_snippets([(str(i), "S", texts[i], {}, v) for i, v in enumerate(vectors)])
+    query = vectors[7]
+
+    semantic = backend.search_l3(["S"], query, limit=5)
+    assert "150" not in [m.record_id for m in semantic] and semantic[0].score is None
+    hybrid = backend.search_l3(["S"], query, limit=5, query_text="redis protocol error")
+    ids = [m.record_id for m in hybrid]
+    assert "150" in ids and ids[0] == "7"  # best in both lists would win; best vector stays on top here
+    assert all(m.score is not None for m in hybrid)
+    assert [m.score for m in hybrid] == sorted((m.score for m in hybrid), reverse=True)
+    # Words that appear nowhere add no lexical candidates: plain vector order
+    assert [m.record_id for m in backend.search_l3(["S"], query, limit=5, query_text="zebra")] == [m.record_id for m in semantic]
+
+def test_term_postings_track_appended_rows():
+    from core.vector_backends import _TermPostings, _terms
+    texts = [f"note {i} {'redis' if i % 3 == 0 else 'pg'} Redis_{i % 5}" for i in range(100)]
+    postings = _TermPostings()
+    for start in range(0, 100, 7):  # several buffer doublings
+        postings.extend(start, texts[start:start + 7])
+    view = postings.view({"redis", "pg", "redis_2", "zebra"})
+    assert set(view) == {"redis", "pg", "redis_2"}
+    for term, indices in view.items():
+        assert list(indices) == [i for i, text in enumerate(texts) if term in _terms(text)]
+
+def test_filtered_search_returns_full_k_of_matching_snippets():
+    backend = NumpyVectorBackend(database=False, dimension=DIM)
+    vectors = corpus(400, 7)
+    meta = [{"path": f"src/{'api' if i % 10 == 0 else 'core'}/m{i}.py", "branch": "main" if i % 20 == 0 else "dev",
+             "artifact_type": "decision"} for i in range(400)]
+    backend.add_snippets([(str(i), "S", f"t{i}", meta[i], v) for i, v in enumerate(vectors)])
+
+    flt = L3Filter(path="src/api/", branch="main")
+    matches = backend.search_l3(["S"], vectors[1], limit=10, l3_filter=flt)
+    assert len(matches) == 10  # 20 of 400 snippets match; none of them is the nearest neighbour
+    assert all(int(m.record_id) % 20 == 0 for m in matches)
+    assert [m.similarity for m in matches] == sorted((m.similarity for m in matches), reverse=True)
+    assert len(backend.search_l3(["S"], vectors[1], limit=50, l3_filter={"path": "src/api/"})) == 40
+    hybrid = backend.search_l3(["S"], vectors[1], limit=5, query_text="t3", l3_filter=flt)
+    assert len(hybrid) == 5 and all(int(m.record_id) % 20 == 0 for m in hybrid)
+    assert backend.search_l3(["S"], vectors[1], limit=5, l3_filter={"branch": ["release"]}) == []
+
+def test_vectorised_filter_mask_agrees_with_matches():
+    from core.vector_backends import _FilterColumns, _filter_mask
+    metadatas = [
+        {"path": "src/api/a.py", "branch": "main", "artifact_type": "decision", "source": "git"},
+        {"path": "src/api_v2/b.py", "branch": "dev", "artifact_type": ["list"]},
+        {"branch": "main"}, None, {"path": "src/api/c.py", "branch": "release", "source": "cli"},
+    ]
+    columns = _FilterColumns()
+    columns.extend(0, metadatas[:2])
+    columns.extend(2, metadatas[2:])  # appended in two syncs
+    for flt in (L3Filter(path="src/api/"), L3Filter(branch=["main", "release"]), L3Filter(artifact_type="decision"),
+                L3Filter(path="src/api", source="cli"), L3Filter(branch="unknown")):
+        expected = [flt.matches(m) for m in metadatas]
+        assert _filter_mask(columns.view(len(metadatas)), flt).tolist() == expected
+
+def test_filter_sql_uses_indexable_conditions():
+    flt = L3Filter(path="src/my_api/", artifact_type=["decision", "command_success"], branch="main")
+    sql, params = filter_sql(flt, lambda i: f"${i + 4}")
+    assert sql == (" AND metadata @> $4::jsonb AND (metadata @> $5::jsonb OR metadata @> $6::jsonb)"
+                   " AND metadata->>'path' LIKE $7")
+    assert params == [{"branch": "main"}, {"artifact_type": "decision"}, {"artifact_type": "command_success"},
+                      "src/my\\_api/%"]
+    assert filter_sql(L3Filter.of({}), lambda i: "?") == ("", [])
+    assert flt.matches({"path": "src/my_api/x.py", "artifact_type": "decision", "branch": "main"})
+    assert not flt.matches({"path": "src/my_api/x.py", "artifact_type": "decision", "branch": "dev"})
+
+class FakePg:
+    def __init__(self, matches):
+        self.matches = matches
+        self.calls = []
+
+    def search_l3(self, scope_ids, query_embedding, limit=10, recall=None, query_text=None, l3_filter=None):
+        self.calls.append(list(scope_ids))
+        return self.matches[:limit]
+
+    async def search_l3_async(self, scope_ids, query_embedding, limit=10, recall=None, query_text=None, l3_filter=None):
+        return self.search_l3(scope_ids, query_embedding, limit, recall, query_text, l3_filter)
+
+def test_routing_splits_scopes_and_merges_by_similarity(monkeypatch):
+    memory = NumpyVectorBackend(database=False, dimension=DIM)
+    vectors = corpus(20, 5)
+    memory.add_snippets([(f"m{i}", "small", f"m{i}", {}, v) for i, v in enumerate(vectors)])
+    big = str(uuid.uuid4())
+    pg = FakePg([L3Match(None, "pg-best", "t", {}, 0.99, None, None, None, None, None)])
+    monkeypatch.setattr(memory, "scope_rows", lambda scope_ids: {s: (10_000 if s == big else 20) for s in scope_ids})
+    store = RoutedVectorStore(pg=pg, memory=memory, max_scope_rows=1000)
+
+    assert store.route(["small", big]) == (["small"], [big])
+    matches = store.search_l3(["small", big], vectors[3], limit=3)
+    assert pg.calls == [[big]]  # only the large scope reaches the database
+    assert [m.record_id for m in matches][:2] == ["m3", "pg-best"]
+
+    pg.calls.clear()
+    store.search_l3(["small"], vectors[3], limit=3)
+    assert pg.calls == []
+    matches = asyncio.run(store.search_l3_async(["small", big], vectors[3], limit=2))
+    assert [m.record_id for m in matches] == ["m3", "pg-best"]
+    assert store.snapshot()["pgvector_scopes"] == 1
+
+def test_lru_eviction_bounds_resident_rows():
+    memory = NumpyVectorBackend(database=False, dimension=DIM)
+    for scope in ("a", "b", "c"):
+        memory.add_snippets([(str(i), scope, str(i), {}, v) for i, v in enumerate(corpus(10))])
+    memory.search_l3(["a"], corpus(1)[0])  # a becomes most recently used
+    assert memory.evict_lru(20) == ["b"]
+    assert memory.resident("a") and memory.resident("c") and not memory.resident("b")
+
+def test_merge_fuses_hybrid_ranks_across_backends():
+    from core.vector_backends import _merge
+    def match(rid, similarity, score=None):
+        return L3Match(None, rid, "t", {}, similarity, None, None, None, None, None, score)
+    memory = [match("m1", 0.40, 0.033), match("m2", 0.90, 0.016)]
+    pg = [match("p1", 0.50, 0.030), match("p2", 0.95, 0.015)]
+    merged = _merge([memory, pg], 3)
+    # each side's fused order survives; the high-similarity runners-up do not jump ahead
+    assert [m.record_id for m in merged] == ["m1", "p1", "m2"]
+    assert merged[0].score > merged[2].score
+    assert [m.record_id for m in _merge([[match("a", 0.3)], [match("b", 0.7)]], 2)] == ["b", "a"]
+    assert _merge([[], pg], 1) == pg[:1]
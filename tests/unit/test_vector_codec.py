@@ -0,0 +1,59 @@
+import io
+import struct
+import uuid
+import numpy as np
+from core.vector_codec import (
+    as_float32, vector_literal, pack_vector, unpack_vector, parse_vector, copy_binary
+)
+
+def test_vector_literal_round_trips_float32():
+    vec = np.random.default_rng(0).standard_normal(1536)
+    literal = vector_literal(vec)
+    assert literal.startswith("[") and literal.endswith("]")
+    assert np.array_equal(parse_vector(literal), as_float32(vec))
+    # Much smaller than the str(float64) formatting it replaces
+    assert len(literal) < len("[" + ",".join(map(str, vec.tolist())) + "]")
+
+def test_pack_vector_matches_pgvector_recv_format():
+    vec = [1.0, -2.5, 0.25]
+    data = pack_vector(vec)
+    assert data[:4] == struct.pack(">HH", 3, 0)
+    assert data[4:] == struct.pack(">3f", *vec)
+    assert np.array_equal(unpack_vector(data), np.array(vec, dtype=np.float32))
+
+class CopyCursor:
+    def copy_expert(self, sql, buf):
+        self.sql = sql
+        self.data = buf.read()
+
+def test_copy_binary_stream_layout():
+    cur = CopyCursor()
+    rid = uuid.uuid4()
+    count = copy_binary(
+        cur, "l3_snippets",
+        (("record_id", "uuid"), ("text", "text"), ("metadata", "jsonb"), ("embedding", "vector")),
+        [(rid, "hello", {"a": 1}, [0.5, 1.5]), (None, "x", '{"b": 2}', [1.0, 2.0])]
+    )
+    assert count == 2
+    assert cur.sql == "COPY l3_snippets (record_id, text, metadata, embedding) FROM STDIN WITH (FORMAT BINARY)"
+
+    buf = io.BytesIO(cur.data)
+    assert buf.read(11) == b"PGCOPY\n\xff\r\n\x00"
+    assert struct.unpack(">ii", buf.read(8)) == (0, 0)
+
+    def field():
+        (n,) = struct.unpack(">i", buf.read(4))
+        return None if n == -1 else buf.read(n)
+
+    assert struct.unpack(">h", buf.read(2)) == (4,)
+    assert field() == rid.bytes
+    assert field() == b"hello"
+    assert field() == b'\x01{"a": 1}'
+    assert np.array_equal(unpack_vector(field()), np.array([0.5, 1.5], dtype=np.float32))
+    assert struct.unpack(">h", buf.read(2)) == (4,)
+    assert field() is None
+    assert field() == b"x"
+    assert field() == b'\x01{"b": 2}'
+    field()
+    assert struct.unpack(">h", buf.read(2)) == (-1,)
+    assert buf.read() == b""
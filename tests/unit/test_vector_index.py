@@ -0,0 +1,106 @@
+import pytest
+import core.vector_index
+from core.vector_index import IndexSpec, search_settings, apply_search_settings, filter_settings, supports_iterative_scan
+
+def test_index_spec_sql():
+    spec = IndexSpec("l3_snippets", method="hnsw", m=24, ef_construction=128)
+    assert spec.name == "idx_l3_snippets_embedding_hnsw"
+    sql = spec.create_sql()
+    assert "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_l3_snippets_embedding_hnsw" in sql
+    assert "USING hnsw (embedding vector_cosine_ops) WITH (m = 24, ef_construction = 128)" in sql
+
+    ivf = IndexSpec("l2_digests", method="ivfflat", lists=50)
+    assert "WITH (lists = 50)" in ivf.create_sql(concurrently=False)
+    assert "CONCURRENTLY" not in ivf.create_sql(concurrently=False)
+
+def test_index_spec_rejects_unknown_targets():
+    with pytest.raises(ValueError):
+        IndexSpec("records_l0")
+    with pytest.raises(ValueError):
+        IndexSpec("l3_snippets", method="flat")
+
+def test_search_settings_profiles_and_knob():
+    assert search_settings("fast")["hnsw.ef_search"] < search_settings("accurate")["hnsw.ef_search"]
+    low, high = search_settings(0.0), search_settings(1.0)
+    assert low == {"hnsw.ef_search": 10, "ivfflat.probes": 1}
+    assert high == {"hnsw.ef_search": 400, "ivfflat.probes": 100}
+    assert search_settings(5) == high
+
+class Cur:
+    def __init__(self, version, scope_rows=0, table_rows=0, validity=None):
+        self.sql = []
+        self.version, self.scope_rows, self.table_rows, self.validity = version, scope_rows, table_rows, validity
+    def execute(self, sql, params=None):
+        self.sql.append(sql)
+    def fetchone(self):
+        if "reltuples" in self.sql[-1]:
+            return (self.scope_rows, self.table_rows)
+        if "indisvalid" in self.sql[-1]:
+            return (self.validity,) if self.validity is not None else None
+        return (self.version,)
+
+def test_apply_search_settings_covers_limit(monkeypatch):
+    monkeypatch.setattr(core.vector_index, "_iterative_scan", None)
+    cur = Cur("0.8.0")
+    settings = apply_search_settings(cur, "fast", limit=50)
+    assert settings["hnsw.ef_search"] == 50
+    assert "SET LOCAL hnsw.ef_search = 50" in cur.sql
+    assert "SET LOCAL hnsw.iterative_scan = strict_order" in cur.sql
+
+def test_filtered_search_without_iterative_scan_skips_the_ann_index(monkeypatch):
+    monkeypatch.setattr(core.vector_index, "_iterative_scan", None)
+    cur = Cur("0.7.4")
+    apply_search_settings(cur, "fast", limit=10, filtered=True)
+    assert "SET LOCAL enable_indexscan = off" in cur.sql
+    assert not any("iterative_scan" in sql for sql in cur.sql)
+    assert filter_settings(False, False) == {}
+    assert supports_iterative_scan("0.10.0") and not supports_iterative_scan("0.5.1")
+
+def test_scoped_search_without_iterative_scan_widens_or_goes_exact(monkeypatch):
+    monkeypatch.setattr(core.vector_index, "_iterative_scan", None)
+    # A scope holding 10% of the table: the post-filtered scan needs 10x the candidates
+    settings = apply_search_settings(Cur("0.7.4", 5000, 50000), "fast", limit=10, scope_ids=["s"])
+    assert settings["hnsw.ef_search"] == 200 and settings["ivfflat.probes"] == 10
+    assert "enable_indexscan" not in settings
+
+    # A small scope in a large table cannot be reached by any ef_search: exact scan
+    monkeypatch.setattr(core.vector_index, "_iterative_scan", None)
+    cur = Cur("0.7.4", 40, 1_000_000)
+    apply_search_settings(cur, "fast", limit=10, scope_ids=["s"])
+    assert "SET LOCAL enable_indexscan = off" in cur.sql
+
+    # A scope counted up to the cap is large: widest ANN scan rather than an exact one
+    monkeypatch.setattr(core.vector_index, "_iterative_scan", None)
+    settings = apply_search_settings(Cur("0.7.4", core.vector_index.SCOPE_COUNT_CAP, 10 ** 8), "fast", scope_ids=["s"])
+    assert settings["hnsw.ef_search"] == core.vector_index.HNSW_MAX_EF_SEARCH
+    assert "enable_indexscan" not in settings
+
+    # With iterative scans the scope is never counted
+    monkeypatch.setattr(core.vector_index, "_iterative_scan", None)
+    cur = Cur("0.8.0")
+    apply_search_settings(cur, "fast", limit=10, scope_ids=["s"])
+    assert not any("reltuples" in sql for sql in cur.sql)
+
+def test_rebuild_swaps_names_in_one_transaction(monkeypatch):
+    cur = Cur("0.8.0", validity=True)
+
+    class Conn:
+        def cursor(self):
+            return self
+        def __enter__(self):
+            return cur
+        def __exit__(self, *exc):
+            return False
+        def close(self):
+            pass
+    monkeypatch.setattr(core.vector_index, "_autocommit_connection", Conn)
+    spec = IndexSpec("l3_snippets")
+    assert core.vector_index.ensure_index(spec, rebuild=True) == "rebuilt"
+    swap = cur.sql[cur.sql.index("BEGIN"):]
+    assert swap == [
+        "BEGIN",
+        f"ALTER INDEX {spec.name} RENAME TO {spec.name}_old",
+        f"ALTER INDEX {spec.name}_rebuild RENAME TO {spec.name}",
+        "COMMIT",
+        f"DROP INDEX CONCURRENTLY IF EXISTS {spec.name}_old",
+    ]
@@ -0,0 +1,130 @@
+import os
+import uuid
+import numpy as np
+import core.vector_backends as vb
+from core.vector_snapshots import append_snapshot, open_snapshot, snapshot_lock, bytes_uuid, EMBEDDINGS_FILE
+
+DIM = 8
+
+def unit_rows(n, seed=0):
+    m = np.random.default_rng(seed).standard_normal((n, DIM)).astype(np.float32)
+    return m / np.linalg.norm(m, axis=1, keepdims=True)
+
+def test_append_and_memmap_round_trip(tmp_path):
+    ids = [str(uuid.uuid4()) for _ in range(5)]
+    with snapshot_lock("s", tmp_path):
+        append_snapshot("s", unit_rows(3), ids[:3], ids[:3], watermark=10, dimension=DIM, root=tmp_path)
+        append_snapshot("s", unit_rows(2, 1), ids[3:], [None, ids[4]], watermark=20, dimension=DIM, root=tmp_path)
+    snap = open_snapshot("s", tmp_path)
+    assert isinstance(snap.embeddings, np.memmap) and snap.embeddings.shape == (5, DIM)
+    assert np.array_equal(snap.embeddings, np.vstack([unit_rows(3), unit_rows(2, 1)]))
+    assert [bytes_uuid(s) for s in snap.snippet_ids] == ids
+    assert bytes_uuid(snap.record_ids[3]) is None
+    assert snap.watermark == 20 and snap.count == 5
+    assert open_snapshot("missing", tmp_path) is None
+
+def test_torn_append_is_ignored_then_truncated(tmp_path):
+    append_snapshot("s", unit_rows(2), ["a" * 32, "b" * 32], [None, None], 5, DIM, tmp_path)
+    with open(os.path.join(tmp_path, "s", EMBEDDINGS_FILE), "ab") as f:
+        f.write(b"\x00" * 7)  # a crash mid-append: meta.json still says 2 rows
+    assert open_snapshot("s", tmp_path).count == 2
+    append_snapshot("s", unit_rows(1, 2), ["c" * 32], [None], 6, DIM, tmp_path)
+    snap = open_snapshot("s", tmp_path)
+    assert snap.count == 3 and np.array_equal(snap.embeddings[2], unit_rows(1, 2)[0])
+
+def row(snippet_id):
+    return (snippet_id, snippet_id, f"text {snippet_id}", {}, None, None, None, None, None)
+
+def test_warm_start_maps_snapshot_and_replays_past_watermark(tmp_path, monkeypatch):
+    vectors = unit_rows(4, 3)
+    ids = [str(uuid.uuid4()) for _ in range(4)]
+    append_snapshot("scope", vectors[:3], ids[:3], ids[:3], watermark=3, dimension=DIM, root=tmp_path)
+    calls = []
+
+    def fetch(scope_ids, after=None, until=None, embeddings=True, held_nulls=None):
+        calls.append((after, until, embeddings, held_nulls))
+        if not embeddings:  # the snapshot's text/L0 rows
+            return {"scope": [(None, row(s), i + 1) for i, s in enumerate(ids[:3])]}, {"scope": None}
+        # replay: any row already in the snapshot is deduplicated; event 4 is new
+        return {"scope": [(vectors[i], row(ids[i]), i + 1) for i in range(4)]}, {"scope": None}
+    monkeypatch.setattr(vb, "fetch_scope_rows", fetch)
+
+    backend = vb.NumpyVectorBackend(dimension=DIM, snapshot_dir=str(tmp_path), sync_interval=60)
+    stats = backend.warm_start()
+    assert stats["scopes"] == 1 and stats["rows"] == 4
+    assert calls == [(None, 3, False, None), ({"scope": 3}, None, True, {"scope": 0})]
+    matches = backend.search_l3(["scope"], vectors[3], limit=4)
+    assert matches[0].record_id == ids[3] and matches[0].similarity > 0.999
+    assert sorted(m.record_id for m in matches) == sorted(ids)
+
+def test_stale_snapshot_falls_back_to_full_load(tmp_path, monkeypatch):
+    ids = [str(uuid.uuid4()) for _ in range(2)]
+    append_snapshot("scope", unit_rows(2), ids, ids, watermark=2, dimension=DIM, root=tmp_path)
+    # One snapshotted snippet no longer exists in Postgres
+    monkeypatch.setattr(vb, "fetch_scope_rows", lambda *a, **k: ({"scope": [(None, row(ids[0]), 1)]}, {"scope": None}))
+    backend = vb.NumpyVectorBackend(dimension=DIM, snapshot_dir=str(tmp_path))
+    assert backend._load_snapshot("scope") is False
+
+class SyncCursor:
+    """Answers fetch_scope_rows' statements from canned rows and records params."""
+    def __init__(self, pending, nulls, events=()):
+        self.pending, self.nulls, self.events, self.params = pending, nulls, list(events), None
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc):
+        return False
+    def cursor(self):
+        return self
+    def execute(self, sql, params):
+        if "ORDER BY event_id DESC" in sql:
+            self.result = self.events[-params[1]:][::-1]
+        else:
+            self.result = self.pending if "processed_at IS NULL" in sql else self.nulls if "count(*)" in sql else []
+        if "unnest" in sql:
+            self.params = params
+    def fetchall(self):
+        return self.result
+    def __iter__(self):
+        return iter([])
+
+def test_sync_horizons_are_per_scope(monkeypatch):
+    # a stuck event in scope a only cuts scope a; b has new event-less rows to pick up
+    cur = SyncCursor(pending=[("a", 7)], nulls=[("b", 2)], events=[(i, False) for i in range(1, 1001)])
+    monkeypatch.setattr(vb, "db_connection", lambda: cur)
+    _, horizons = vb.fetch_scope_rows(["a", "b"], after={"a": 5, "b": 900}, held_nulls={"a": 0, "b": 1})
+    assert horizons == {"a": 6, "b": 1000}
+    scopes, after, pending, nulls = cur.params
+    assert scopes == ["a", "b"] and after == [5, 900]
+    assert pending[0] == 7 and pending[1] > 10 ** 18
+    assert nulls == [False, True]
+
+def test_settled_horizon_stops_below_recent_gap():
+    # 3 and 6..9 are missing: 3 was rolled back long ago, 6..9 belong to a batch still in flight
+    events = [(1, False), (2, False), (4, False), (5, False), (10, True), (11, True)]
+    assert vb.settled_horizon(SyncCursor([], [], events)) == 5
+    assert vb.settled_horizon(SyncCursor([], [], events[:4] + [(5, True)])) == 5
+    assert vb.settled_horizon(SyncCursor([], [], [(2, True)])) == 0  # id 1 may still commit
+    assert vb.settled_horizon(SyncCursor([], [], [])) == 0
+    # Only the newest `limit` events are in view: the walk starts below them
+    assert vb.settled_horizon(SyncCursor([], [], events), limit=2) == 11
+
+def test_sync_watermark_waits_for_uncommitted_batch(monkeypatch):
+    """A late-committing batch below already-synced events is still picked up, however large."""
+    vectors = unit_rows(3, 5)
+    ids = [str(uuid.uuid4()) for _ in range(3)]
+    table = [(vectors[2], row(ids[2]), 5000)]  # event 5000 consolidated; batch 1..4999 not committed yet
+    calls = []
+
+    def fetch(scope_ids, after=None, until=None, embeddings=True, held_nulls=None):
+        floor = (after or {}).get("scope", 0)
+        calls.append(floor)
+        return {"scope": [item for item in table if item[2] > floor]}, {"scope": 0 if len(table) == 1 else 5000}
+    monkeypatch.setattr(vb, "fetch_scope_rows", fetch)
+
+    backend = vb.NumpyVectorBackend(dimension=DIM, snapshot_dir="", sync_interval=0)
+    backend.load(["scope"])
+    assert backend.resident_count("scope") == 1 and backend._scopes["scope"].watermark == 0
+    table[:0] = [(vectors[0], row(ids[0]), 1), (vectors[1], row(ids[1]), 2)]
+    backend.sync(["scope"], force=True)
+    assert calls == [0, 0] and backend.resident_count("scope") == 3  # event 5000 not added twice
+    assert backend._scopes["scope"].watermark == 5000
@@ -1,12 +1,32 @@
 import os
+import hmac
+import time
+import threading
 import subprocess
 
 # Absolute path to the keystore's wrapper script and directory
 KEYSTORE_DIR = "/home/wxu/.gemini/antigravity/playground/crystal-pioneer"
 KEYSTORE_SH = os.path.join(KEYSTORE_DIR, "secrets.sh")
 
-def get_secret(key):
-    """Securely fetches a secret from the crystal-pioneer keystore."""
+# Cached secrets expire after this many seconds; <= 0 keeps them until invalidated.
+SECRET_TTL = float(os.environ.get("VAULT_SECRET_TTL", "300"))
+# Minimum age of a cached value before a failed comparison re-reads the keystore (rotation).
+ROTATION_RECHECK_INTERVAL = float(os.environ.get("VAULT_SECRET_ROTATION_RECHECK", "30"))
+# Secrets the server needs on every request or connection, fetched in one keystore call at startup.
+PRELOAD_KEYS = ("VAULT_DB_USER", "VAULT_DB_PASS", "VAULT_DB_NAME", "VAULT_API_KEY")
+
+# One shell for N keys: emits KEY\0VALUE\0 for each key the keystore resolves.
+_BATCH_GET_SCRIPT = 'for k in "$@"; do if v=$("$0" get "$k"); then printf "%s\\0%s\\0" "$k" "$v"; fi; done'
+
+# RAM-only cache: key -> (value, fetched_at monotonic). Never persisted.
+# A value of None records a recent keystore miss so it is not retried on every call.
+_cache = {}
+_MISSING = object()
+_cache_lock = threading.Lock()
+_fetch_lock = threading.Lock()
+
+def _fetch_secret(key):
+    """Runs the keystore for a single key (uncached)."""
     try:
         # Run from the keystore directory to ensure .keystore.env is found
         result = subprocess.run(
@@ -17,10 +37,100 @@ def get_secret(key):
             cwd=KEYSTORE_DIR
         )
         return result.stdout.strip()
-    except subprocess.CalledProcessError as e:
-        print(f"Error fetching secret '{key}': {e.stderr}")
+    except (subprocess.CalledProcessError, OSError) as e:
+        print(f"Error fetching secret '{key}': {getattr(e, 'stderr', e)}")
         return None
 
+def _fetch_secrets(keys):
+    """Resolves several keys with a single forked shell. Missing keys are omitted."""
+    try:
+        result = subprocess.run(
+            ["/bin/sh", "-c", _BATCH_GET_SCRIPT, KEYSTORE_SH, *keys],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=KEYSTORE_DIR
+        )
+    except (subprocess.CalledProcessError, OSError) as e:
+        print(f"Error preloading secrets: {getattr(e, 'stderr', e)}")
+        return {}
+    fields = result.stdout.split("\0")
+    return {fields[i]: fields[i + 1].strip() for i in range(0, len(fields) - 1, 2)}
+
+def _lookup(key):
+    """Returns the cached value (None for a remembered miss), or _MISSING if absent/expired."""
+    with _cache_lock:
+        entry = _cache.get(key)
+    if entry is None:
+        return _MISSING
+    value, fetched_at = entry
+    max_age = SECRET_TTL if value is not None else ROTATION_RECHECK_INTERVAL
+    if max_age > 0 and time.monotonic() - fetched_at >= max_age:
+        return _MISSING
+    return value
+
+def _store(key, value):
+    with _cache_lock:
+        _cache[key] = (value, time.monotonic())
+
+def get_secret(key, refresh=False):
+    """Securely fetches a secret from the crystal-pioneer keystore (cached in-process)."""
+    if not refresh:
+        value = _lookup(key)
+        if value is not _MISSING:
+            return value
+    with _fetch_lock:
+        # Another thread may have refreshed it while we waited.
+        if not refresh:
+            value = _lookup(key)
+            if value is not _MISSING:
+                return value
+        value = _fetch_secret(key)
+        _store(key, value)
+        return value
+
+def preload_secrets(keys=PRELOAD_KEYS):
+    """Warms the cache with one batched keystore call. Returns the keys that resolved."""
+    with _fetch_lock:
+        values = _fetch_secrets(keys)
+        for key, value in values.items():
+            _store(key, value)
+    missing = [k for k in keys if k not in values]
+    if missing:
+        print(f"Secrets not preloaded (will be fetched on demand): {', '.join(missing)}")
+    return list(values)
+
+def invalidate_secrets(*keys):
+    """Drops cached values so the next read hits the keystore (all keys if none given)."""
+    with _cache_lock:
+        if not keys:
+            _cache.clear()
+        for key in keys:
+            _cache.pop(key, None)
+
+def verify_secret(key, candidate, fallback=None):
+    """
+    Constant-time comparison of `candidate` against the cached secret.
+    A mismatch against a value older than ROTATION_RECHECK_INTERVAL re-reads the
+    keystore once, so a rotated key is picked up without restarting the server.
+    """
+    if candidate is None:
+        return False
+    candidate = candidate.encode()
+
+    def matches(expected):
+        if not expected:
+            expected = fallback
+        return expected is not None and hmac.compare_digest(expected.encode(), candidate)
+
+    if matches(get_secret(key)):
+        return True
+    with _cache_lock:
+        entry = _cache.get(key)
+    if entry is not None and time.monotonic() - entry[1] < ROTATION_RECHECK_INTERVAL:
+        return False
+    return matches(get_secret(key, refresh=True))
+
 if __name__ == "__main__":
     # Smoke test for vault secret retrieval
     user = get_secret("VAULT_DB_USER")